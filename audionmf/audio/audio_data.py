@@ -1,17 +1,20 @@
-from audionmf.fileformats.audio_format_wav import AudioFormatWAV
-from audionmf.nmfcompression.nmfcompressor_mdct import NMFCompressorMDCT
-from audionmf.nmfcompression.nmfcompressor_raw import NMFCompressorRaw
-from audionmf.nmfcompression.nmfcompressor_stft import NMFCompressorSTFT
+import numpy
 
-audio_formats = {
-    'wav': AudioFormatWAV
-}
+from audionmf.audio.channel import Channel
+from audionmf.util.file_util import MappedFile
+from audionmf.util.registry_util import LazyRegistry
+from audionmf.util.stats_util import NO_STATS
 
-compression_schemes = {
-    'anmfs': NMFCompressorSTFT,
-    'anmfr': NMFCompressorRaw,
-    'anmfm': NMFCompressorMDCT
-}
+# the formats and codecs are imported once they're used, so only the selected ones load their dependencies
+audio_formats = LazyRegistry({
+    'wav': 'audionmf.fileformats.audio_format_wav:AudioFormatWAV'
+})
+
+compression_schemes = LazyRegistry({
+    'anmfs': 'audionmf.nmfcompression.nmfcompressor_stft:NMFCompressorSTFT',
+    'anmfr': 'audionmf.nmfcompression.nmfcompressor_raw:NMFCompressorRaw',
+    'anmfm': 'audionmf.nmfcompression.nmfcompressor_mdct:NMFCompressorMDCT'
+})
 
 
 def get_audio_format(string):
@@ -33,18 +36,32 @@ def get_compression_format(string):
 class AudioData:
     def __init__(self):
         self.sample_rate = 0
+
+        # samples of all the channels interleaved, one column per channel
+        self.samples = numpy.zeros((0, 0), dtype=numpy.int16)
         self.channels = list()
 
-    def add_channel(self, channel):
-        self.channels.append(channel)
+    def allocate(self, sample_count, channel_count):
+        """ Allocates the samples of all the channels at once, every channel becomes a view of its column. """
+        self.samples = numpy.zeros((sample_count, channel_count), dtype=numpy.int16)
+        self.channels = [Channel(self.samples[:, i]) for i in range(channel_count)]
+
+    def fill(self, blocks, channels):
+        """ Copies a stream of sample blocks (one column per channel) into the given channels in place,
+        dropping whatever doesn't fit. """
+        position = 0
+        for block in blocks:
+            block = block[:len(self.samples) - position]
+            self.samples[position:position + len(block), channels] = block
+            position += len(block)
 
     def write_audio_file(self, output_fd, audio_format_str):
         audio_format = get_audio_format(audio_format_str)
         audio_format.write_file(self, output_fd)
 
-    def write_compressed_file(self, output_fd, compressor_str):
+    def write_compressed_file(self, output_fd, compressor_str, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None):
         compressor = get_compression_format(compressor_str)
-        compressor.compress(self, output_fd)
+        compressor.compress(self, output_fd, jobs, stats, bitrate, blas_threads)
 
     @staticmethod
     def from_audio_file(input_fd, filetype):
@@ -53,9 +70,38 @@ class AudioData:
         audio_format.fill_audio_data(input_fd, data)
         return data
 
+    @staticmethod
+    def compress_audio_stream(input_fd, filetype, output_fd, compressor_str, jobs=1, stats=NO_STATS, bitrate=None,
+                              blas_threads=None):
+        """ Compresses an audio file chunk by chunk without loading all of it into memory. """
+        audio_format = get_audio_format(filetype)
+        compressor = get_compression_format(compressor_str)
+        audio_stream = audio_format.open_stream(input_fd)
+        compressor.compress_stream(audio_stream, output_fd, jobs, stats, bitrate, blas_threads)
+
     @staticmethod
     def from_compressed_file(input_fd, filetype):
         decompressor = get_compression_format(filetype)
         data = AudioData()
         decompressor.decompress(input_fd, data)
         return data
+
+    @staticmethod
+    def from_mapped_file(path, filetype):
+        """ Decompresses a file by memory-mapping it, so the matrices are read straight from the page cache. """
+        with MappedFile.open(path) as input_fd:
+            return AudioData.from_compressed_file(input_fd, filetype)
+
+    @staticmethod
+    def stream_compressed_file(input_fd, filetype, start=0, end=None):
+        """ Returns an AudioStream decompressing the file chunk by chunk as its blocks are read.
+
+        Only decompresses the audio between start and end, given in seconds.
+        """
+        decompressor = get_compression_format(filetype)
+        return decompressor.decompress_stream(input_fd, start, end)
+
+    @staticmethod
+    def write_audio_stream(audio_stream, output_fd, audio_format_str):
+        audio_format = get_audio_format(audio_format_str)
+        audio_format.write_stream(audio_stream, output_fd)
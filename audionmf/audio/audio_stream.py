@@ -0,0 +1,27 @@
+import numpy
+
+
+class AudioStream:
+    """ Audio given as a sequence of blocks of 16-bit samples, one column per channel. """
+
+    def __init__(self, sample_rate, channel_count, sample_count, blocks):
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.sample_count = sample_count
+        self.blocks = blocks
+
+
+def interleave_channels(channels):
+    """ Joins streams of the samples of every channel into blocks with one column per channel. """
+    buffers = [numpy.zeros(0, dtype=numpy.int16)] * len(channels)
+    while True:
+        for i, channel in enumerate(channels):
+            while not buffers[i].size:
+                block = next(channel, None)
+                if block is None:
+                    return
+                buffers[i] = block
+
+        size = min(len(buffer) for buffer in buffers)
+        yield numpy.column_stack([buffer[:size] for buffer in buffers])
+        buffers = [buffer[size:] for buffer in buffers]
@@ -1,9 +1,6 @@
-import numpy
-
-
 class Channel:
-    def __init__(self):
-        self.samples = numpy.array([], dtype=numpy.int16)
+    """ Samples of a single channel, a view of its column in AudioData.samples. """
+
+    def __init__(self, samples):
+        self.samples = samples
 
-    def add_sample_array(self, data):
-        self.samples = numpy.append(self.samples, data)
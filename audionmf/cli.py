@@ -1,9 +1,14 @@
+import json
 import os
 import time
 
 import click as click
+import numpy
 
-from audionmf.audio.audio_data import AudioData
+from audionmf.audio.audio_data import AudioData, audio_formats, compression_schemes
+from audionmf.util.batch_util import Batch, batch_files
+from audionmf.util.file_util import MappedFile
+from audionmf.util.stats_util import Stats, NO_STATS
 
 
 def get_filename_ext(path):
@@ -16,13 +21,34 @@ def get_output_handle(input_filename, filetype):
     return open(target_name, 'wb')
 
 
-def compress(input_file, output_file, audio_filetype, compression_filetype):
-    audio = AudioData.from_audio_file(input_file, audio_filetype)
+def compress(input_file, output_file, audio_filetype, compression_filetype, jobs=1, stats=NO_STATS, bitrate=None,
+             blas_threads=None):
+    with stats.stage('read'):
+        audio = AudioData.from_audio_file(input_file, audio_filetype)
 
     if audio is None:
         print('invalid file format: {}'.format(audio_filetype))
     else:
-        audio.write_compressed_file(output_file, compression_filetype)
+        audio.write_compressed_file(output_file, compression_filetype, jobs, stats, bitrate, blas_threads)
+
+
+def compress_stream(input_file, output_file, audio_filetype, compression_filetype, jobs=1, stats=NO_STATS,
+                    bitrate=None, blas_threads=None):
+    AudioData.compress_audio_stream(input_file, audio_filetype, output_file, compression_filetype, jobs, stats,
+                                    bitrate, blas_threads)
+
+
+def print_stats(stats, stats_format):
+    # prints the stats to stderr, so they don't mix with the progress messages
+    if stats_format == 'json':
+        click.echo(json.dumps(stats.as_dict(), indent=2), err=True)
+        return
+
+    summary = stats.as_dict()
+    for stage, seconds in sorted(summary['stages'].items(), key=lambda item: -item[1]):
+        click.echo('{:<14} {:>10.3f} s'.format(stage, seconds), err=True)
+    click.echo('{} chunks, {} bytes, {} NMF iterations'.format(summary['chunk_count'], summary['bytes'],
+                                                              summary['nmf_iterations']), err=True)
 
 
 def decompress(input_file, output_file, compression_filetype, audio_filetype):
@@ -30,6 +56,11 @@ def decompress(input_file, output_file, compression_filetype, audio_filetype):
     audio.write_audio_file(output_file, audio_filetype)
 
 
+def decompress_stream(input_file, output_file, compression_filetype, audio_filetype, start=0, end=None):
+    audio_stream = AudioData.stream_compressed_file(input_file, compression_filetype, start, end)
+    AudioData.write_audio_stream(audio_stream, output_file, audio_filetype)
+
+
 @click.group()
 def cli():
     pass
@@ -39,33 +70,115 @@ def cli():
 @click.argument('input_file', type=click.File('rb'))
 @click.argument('output_file', type=click.File('wb'), required=False)
 @click.option('-c', '--compression', type=click.Choice(['anmfr', 'anmfs', 'anmfm']), default='anmfs')
-def compress_command(input_file, output_file, compression):
+@click.option('-j', '--jobs', type=click.IntRange(min=0), default=1,
+              help='Number of processes factorizing chunks in parallel, 0 uses all CPUs.')
+@click.option('--blas-threads', type=click.IntRange(min=1), default=None,
+              help='Threads of the matrix products in every process, by default decided by the BLAS library.')
+@click.option('-s', '--seed', type=int, default=None, help='Random seed, makes the output reproducible.')
+@click.option('-b', '--bitrate', type=click.FloatRange(min=0, min_open=True), default=None,
+              help='Target bitrate in kbit/s, the NMF rank of every chunk is picked to meet it.')
+@click.option('--stream', is_flag=True, help='Read and compress the input chunk by chunk in constant memory.')
+@click.option('--stats', 'stats_format', type=click.Choice(['text', 'json']), default=None,
+              help='Print the time spent in every stage and the metrics of every chunk (json) to stderr.')
+def compress_command(input_file, output_file, compression, jobs, blas_threads, seed, bitrate, stream, stats_format):
     filename = input_file.name
     filetype = get_filename_ext(filename)[1].lower()[1:]
     if output_file is None:
         output_file = get_output_handle(filename, compression)
 
-    compress(input_file, output_file, filetype, compression)
+    if seed is not None:
+        numpy.random.seed(seed)
+
+    stats = Stats() if stats_format else NO_STATS
+
+    # the total includes the other stages, so it isn't one of them
+    start_time = time.perf_counter()
+    if stream:
+        compress_stream(input_file, output_file, filetype, compression, jobs, stats, bitrate, blas_threads)
+    else:
+        compress(input_file, output_file, filetype, compression, jobs, stats, bitrate, blas_threads)
+    stats.add_time('total', time.perf_counter() - start_time)
 
     input_file.close()
     output_file.close()
 
+    if stats_format:
+        print_stats(stats, stats_format)
+
 
 @cli.command(name='decompress')
 @click.argument('input_file', type=click.File('rb'))
 @click.argument('output_file', type=click.File('wb'), required=False)
-def decompress_command(input_file, output_file):
+@click.option('--stream', is_flag=True, help='Write the output progressively as every chunk is decompressed.')
+@click.option('--start', type=click.FloatRange(min=0), default=None,
+              help='Only decompress the audio from this time (in seconds) on, implies --stream.')
+@click.option('--end', type=click.FloatRange(min=0), default=None,
+              help='Only decompress the audio up to this time (in seconds), implies --stream.')
+@click.option('--mmap', 'use_mmap', is_flag=True, help='Memory-map the input instead of reading it.')
+def decompress_command(input_file, output_file, stream, start, end, use_mmap):
     if output_file is None:
         output_file = get_output_handle(input_file.name, 'wav')
 
     filetype = get_filename_ext(input_file.name)[1].lower()[1:]
 
-    decompress(input_file, output_file, filetype, 'wav')
+    input_fd = MappedFile(input_file) if use_mmap else input_file
+
+    if stream or start is not None or end is not None:
+        decompress_stream(input_fd, output_file, filetype, 'wav', start or 0, end)
+    else:
+        decompress(input_fd, output_file, filetype, 'wav')
 
+    input_fd.close()
     input_file.close()
     output_file.close()
 
 
+@cli.group(name='batch')
+def batch_group():
+    """ Compresses or decompresses many files with one pool of worker processes.
+
+    SOURCE is a directory or a manifest file listing the paths of the files, one per line.
+    """
+
+
+@batch_group.command(name='compress')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False), default=None,
+              help='Directory of the compressed files, next to the inputs by default.')
+@click.option('-c', '--compression', type=click.Choice(['anmfr', 'anmfs', 'anmfm']), default='anmfs')
+@click.option('-j', '--jobs', type=click.IntRange(min=0), default=0,
+              help='Number of worker processes factorizing the chunks of all the files, 0 uses all CPUs.')
+@click.option('--blas-threads', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Threads of the matrix products in every process.')
+@click.option('-b', '--bitrate', type=click.FloatRange(min=0, min_open=True), default=None,
+              help='Target bitrate in kbit/s, the NMF rank of every chunk is picked to meet it.')
+@click.option('-s', '--seed', type=int, default=None,
+              help='Random seed, makes the output reproducible, every file gets a seed of its own derived from it.')
+@click.option('-m', '--memory', type=click.FloatRange(min=0, min_open=True), default=None,
+              help='Memory budget in MB of the chunks being factorized at the same time.')
+@click.option('--resume', is_flag=True, help='Skip the files compressed before, e.g. by an interrupted run.')
+def batch_compress_command(source, output_dir, compression, jobs, blas_threads, bitrate, seed, memory, resume):
+    memory = None if memory is None else int(memory * 2 ** 20)
+    batch = Batch(output_dir, jobs, blas_threads, memory, resume)
+    batch.compress(batch_files(source, audio_formats), compression, bitrate, seed)
+    if batch.failed:
+        exit(1)
+
+
+@batch_group.command(name='decompress')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False), default=None,
+              help='Directory of the decompressed files, next to the inputs by default.')
+@click.option('-j', '--jobs', type=click.IntRange(min=0), default=0,
+              help='Number of worker processes decompressing files, 0 uses all CPUs.')
+@click.option('--resume', is_flag=True, help='Skip the files decompressed before, e.g. by an interrupted run.')
+def batch_decompress_command(source, output_dir, jobs, resume):
+    batch = Batch(output_dir, jobs, 1, resume=resume)
+    batch.decompress(batch_files(source, compression_schemes))
+    if batch.failed:
+        exit(1)
+
+
 @cli.command(name='debug', hidden=True)
 def debug_command():
     debug_path = 'debug'
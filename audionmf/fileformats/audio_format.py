@@ -7,3 +7,12 @@ class AudioFormat(ABC):
 
     def write_file(self, audio_data, output_fd):
         raise NotImplementedError
+
+    def open_stream(self, input_fd):
+        """ Returns an object with sample_rate, channel_count, sample_count and read_channel(channel, block_size),
+        a generator of the channel's samples in blocks, which can be called repeatedly. """
+        raise NotImplementedError
+
+    def write_stream(self, audio_stream, output_fd):
+        """ Writes an AudioStream block by block as soon as the blocks are available. """
+        raise NotImplementedError
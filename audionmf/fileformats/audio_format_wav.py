@@ -1,7 +1,8 @@
+import struct
+
 import numpy
 from scipy.io import wavfile
 
-from audionmf.audio.channel import Channel
 from audionmf.fileformats.audio_format import AudioFormat
 
 
@@ -11,16 +12,108 @@ class AudioFormatWAV(AudioFormat):
         if raw_data.dtype != 'int16':
             raise Exception('WAV format must be 16-bit integers')
 
-        # replace all 0s with 1s to prevent division by zero during processing
-        raw_data_c = numpy.copy(raw_data)
-        raw_data_c[raw_data_c == 0] = 1
+        # mono files are read as a single column
+        if raw_data.ndim == 1:
+            raw_data = raw_data[:, numpy.newaxis]
 
         audio_data.sample_rate = rate
-        for i in range(numpy.size(raw_data_c, 1)):
-            c = Channel()
-            c.add_sample_array(raw_data_c[:, i])
-            audio_data.add_channel(c)
+        audio_data.allocate(*raw_data.shape)
+        audio_data.samples[:] = raw_data
+
+        # replace all 0s with 1s to prevent division by zero during processing
+        audio_data.samples[audio_data.samples == 0] = 1
 
     def write_file(self, audio_data, output_fd):
-        all_samples = numpy.column_stack([samples for samples in (channel.samples for channel in audio_data.channels)])
-        wavfile.write(output_fd, audio_data.sample_rate, all_samples)
+        wavfile.write(output_fd, audio_data.sample_rate, audio_data.samples)
+
+    def open_stream(self, wav_file_fd):
+        return WAVStream(wav_file_fd)
+
+    def write_stream(self, audio_stream, output_fd):
+        # with the length known upfront, the header is written once and never seeked back to, so the output can be
+        # a pipe
+        output_fd.write(wav_header(audio_stream.sample_rate, audio_stream.channel_count, audio_stream.sample_count))
+
+        for block in audio_stream.blocks:
+            output_fd.write(numpy.ascontiguousarray(block, dtype='<i2'))
+        output_fd.flush()
+
+
+def wav_header(sample_rate, channel_count, sample_count):
+    """ Returns the RIFF header of a 16-bit PCM WAV file, followed by its data. """
+    block_align = 2 * channel_count
+    data_size = block_align * sample_count
+    return b''.join([
+        b'RIFF', struct.pack('<I', 36 + data_size), b'WAVE',
+        b'fmt ', struct.pack('<IHHIIHH', 16, 1, channel_count, sample_rate, sample_rate * block_align, block_align, 16),
+        b'data', struct.pack('<I', data_size)
+    ])
+
+
+class WAVStream:
+    """ Reads the samples of a 16-bit WAV file in blocks, one channel at a time. """
+
+    # default amount of samples per block
+    BLOCK_SIZE = 2 ** 16
+
+    # PCM and WAVE_FORMAT_EXTENSIBLE format tags, the latter holding PCM samples if its subformat starts with 1
+    WAVE_FORMAT_PCM = 0x0001
+    WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+    def __init__(self, wav_file_fd):
+        self.f = wav_file_fd
+        self.channel_count, self.sample_rate, self.data_offset, data_size = self.read_header(wav_file_fd)
+        self.sample_count = data_size // (2 * self.channel_count)
+
+    def read_header(self, f):
+        # returns the channel count, sample rate, offset and size of the samples, skipping the chunks in between
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise Exception('Invalid WAV file.')
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise Exception('Invalid WAV file, no data chunk found.')
+            chunk_id, size = struct.unpack('<4sI', header)
+
+            if chunk_id == b'data':
+                if fmt is None:
+                    raise Exception('Invalid WAV file, no fmt chunk before the data.')
+                return fmt[0], fmt[1], f.tell(), size
+
+            data = f.read(size + size % 2)
+            if chunk_id == b'fmt ':
+                fmt = self.read_format(data)
+
+    def read_format(self, data):
+        # returns the channel count and sample rate of a 16-bit PCM fmt chunk
+        tag, channel_count, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', data)
+        if tag == self.WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+            tag = struct.unpack_from('<H', data, 24)[0]
+        if tag != self.WAVE_FORMAT_PCM or bits != 16:
+            raise Exception('WAV format must be 16-bit integers')
+        return channel_count, sample_rate
+
+    def read_channel(self, channel, block_size=BLOCK_SIZE):
+        """ Yields the samples of the channel in blocks, reading the file from the start.
+
+        Every generator keeps its own position, so several channels can be read at the same time.
+        """
+        frame_size = 2 * self.channel_count
+        position = 0
+        while position < self.sample_count:
+            self.f.seek(self.data_offset + position * frame_size)
+            data = self.f.read(min(block_size, self.sample_count - position) * frame_size)
+            data = data[:len(data) - len(data) % frame_size]
+            if not data:
+                break
+            frames = numpy.frombuffer(data, dtype='<i2').reshape(-1, self.channel_count)
+            position += len(frames)
+            samples = frames[:, channel].astype(numpy.int16)
+
+            # replace all 0s with 1s to prevent division by zero during processing
+            samples[samples == 0] = 1
+
+            yield samples
@@ -0,0 +1,39 @@
+from collections import deque
+
+
+class RateController:
+    """ Picks the NMF rank of every chunk so the compressed file meets a target bitrate, without trial encodes.
+
+    The size of every chunk is estimated by the bitrate model of the compressor, chunk_bits(rows, cols), which returns
+    the bits that don't depend on the rank and the bits added by every unit of rank. The bits a chunk doesn't use
+    (or overspends, as the rank is at least 1) are carried over to the next ones, so the file as a whole meets the
+    target. Used as the rank of nmf_matrices, it's called with every matrix in order.
+
+    The actual size of every chunk should be reported by written() once it's written, so the following chunks make
+    up for the errors of the estimates.
+    """
+
+    def __init__(self, bitrate, seconds, row_count, chunk_bits, overhead_bits=0):
+        # bitrate in kbit/s, row_count of the matrices of all the channels together, overhead_bits of the whole file
+        # outside of the chunks (e.g. the header)
+        self.bits_per_row = bitrate * 1000 * seconds / row_count if row_count else 0
+        self.chunk_bits = chunk_bits
+        self.reservoir = -overhead_bits
+        self.estimates = deque()
+
+    def __call__(self, matrix):
+        rows, cols = matrix.shape
+        fixed_bits, rank_bits = self.chunk_bits(rows, cols)
+        budget = self.reservoir + rows * self.bits_per_row
+
+        # no point in a rank above the smaller dimension of the matrix
+        rank = int(min(max((budget - fixed_bits) // rank_bits, 1), min(rows, cols)))
+
+        estimate = fixed_bits + rank * rank_bits
+        self.reservoir = budget - estimate
+        self.estimates.append(estimate)
+        return rank
+
+    def written(self, bits):
+        """ Replaces the estimated size of the oldest chunk not reported yet by its actual size. """
+        self.reservoir += self.estimates.popleft() - bits
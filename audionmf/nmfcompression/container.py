@@ -0,0 +1,122 @@
+import struct
+
+import numpy
+
+# every compressed file starts with the magic, the scheme letter and the version of the container
+MAGIC = b'ANMFC'
+VERSION = 2
+
+# an index entry for every chunk of every channel, the frames are rows of the chunk matrices (samples for RAW)
+INDEX_DTYPE = numpy.dtype([('offset', '<u8'), ('first_frame', '<u8'), ('frame_count', '<u4')])
+
+
+class ContainerWriter:
+    """ Writes the header of a compressed file and fills in its chunk index once all the chunks are written.
+
+    Layout of the header:
+        magic, scheme letter, version <H
+        channel count, sample rate, sample count, chunks per channel <HIQI
+        length of the scheme's header extension <I, the extension
+        chunk index, one INDEX_DTYPE entry per chunk, channel by channel
+    The offsets are relative to the start of the header. As the index is written last, the output must be seekable.
+    """
+
+    def __init__(self, f, scheme, channel_count, sample_rate, sample_count, chunk_count, extension=b''):
+        self.f = f
+        self.start = f.tell()
+        self.index = numpy.zeros((channel_count, chunk_count), dtype=INDEX_DTYPE)
+        self.chunks_written = [0] * channel_count
+        self.frames_written = [0] * channel_count
+
+        f.write(MAGIC)
+        f.write(scheme)
+        f.write(struct.pack('<H', VERSION))
+        f.write(struct.pack('<HIQI', channel_count, sample_rate, sample_count, chunk_count))
+        f.write(struct.pack('<I', len(extension)))
+        f.write(extension)
+
+        # reserve space for the index
+        self.index_position = f.tell()
+        f.write(self.index.tobytes())
+
+    def add_chunk(self, channel, frame_count):
+        """ Adds the chunk about to be written at the current position of the file to the index. """
+        chunk = self.chunks_written[channel]
+        entry = self.index[channel, chunk]
+        entry['offset'] = self.f.tell() - self.start
+        entry['first_frame'] = self.frames_written[channel]
+        entry['frame_count'] = frame_count
+        self.chunks_written[channel] += 1
+        self.frames_written[channel] += frame_count
+
+    def close(self):
+        """ Writes the index into the space reserved for it. """
+        end = self.f.tell()
+        self.f.seek(self.index_position)
+        self.f.write(self.index.tobytes())
+        self.f.seek(end)
+
+
+def sample_range(sample_rate, sample_count, start=0, end=None):
+    """ Turns a time range in seconds into a range of samples, limited to the length of the audio. """
+    start = min(max(int(round(start * sample_rate)), 0), sample_count)
+    if end is None:
+        return start, sample_count
+    end = min(max(int(round(end * sample_rate)), start), sample_count)
+    return start, end
+
+
+class ContainerReader:
+    """ Reads the header of a compressed file written by ContainerWriter, leaving the file at the first chunk.
+
+    Files of version 1 have no container, only the magic ANMF and the scheme letter, their version is set to 1 and
+    the file is left right after the magic, to be read by the decoders in legacy.
+    """
+
+    def __init__(self, f, scheme):
+        self.f = f
+        self.start = f.tell()
+
+        data = f.read(5)
+        if data == b'ANMF' + scheme:
+            self.version = 1
+            return
+        if data != MAGIC or f.read(1) != scheme:
+            raise Exception('Invalid file format. Expected .anmf{}.'.format(scheme.decode().lower()))
+        version = struct.unpack('<H', f.read(2))[0]
+        if version != VERSION:
+            raise Exception('Unsupported file format version {}.'.format(version))
+        self.version = version
+
+        self.channel_count, self.sample_rate, self.sample_count, self.chunk_count = \
+            struct.unpack('<HIQI', f.read(18))
+        extension_length = struct.unpack('<I', f.read(4))[0]
+        self.extension = f.read(extension_length)
+
+        self.index = numpy.empty((self.channel_count, self.chunk_count), dtype=INDEX_DTYPE)
+        buffer = self.index.reshape(-1).view(numpy.uint8)
+        if f.readinto(buffer) != buffer.size:
+            raise Exception('Unexpected end of file while reading the chunk index.')
+
+    def sample_range(self, start=0, end=None):
+        return sample_range(self.sample_rate, self.sample_count, start, end)
+
+    def read_frames(self, channel, first_frame, stop_frame, read_chunk):
+        """ Yields the frames [first_frame, stop_frame) of a channel, reading only the chunks containing them.
+
+        Every chunk is read by read_chunk(f) after seeking to it, which returns its frames as rows.
+        """
+        if first_frame >= stop_frame:
+            return
+
+        entries = self.index[channel]
+        chunk = max(numpy.searchsorted(entries['first_frame'], first_frame, side='right') - 1, 0)
+
+        for entry in entries[chunk:]:
+            first = int(entry['first_frame'])
+            if first >= stop_frame:
+                break
+
+            self.f.seek(self.start + int(entry['offset']))
+            frames = read_chunk(self.f)
+            yield frames[max(first_frame - first, 0):stop_frame - first]
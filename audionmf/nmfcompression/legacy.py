@@ -0,0 +1,98 @@
+import struct
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData
+from audionmf.audio.audio_stream import AudioStream
+from audionmf.nmfcompression.container import sample_range
+from audionmf.transforms.huffman import huffman_coder
+from audionmf.transforms.mdct import imdct
+from audionmf.transforms.quantization import scale_array, mu_law_expand_array, uniform_quantizer
+from audionmf.transforms.stft import istft
+from audionmf.util.matrix_util import deserialize_matrix
+from audionmf.util.nmf_util import nmf_matrix_original
+
+# version 1 files have no container, only the magic ANMF + scheme letter, the channel count and sample rate <HI,
+# then the channels one after another, they're decoded with the settings they were always written with
+STFT_FRAME_SIZE = 1152
+STFT_MU_LAW_W = 10 ** 4
+STFT_MU_LAW_H = 10 ** 5
+
+
+def decompress_v1(f, audio_data, read_channel):
+    """ Decompresses a version 1 file, left after its magic, reading every channel with read_channel(f, sample_rate),
+    which returns its samples. """
+    channel_count, sample_rate = struct.unpack('<HI', f.read(6))
+    channels = [read_channel(f, sample_rate) for _ in range(channel_count)]
+
+    audio_data.sample_rate = sample_rate
+    audio_data.allocate(min((len(channel) for channel in channels), default=0), channel_count)
+    for i, channel in enumerate(channels):
+        audio_data.channels[i].samples[:] = channel[:len(audio_data.samples)]
+
+
+def stream_v1(f, read_channel, start=0, end=None):
+    """ Returns the audio of a version 1 file between start and end (in seconds) as an AudioStream.
+
+    The files have no chunk index, so all of the audio is decompressed first.
+    """
+    audio_data = AudioData()
+    decompress_v1(f, audio_data, read_channel)
+    start, end = sample_range(audio_data.sample_rate, len(audio_data.samples), start, end)
+    blocks = iter([audio_data.samples[start:end]])
+    return AudioStream(audio_data.sample_rate, len(audio_data.channels), end - start, blocks)
+
+
+def read_stft_channel(f, sample_rate):
+    # the phases of the whole channel, then the chunks of its magnitudes
+    chunk_count = struct.unpack('<I', f.read(4))[0]
+
+    Prows, Plen = struct.unpack('<II', f.read(8))
+    Pq = huffman_coder('stftp').decode_int_matrix(f.read(Plen), Prows)
+    phases = uniform_quantizer(-numpy.pi, numpy.pi, 2 ** 3).dequantize_array(Pq)
+
+    chunks = list()
+    for _ in range(chunk_count):
+        min_val = struct.unpack('<d', f.read(8))[0]
+        matrix_min, matrix_max = struct.unpack('<dd', f.read(16))
+        Wscs = deserialize_matrix(f, 'I')
+        Hrows, Hlen = struct.unpack('<II', f.read(8))
+        Hscq = huffman_coder('stft32').decode_int_matrix(f.read(Hlen), Hrows)
+
+        Ws = mu_law_expand_array(scale_array(Wscs, 0, 2 ** 32, 0, 1), STFT_MU_LAW_W)
+        Hs = mu_law_expand_array(uniform_quantizer(0, 1, 2 ** 5).dequantize_array(Hscq), STFT_MU_LAW_H)
+        W = scale_array(Ws, 0, 1, matrix_min, matrix_max)
+        H = scale_array(Hs, 0, 1, matrix_min, matrix_max)
+        chunks.append(nmf_matrix_original(W, H, min_val))
+
+    magnitudes = numpy.concatenate(chunks)
+    stft_matrix = magnitudes * numpy.cos(phases) + 1j * magnitudes * numpy.sin(phases)
+    return istft(stft_matrix, sample_rate, STFT_FRAME_SIZE).astype(numpy.int16)
+
+
+def read_mdct_channel(f, sample_rate):
+    # the padding of the signal and the chunks of its MDCT
+    padding, chunk_count = struct.unpack('<II', f.read(8))
+    chunks = [nmf_matrix_original(*read_nmf_factors(f)) for _ in range(chunk_count)]
+    return imdct(numpy.concatenate(chunks), padding).astype(numpy.int16)
+
+
+def read_raw_channel(f, sample_rate):
+    # the padding of the samples and the chunks of the samples as matrices
+    padding, chunk_count = struct.unpack('<II', f.read(8))
+    arrays = list()
+    for _ in range(chunk_count):
+        # the minimum value was subtracted in double precision
+        W, H, min_val = read_nmf_factors(f)
+        arrays.append((numpy.matmul(W, H).astype(numpy.float64) - min_val).ravel())
+
+    samples = numpy.concatenate(arrays)
+    return samples[:len(samples) - padding].astype(numpy.int16)
+
+
+def read_nmf_factors(f):
+    # the minimum value and both NMF matrices as 32-bit floats
+    min_val = struct.unpack('<d', f.read(8))[0]
+    W = deserialize_matrix(f)
+    H = deserialize_matrix(f)
+    return W, H, min_val
@@ -0,0 +1,63 @@
+from abc import ABC
+
+import click
+
+from audionmf.nmfcompression.bitrate import RateController
+from audionmf.util.stats_util import NO_STATS
+
+
+class NMFCompressor(ABC):
+    """ Base of the compression schemes, holding what the schemes share around the factorized chunks. """
+
+    def compress(self, audio_data, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None, seed=None):
+        raise NotImplementedError
+
+    def compress_stream(self, audio_stream, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None, seed=None):
+        """ Compresses an audio stream (see AudioFormat.open_stream) chunk by chunk in constant memory. """
+        raise NotImplementedError
+
+    def decompress(self, f, audio_data):
+        raise NotImplementedError
+
+    def decompress_stream(self, f, start=0, end=None):
+        """ Returns the decompressed audio between start and end (in seconds) as an AudioStream. """
+        raise NotImplementedError
+
+    def chunk_bits(self, rows, cols):
+        """ Bitrate model of a chunk of rows x cols, see RateController. """
+        raise NotImplementedError
+
+    def write_chunk(self, f, *args):
+        # writes a chunk given the arguments of write_nmf_chunk followed by W, H, min_val and the stats
+        raise NotImplementedError
+
+    def nmf_rank(self, bitrate, seconds, row_count, overhead_bytes, chunk_shape):
+        # the rank of every chunk, NMF_RANK or picked to meet the target bitrate (kbit/s) if there is one,
+        # row_count of all the channels, overhead_bytes of the header and the index, chunk_shape of a whole chunk
+        if bitrate is None:
+            return self.NMF_RANK
+
+        # every chunk that isn't silent takes a rank of at least 1, so a lower target is overshot
+        fixed_bits, rank_bits = self.chunk_bits(*chunk_shape)
+        lowest = ((fixed_bits + rank_bits) * row_count / chunk_shape[0] + 8 * overhead_bytes) / seconds / 1000 \
+            if seconds else 0
+        if bitrate < lowest:
+            click.echo('Warning: the target bitrate of {:g} kbit/s is below the lowest one of about {:.0f} kbit/s '
+                       'at a rank of 1, the output is going to be larger.'.format(bitrate, lowest), err=True)
+
+        return RateController(bitrate, seconds, row_count, self.chunk_bits, 8 * overhead_bytes)
+
+    def write_nmf_chunk(self, container, channels, frame_count, result, rank, stats, *args):
+        # writes the factorization result of nmf_matrices for a chunk of the channels coded together, along with args
+        # (see write_chunk), adds it to the index and the stats and reports its size to the rate controller
+        W, H, min_val, nmf_info = result
+        for i in channels:
+            container.add_chunk(i, frame_count)
+
+        position = container.f.tell()
+        self.write_chunk(container.f, *args, W, H, min_val, stats)
+        size = container.f.tell() - position
+
+        stats.add_chunk(channels, frame_count, size, nmf_info)
+        if isinstance(rank, RateController):
+            rank.written(8 * size)
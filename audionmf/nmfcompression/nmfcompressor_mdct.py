@@ -1,14 +1,23 @@
 import struct
+from functools import partial
 
+import click
 import numpy
 
-from audionmf.audio.channel import Channel
-from audionmf.transforms.mdct import mdct, imdct
-from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix, matrix_split
-from audionmf.util.nmf_util import nmf_matrix, nmf_matrix_original
+from audionmf.audio.audio_stream import AudioStream, interleave_channels
+from audionmf.nmfcompression.container import ContainerWriter, ContainerReader
+from audionmf.nmfcompression.legacy import decompress_v1, stream_v1, read_mdct_channel
+from audionmf.nmfcompression.nmfcompressor import NMFCompressor
+from audionmf.nmfcompression.stereo import stereo_modes, stereo_extension, read_stereo_extension, channel_groups, \
+    mid_side, left_right, MidSideStream, joint_chunks, channel_frames, split_channels
+from audionmf.transforms.mdct import mdct, mdct_row_count, mdct_stream, imdct_stream
+from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix, matrix_split, chunk_count, \
+    array_stream_slice
+from audionmf.util.nmf_util import nmf_matrices, random_state, nmf_matrix_original
+from audionmf.util.stats_util import NO_STATS
 
 
-class NMFCompressorMDCT:
+class NMFCompressorMDCT(NMFCompressor):
     # amount of samples per frame, must be even
     # as a result, the amount of MDCT ranges will be equal to FRAME_SIZE // 2
     FRAME_SIZE = 1152
@@ -21,81 +30,207 @@ class NMFCompressorMDCT:
     NMF_MAX_ITER = 3000
     NMF_RANK = 60
 
-    def compress(self, audio_data, f):
-        print('Compressing (MDCT)...')
+    # NMF update rule (see NMF.update_func) and the cost function it minimizes (see NMF.cost_func)
+    NMF_UPDATE = 'euclidean'
+    NMF_COST = 'euclidean'
 
-        f.write(b'ANMFM')
-        f.write(struct.pack('<HI', len(audio_data.channels), audio_data.sample_rate))
+    # stop NMF early once the relative change in cost falls below NMF_TOL,
+    # the cost is only evaluated every NMF_CHECK_INTERVAL iterations
+    NMF_TOL = 1e-4
+    NMF_CHECK_INTERVAL = 10
 
-        for i, channel in enumerate(audio_data.channels):
-            # find the resulting MDCT for the entire signal
-            mdct_matrix, padding = mdct(channel.samples, self.FRAME_SIZE // 2)
+    # adaptive rank of every chunk (see NMFCompressorSTFT), the tolerance is tight enough to only lower the rank of
+    # silent and simple chunks
+    NMF_RANK_TOL = 0.01
 
-            # write padding
-            f.write(struct.pack('<I', padding))
+    # silent chunks, see NMFCompressorSTFT, 68 is about the RMS of the MDCT of samples of amplitude 4
+    SILENCE_THRESHOLD = 68
 
-            # split the matrix into chunks
-            submatrices = matrix_split(mdct_matrix, self.NMF_CHUNK_SIZE)
+    # NMF initialization (see NMF.init_func), with warm start enabled every chunk after the first one
+    # starts from the basis H of the previous chunk of the same channel
+    NMF_INIT = 'random'
+    NMF_WARM_START = False
 
-            # write the chunk count into the file
-            f.write(struct.pack('<I', len(submatrices)))
+    # floating point precision, see NMFCompressorSTFT
+    DTYPE = 'float32'
 
-            # run NMF on the MDCT matrices, getting their weights and coefficients
-            for submatrix in submatrices:
-                # run NMF on the matrix
-                W, H, min_val = nmf_matrix(submatrix, self.NMF_MAX_ITER, self.NMF_RANK)
-
-                # write minimum value to be subtracted later
-                f.write(struct.pack('<d', min_val))
+    # stereo coding, see NMFCompressorSTFT
+    MID_SIDE = False
+    JOINT_STEREO = False
 
-                # write both matrices into the file
-                serialize_matrix(f, W)
-                serialize_matrix(f, H)
+    def compress(self, audio_data, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                 seed=None):
+        click.echo('Compressing (MDCT)...', err=True)
+        random = random_state(seed)
 
-    def decompress(self, f, audio_data):
-        print('Decompressing (MDCT)...')
+        channel_count = len(audio_data.channels)
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        samples = mid_side(audio_data.samples) if mid_side_coded else audio_data.samples
 
-        data = f.read(5)
-        if data != b'ANMFM':
-            raise Exception('Invalid file format. Expected .anmfm.')
-        channel_count, sample_rate = struct.unpack('<HI', f.read(6))
-        audio_data.sample_rate = sample_rate
+        # transform all the channels first, so the chunks of every channel can be factorized together
+        transforms = list()
 
         for i in range(channel_count):
-            channel = Channel()
-
-            # read padding
-            padding = struct.unpack('<I', f.read(4))[0]
-
-            # read chunk count
-            chunk_count = struct.unpack('<I', f.read(4))[0]
-
-            # read and multiply NMF chunks
-            chunks = list()
-
-            for _ in range(chunk_count):
-                # read minimum value
-                min_val = struct.unpack('<d', f.read(8))[0]
-
-                # read both NMF matrices
-                W = deserialize_matrix(f)
-                H = deserialize_matrix(f)
-
-                # get the original matrix
-                mdct_matrix = nmf_matrix_original(W, H, min_val)
-
-                # add it to the chunk list to be re-joined
-                chunks.append(mdct_matrix)
-
-            # re-join the submatrices
-            mdct_matrix = numpy.concatenate(chunks)
-
-            # invert MDCT
-            signal = imdct(mdct_matrix, padding)
-
-            # convert back to 16-bit signed
-            signal = signal.astype(numpy.int16)
+            with stats.stage('mdct'):
+                # find the resulting MDCT for the entire signal
+                mdct_matrix, _ = mdct(samples[:, i], self.FRAME_SIZE // 2, dtype=self.DTYPE)
+
+                # split the matrix into chunks
+                submatrices = matrix_split(mdct_matrix, self.NMF_CHUNK_SIZE)
+
+            transforms.append(submatrices)
+
+        # the padding is implied by the amount of samples
+        sample_count = len(audio_data.samples)
+        chunks = len(transforms[0]) if transforms else 0
+        container = ContainerWriter(f, b'M', channel_count, audio_data.sample_rate, sample_count, chunks,
+                                    stereo_extension(mid_side_coded, joint))
+        rank = self.nmf_rank(bitrate, sample_count / audio_data.sample_rate,
+                              channel_count * mdct_row_count(sample_count, self.FRAME_SIZE // 2)[0],
+                              f.tell() - container.start, (self.NMF_CHUNK_SIZE, self.FRAME_SIZE // 2))
+
+        # stack the chunks of the channels coded together
+        groups = channel_groups(channel_count, joint)
+        matrix_lists = [joint_chunks([transforms[i] for i in group]) for group in groups]
+
+        # run NMF on the MDCT matrices of all channels, getting their weights and coefficients
+        results = nmf_matrices(matrix_lists, self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                               self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                               self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+        results = stats.timed('nmf', results)
+
+        for group, submatrices in zip(groups, matrix_lists):
+            for submatrix in submatrices:
+                # get the NMF of the next matrix and write it
+                self.write_nmf_chunk(container, group, len(submatrix) // len(group), next(results), rank, stats)
+
+        container.close()
+
+    def compress_stream(self, audio_stream, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                        seed=None):
+        """ Compresses an audio stream (see AudioFormat.open_stream) chunk by chunk in constant memory.
+
+        The output must be seekable, as the chunk index is written last. The result is the same as compressing
+        the whole audio at once. Reading the input is timed as part of the mdct stage of the stats.
+        """
+        click.echo('Compressing (MDCT, streaming)...', err=True)
+        random = random_state(seed)
+
+        channel_count = audio_stream.channel_count
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        if mid_side_coded:
+            audio_stream = MidSideStream(audio_stream)
+
+        block_size = self.FRAME_SIZE // 2
+        row_count, _ = mdct_row_count(audio_stream.sample_count, block_size)
+        container = ContainerWriter(f, b'M', channel_count, audio_stream.sample_rate, audio_stream.sample_count,
+                                    chunk_count(row_count, self.NMF_CHUNK_SIZE),
+                                    stereo_extension(mid_side_coded, joint))
+        rank = self.nmf_rank(bitrate, audio_stream.sample_count / audio_stream.sample_rate, channel_count * row_count,
+                              f.tell() - container.start, (self.NMF_CHUNK_SIZE, block_size))
+
+        for group in channel_groups(channel_count, joint):
+            # run NMF on the MDCT chunks as they're read, stacked when coded together,
+            # writing each one as soon as it's done
+            streams = [mdct_stream(audio_stream.read_channel(i), block_size, audio_stream.sample_count,
+                                   self.NMF_CHUNK_SIZE, self.DTYPE) for i in group]
+            submatrices = stats.timed('mdct', (numpy.concatenate(chunks) for chunks in zip(*streams)))
+            results = nmf_matrices([submatrices], self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                                   self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                                   self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+            results = stats.timed('nmf', results)
+            for result in results:
+                self.write_nmf_chunk(container, group, len(result[0]) // len(group), result, rank, stats)
+
+        container.close()
+
+    def chunk_bits(self, rows, cols):
+        # bitrate model of a chunk of rows x cols MDCT coefficients (see RateController), the 24 bytes of headers
+        # don't depend on the rank, every unit of rank adds a 32-bit column of W and a 32-bit row of H
+        return 24 * 8, (rows + cols) * 32
+
+    @staticmethod
+    def write_chunk(f, W, H, min_val, stats=NO_STATS):
+        with stats.stage('write'):
+            # write minimum value to be subtracted later
+            f.write(struct.pack('<d', min_val))
+
+            # write both matrices into the file
+            serialize_matrix(f, W)
+            serialize_matrix(f, H)
 
-            # add samples to channel and finalize
-            channel.add_sample_array(signal)
-            audio_data.add_channel(channel)
+    def decompress(self, f, audio_data):
+        click.echo('Decompressing (MDCT)...', err=True)
+
+        container = ContainerReader(f, b'M')
+        if container.version == 1:
+            return decompress_v1(f, audio_data, read_mdct_channel)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        audio_data.sample_rate = container.sample_rate
+        _, padding = mdct_row_count(container.sample_count, self.FRAME_SIZE // 2)
+
+        audio_data.allocate(container.sample_count, container.channel_count)
+
+        for group in channel_groups(container.channel_count, joint):
+            # read and multiply NMF chunks in the order they're stored in and invert MDCT chunk by chunk
+            chunks = (self.read_chunk(f, len(group)) for _ in range(container.chunk_count))
+            signals = [imdct_stream(stream, padding) for stream in split_channels(chunks, len(group))]
+
+            # write the samples into the channels, converting them back to 16-bit signed
+            audio_data.fill(interleave_channels(signals), group)
+
+        if mid_side_coded:
+            audio_data.samples[:] = left_right(audio_data.samples)
+
+    def decompress_stream(self, f, start=0, end=None):
+        """ Returns the decompressed audio between start and end (in seconds) as an AudioStream.
+
+        Only the chunks covering the range are read, using the chunk index, and the audio is reconstructed chunk by
+        chunk. The channels are read side by side, so the input must be seekable.
+        """
+        click.echo('Decompressing (MDCT, streaming)...', err=True)
+
+        container = ContainerReader(f, b'M')
+        if container.version == 1:
+            return stream_v1(f, read_mdct_channel, start, end)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        start, end = container.sample_range(start, end)
+
+        # every sample is covered by two overlapping blocks
+        block_size = self.FRAME_SIZE // 2
+        first_row = start // block_size
+        stop_row = (end - 1) // block_size + 2 if end > start else first_row
+
+        channels = list()
+        for group in channel_groups(container.channel_count, joint):
+            chunks = container.read_frames(group[0], first_row, stop_row, partial(self.read_chunk,
+                                                                                  channel_count=len(group)))
+            for stream in split_channels(chunks, len(group)):
+                channels.append(self.channel_stream(stream, start - first_row * block_size, end - start))
+
+        blocks = interleave_channels(channels)
+        if mid_side_coded:
+            blocks = map(left_right, blocks)
+
+        return AudioStream(container.sample_rate, container.channel_count, end - start, blocks)
+
+    @staticmethod
+    def channel_stream(chunks, offset, count):
+        # yields count samples of the channel from offset on as soon as they're reconstructed
+        signal = imdct_stream(chunks, 0)
+
+        for samples in array_stream_slice(signal, offset, count):
+            yield samples.astype(numpy.int16)
+
+    @staticmethod
+    def read_chunk(f, channel_count=1):
+        # returns the MDCT rows of the chunk as rows x channels x bins
+        # read minimum value
+        min_val = struct.unpack('<d', f.read(8))[0]
+
+        # read both NMF matrices
+        W = deserialize_matrix(f)
+        H = deserialize_matrix(f)
+
+        # get the original matrix
+        return channel_frames(nmf_matrix_original(W, H, min_val), channel_count)
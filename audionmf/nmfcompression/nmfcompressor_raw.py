@@ -1,14 +1,23 @@
 import struct
+from functools import partial
 
+import click
 import math
 import numpy
 
-from audionmf.audio.channel import Channel
-from audionmf.util.matrix_util import array_pad_split, serialize_matrix, deserialize_matrix
-from audionmf.util.nmf_util import nmf_matrix, nmf_matrix_original
+from audionmf.audio.audio_stream import AudioStream, interleave_channels
+from audionmf.nmfcompression.container import ContainerWriter, ContainerReader
+from audionmf.nmfcompression.legacy import decompress_v1, stream_v1, read_raw_channel
+from audionmf.nmfcompression.nmfcompressor import NMFCompressor
+from audionmf.nmfcompression.stereo import stereo_modes, stereo_extension, read_stereo_extension, channel_groups, \
+    mid_side, left_right, MidSideStream, joint_chunks, split_channels
+from audionmf.util.matrix_util import array_pad_split, serialize_matrix, deserialize_matrix, chunk_count, \
+    signal_segments
+from audionmf.util.nmf_util import nmf_matrices, random_state, nmf_matrix_original
+from audionmf.util.stats_util import NO_STATS
 
 
-class NMFCompressorRaw:
+class NMFCompressorRaw(NMFCompressor):
     # tuple that says how large chunks to group up together into matrices
     # (rows, cols), will be padded with zeros if too small
     # if set to None, the whole signal will be one chunk with a square size
@@ -18,94 +27,222 @@ class NMFCompressorRaw:
     NMF_MAX_ITER = 3000
     NMF_RANK = 40
 
-    def compress(self, audio_data, output_fd):
+    # NMF update rule (see NMF.update_func) and the cost function it minimizes (see NMF.cost_func)
+    NMF_UPDATE = 'euclidean'
+    NMF_COST = 'euclidean'
+
+    # stop NMF early once the relative change in cost falls below NMF_TOL,
+    # the cost is only evaluated every NMF_CHECK_INTERVAL iterations
+    NMF_TOL = 1e-4
+    NMF_CHECK_INTERVAL = 10
+
+    # adaptive rank of every chunk, see NMFCompressorSTFT
+    NMF_RANK_TOL = None
+
+    # silent and constant (DC) chunks, see NMFCompressorSTFT, the RMS is in samples
+    SILENCE_THRESHOLD = 4
+
+    # NMF initialization (see NMF.init_func), with warm start enabled every chunk after the first one
+    # starts from the basis H of the previous chunk of the same channel
+    NMF_INIT = 'random'
+    NMF_WARM_START = False
+
+    # floating point precision, see NMFCompressorSTFT
+    DTYPE = 'float32'
+
+    # stereo coding, see NMFCompressorSTFT
+    MID_SIDE = False
+    JOINT_STEREO = False
+
+    def compress(self, audio_data, output_fd, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                 seed=None):
         f = output_fd
 
-        print('Compressing (RAW)...')
+        click.echo('Compressing (RAW)...', err=True)
+        random = random_state(seed)
 
-        f.write(b'ANMFR')
-        f.write(struct.pack('<HI', len(audio_data.channels), audio_data.sample_rate))
+        channel_count = len(audio_data.channels)
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        channel_samples = mid_side(audio_data.samples) if mid_side_coded else audio_data.samples
 
-        for channel in audio_data.channels:
+        # build the matrices of all the channels first, so they can be factorized together
+        channel_matrices = list()
+
+        for i in range(channel_count):
             # determine chunk size
             if self.CHUNK_SHAPE is not None:
                 chunk_size = self.CHUNK_SHAPE[0] * self.CHUNK_SHAPE[1]
             else:
-                sample_cnt = len(channel.samples)
+                sample_cnt = len(channel_samples)
                 square_dim = math.ceil(math.sqrt(sample_cnt))
                 chunk_size = square_dim ** 2
                 self.CHUNK_SHAPE = (square_dim, square_dim)
 
-            # split samples into equal parts
-            samples, padding = array_pad_split(channel.samples, chunk_size)
+            with stats.stage('reshape'):
+                # split samples into equal parts, the padding is implied by the amount of samples
+                samples, _ = array_pad_split(channel_samples[:, i], chunk_size)
+
+                # create initial matrices
+                matrix_list = list()
 
-            # create initial matrices
-            matrix_list = list()
+                # re-shape each part into a matrix of the given shape and convert to a larger datatype
+                for sample_part in samples:
+                    sample_part_matrix = numpy.reshape(sample_part, self.CHUNK_SHAPE).astype(numpy.int32)
+                    matrix_list.append(sample_part_matrix)
 
-            # re-shape each part into a matrix of the given shape and convert to a larger datatype
-            for sample_part in samples:
-                sample_part_matrix = numpy.reshape(sample_part, self.CHUNK_SHAPE).astype(numpy.int32)
-                matrix_list.append(sample_part_matrix)
+            channel_matrices.append(matrix_list)
 
-            # write padding of samples after decompression and the amount of matrices / 2
-            # (there's two matrices per matrix due to NMF)
-            f.write(struct.pack('<II', padding, len(matrix_list)))
+        sample_count = len(audio_data.samples)
+        chunks = len(channel_matrices[0]) if channel_matrices else 0
+        container = ContainerWriter(f, b'R', channel_count, audio_data.sample_rate, sample_count, chunks,
+                                    stereo_extension(mid_side_coded, joint))
+        rank = self.nmf_rank(bitrate, sample_count / audio_data.sample_rate,
+                              channel_count * chunks * self.CHUNK_SHAPE[0], f.tell() - container.start,
+                              self.CHUNK_SHAPE)
 
-            # run NMF on the matrices
+        # stack the matrices of the channels coded together
+        groups = channel_groups(channel_count, joint)
+        matrix_lists = [joint_chunks([channel_matrices[i] for i in group]) for group in groups]
+
+        # run NMF on the matrices of all channels
+        results = nmf_matrices(matrix_lists, self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                               self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                               self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+        results = stats.timed('nmf', results)
+
+        for group, matrix_list in zip(groups, matrix_lists):
             for matrix in matrix_list:
-                # run NMF on the matrix
-                W, H, min_val = nmf_matrix(matrix, self.NMF_MAX_ITER, self.NMF_RANK)
+                # get the NMF of the next matrix and write it, every sample is a frame
+                self.write_nmf_chunk(container, group, matrix.size // len(group), next(results), rank, stats)
+
+        container.close()
+
+    def compress_stream(self, audio_stream, output_fd, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                        seed=None):
+        """ Compresses an audio stream (see AudioFormat.open_stream) chunk by chunk in constant memory.
 
-                # write minimum value to be subtracted later
-                f.write(struct.pack('<d', min_val))
+        The output must be seekable, as the chunk index is written last. The result is the same as compressing
+        the whole audio at once. Reading the input is timed as part of the reshape stage of the stats.
+        """
+        f = output_fd
 
-                # write both matrices into the file
-                serialize_matrix(f, W)
-                serialize_matrix(f, H)
+        click.echo('Compressing (RAW, streaming)...', err=True)
+        random = random_state(seed)
+
+        channel_count = audio_stream.channel_count
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        if mid_side_coded:
+            audio_stream = MidSideStream(audio_stream)
+
+        # determine chunk size
+        if self.CHUNK_SHAPE is None:
+            square_dim = math.ceil(math.sqrt(audio_stream.sample_count))
+            self.CHUNK_SHAPE = (square_dim, square_dim)
+        chunk_size = self.CHUNK_SHAPE[0] * self.CHUNK_SHAPE[1]
+
+        matrix_count = chunk_count(audio_stream.sample_count, chunk_size)
+        container = ContainerWriter(f, b'R', channel_count, audio_stream.sample_rate, audio_stream.sample_count,
+                                    matrix_count, stereo_extension(mid_side_coded, joint))
+        rank = self.nmf_rank(bitrate, audio_stream.sample_count / audio_stream.sample_rate,
+                              channel_count * matrix_count * self.CHUNK_SHAPE[0], f.tell() - container.start,
+                              self.CHUNK_SHAPE)
+
+        for group in channel_groups(channel_count, joint):
+            # re-shape each part into a matrix as it's read, padding the last one with zeros,
+            # and stack the matrices of the channels coded together
+            segments = [signal_segments(audio_stream.read_channel(i), chunk_size, chunk_size, matrix_count, 1)
+                        for i in group]
+            matrices = stats.timed('reshape', (numpy.concatenate([numpy.reshape(sample_part, self.CHUNK_SHAPE)
+                                                                   for sample_part in parts]).astype(numpy.int32)
+                                               for parts in zip(*segments)))
+
+            # run NMF on the matrices as they're read, writing each one as soon as it's done
+            results = nmf_matrices([matrices], self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                                   self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                                   self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+            results = stats.timed('nmf', results)
+            for result in results:
+                self.write_nmf_chunk(container, group, chunk_size, result, rank, stats)
+
+        container.close()
+
+    def chunk_bits(self, rows, cols):
+        # bitrate model of a rows x cols matrix of samples (see RateController), the 24 bytes of headers don't depend
+        # on the rank, every unit of rank adds a 32-bit column of W and a 32-bit row of H
+        return 24 * 8, (rows + cols) * 32
+
+    @staticmethod
+    def write_chunk(f, W, H, min_val, stats=NO_STATS):
+        with stats.stage('write'):
+            # write minimum value to be subtracted later
+            f.write(struct.pack('<d', min_val))
+
+            # write both matrices into the file
+            serialize_matrix(f, W)
+            serialize_matrix(f, H)
 
     def decompress(self, input_fd, audio_data):
         f = input_fd
 
-        print('Decompressing (RAW)...')
+        click.echo('Decompressing (RAW)...', err=True)
+
+        container = ContainerReader(f, b'R')
+        if container.version == 1:
+            return decompress_v1(f, audio_data, read_raw_channel)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        audio_data.sample_rate = container.sample_rate
+
+        audio_data.allocate(container.sample_count, container.channel_count)
+
+        for group in channel_groups(container.channel_count, joint):
+            # read the matrices in the order they're stored in, turned back into arrays
+            array_list = (self.read_chunk(f, len(group)) for _ in range(container.chunk_count))
 
-        data = f.read(5)
-        if data != b'ANMFR':
-            raise Exception('Invalid file format. Expected .anmfr.')
-        channel_count, sample_rate = struct.unpack('<HI', f.read(6))
-        audio_data.sample_rate = sample_rate
+            # write the samples into the channels, converting them back to 16-bit signed and removing the padding
+            audio_data.fill(array_list, group)
 
-        for _ in range(channel_count):
-            channel = Channel()
+        if mid_side_coded:
+            audio_data.samples[:] = left_right(audio_data.samples)
 
-            # read padding and amount of matrices / 2
-            padding, matrix_count = struct.unpack('<II', f.read(8))
+    def decompress_stream(self, input_fd, start=0, end=None):
+        """ Returns the decompressed audio between start and end (in seconds) as an AudioStream.
 
-            array_list = list()
+        Only the matrices covering the range are read, using the chunk index. The channels are read side by side,
+        so the input must be seekable.
+        """
+        click.echo('Decompressing (RAW, streaming)...', err=True)
 
-            # there's 2 times more matrices, see above
-            for i in range(matrix_count):
-                # read minimum value
-                min_val = struct.unpack('<d', f.read(8))
+        container = ContainerReader(input_fd, b'R')
+        if container.version == 1:
+            return stream_v1(input_fd, read_raw_channel, start, end)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        start, end = container.sample_range(start, end)
 
-                # read both NMF matrices
-                W = deserialize_matrix(f)
-                H = deserialize_matrix(f)
+        channels = list()
+        for group in channel_groups(container.channel_count, joint):
+            chunks = container.read_frames(group[0], start, end, partial(self.read_chunk, channel_count=len(group)))
+            channels.extend(self.channel_stream(stream) for stream in split_channels(chunks, len(group)))
 
-                # multiply matrices and subtract old min values
-                matrix = nmf_matrix_original(W, H, min_val)
+        blocks = interleave_channels(channels)
+        if mid_side_coded:
+            blocks = map(left_right, blocks)
 
-                # turn the matrix back into an array
-                ary = matrix.ravel()
+        return AudioStream(container.sample_rate, container.channel_count, end - start, blocks)
 
-                # add to list
-                array_list.append(ary)
+    @staticmethod
+    def channel_stream(chunks):
+        # yields the samples of the channel, one matrix at a time
+        for samples in chunks:
+            yield samples.astype(numpy.int16)
 
-            # turn the array list into one large array
-            samples = numpy.concatenate(array_list, 0)
+    @staticmethod
+    def read_chunk(f, channel_count=1):
+        # read minimum value
+        min_val = struct.unpack('<d', f.read(8))[0]
 
-            # remove padding and convert back to 16-bit signed integers
-            samples = samples[:-padding].astype(numpy.int16)
+        # read both NMF matrices
+        W = deserialize_matrix(f)
+        H = deserialize_matrix(f)
 
-            # add samples to channel
-            channel.add_sample_array(samples)
-            audio_data.add_channel(channel)
+        # multiply matrices and subtract old min values, turning the matrix back into samples x channels
+        return nmf_matrix_original(W, H, min_val).reshape(channel_count, -1).T
@@ -1,16 +1,38 @@
 import struct
+from collections import deque
+from functools import partial
 
+import click
 import numpy
-import scipy.signal
 
-from audionmf.audio.channel import Channel
-from audionmf.transforms.huffman import HuffmanCoder
-from audionmf.transforms.quantization import scale_val, mu_law_compand, mu_law_expand, UniformQuantizer
-from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix, matrix_split
-from audionmf.util.nmf_util import nmf_matrix, nmf_matrix_original
-
-
-class NMFCompressorSTFT:
+from audionmf.audio.audio_stream import AudioStream, interleave_channels
+from audionmf.nmfcompression.container import ContainerWriter, ContainerReader
+from audionmf.nmfcompression.legacy import decompress_v1, stream_v1, read_stft_channel
+from audionmf.nmfcompression.nmfcompressor import NMFCompressor
+from audionmf.nmfcompression.stereo import stereo_modes, stereo_extension, read_stereo_extension, channel_groups, \
+    mid_side, left_right, MidSideStream, joint_chunks, channel_frames, split_channels
+from audionmf.transforms.entropy import builtin_coder, fit_coder, read_coder
+from audionmf.transforms.huffman import huffman_coder
+from audionmf.transforms.quantization import scale_array, mu_law_compand_array, mu_law_expand_array, \
+    mu_law_expand_table, phasor_table, uniform_quantizer
+from audionmf.transforms.stft import stft, stft_frame_count, stft_stream, istft_stream
+from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix, matrix_split, chunk_count, \
+    array_stream_slice
+from audionmf.util.nmf_util import nmf_matrices, random_state, nmf_matrix_original
+from audionmf.util.stats_util import NO_STATS
+
+# flag of the coding byte of the header extension (after the stereo flags), every entropy coded stream is preceded by
+# the table of its coder, see fit_coder
+CODER_TABLES = 1
+
+
+def read_coding_extension(extension):
+    # whether the streams are preceded by the tables of their coders, files without the coding flags only use the
+    # built-in Huffman coders
+    return bool(len(extension) > 1 and extension[1] & CODER_TABLES)
+
+
+class NMFCompressorSTFT(NMFCompressor):
     # amount of samples per frame, must be even
     # 1152 frame size at 44100 sample rate corresponds to ~26 ms windows
     FRAME_SIZE = 1152
@@ -23,184 +45,354 @@ class NMFCompressorSTFT:
     NMF_MAX_ITER = 1000
     NMF_RANK = 50
 
-    # mu-law companding parameters
-    MU_LAW_W = 10 ** 4
-    MU_LAW_H = 10 ** 5
-
-    def __init__(self):
-        # initialize Huffman encoder/decoder
-        self.Phuffman = HuffmanCoder('stftp')
-        self.Pquantizer = UniformQuantizer(-numpy.pi, numpy.pi, 2 ** 3)
-        self.Pquantize_vec = numpy.vectorize(self.Pquantizer.quantize_value)
-        self.Pdequantize_vec = numpy.vectorize(self.Pquantizer.dequantize_index)
-        self.Hhuffman = HuffmanCoder('stft32')
-        self.Hquantizer = UniformQuantizer(0, 1, 2 ** 5)
-        self.Hquantize_vec = numpy.vectorize(self.Hquantizer.quantize_value)
-        self.Hdequantize_vec = numpy.vectorize(self.Hquantizer.dequantize_index)
-        self.scale_matrix = numpy.vectorize(scale_val)
-        self.compand = numpy.vectorize(mu_law_compand)
-        self.expand = numpy.vectorize(mu_law_expand)
-
-    def compress(self, audio_data, f):
-        print('Compressing (STFT)...')
-
-        f.write(b'ANMFS')
-        f.write(struct.pack('<HI', len(audio_data.channels), audio_data.sample_rate))
-
-        for i, channel in enumerate(audio_data.channels):
-            stft = scipy.signal.stft(channel.samples, fs=audio_data.sample_rate, window='hann',
-                                     noverlap=self.FRAME_SIZE // 2, nperseg=self.FRAME_SIZE, padded=True)[2]
-
-            # transpose for consistency with other methods
-            stft = numpy.transpose(stft)
-
-            # find phase and magnitude matrices
-            phases = numpy.angle(stft)
-            magnitudes = numpy.absolute(stft)
-
-            # split the magnitude matrix into chunks
-            submatrices = matrix_split(magnitudes, self.NMF_CHUNK_SIZE)
-
-            # write the magnitude chunk count into the file
-            f.write(struct.pack('<I', len(submatrices)))
-
-            # compress phases using Huffman
-            Pq = self.Pquantize_vec(phases)
-            Pout, Prows = self.Phuffman.encode_int_matrix(Pq)
-
-            # write quantized phase matrix
-            f.write(struct.pack('<II', Prows, len(Pout)))
-            f.write(Pout)
-
-            # run NMF on the magnitude submatrices, getting their weights and coefficients
-            for submatrix in submatrices:
-                # run NMF on the matrix
-                W, H, min_val = nmf_matrix(submatrix, self.NMF_MAX_ITER, self.NMF_RANK)
+    # NMF update rule (see NMF.update_func) and the cost function it minimizes (see NMF.cost_func)
+    NMF_UPDATE = 'euclidean'
+    NMF_COST = 'euclidean'
 
-                # scale values to [0,1] using the maximum range of both matrices
-                matrix_min = min(numpy.amin(W), numpy.amin(H))
-                matrix_max = max(numpy.amax(W), numpy.amax(H))
+    # stop NMF early once the relative change in cost falls below NMF_TOL,
+    # the cost is only evaluated every NMF_CHECK_INTERVAL iterations
+    NMF_TOL = 1e-4
+    NMF_CHECK_INTERVAL = 10
 
-                Ws = self.scale_matrix(W, matrix_min, matrix_max, 0, 1)
-                Hs = self.scale_matrix(H, matrix_min, matrix_max, 0, 1)
+    # with NMF_RANK_TOL, every chunk gets the lowest rank up to NMF_RANK that can reconstruct it with at most
+    # this relative error (see adaptive_rank), so silent and simple chunks don't cost a full rank
+    NMF_RANK_TOL = None
 
-                # compand the scaled matrices using mu-law
-                Wsc = self.compand(Ws, self.MU_LAW_W)
-                Hsc = self.compand(Hs, self.MU_LAW_H)
+    # chunks whose magnitudes deviate from their mean by an RMS of at most SILENCE_THRESHOLD skip NMF and are
+    # stored as a constant with a rank of 0 and no phases, 0.07 is about the RMS of samples of amplitude 4
+    # (-78 dBFS), None disables it
+    SILENCE_THRESHOLD = 0.07
 
-                # uniformly quantize the mu-law scaled matrix H (coefficients)
-                # 32 levels of quantization between <0,1>
-                Hscq = self.Hquantize_vec(Hsc)
+    # NMF initialization (see NMF.init_func), with warm start enabled every chunk after the first one
+    # starts from the basis H of the previous chunk of the same channel
+    NMF_INIT = 'random'
+    NMF_WARM_START = False
 
-                # debug
-                # for val in numpy.nditer(Wscq):
-                # increment_frequency(int(val))
-                # for val in numpy.nditer(Hscq):
-                #    increment_frequency(int(val))
-                # freq_done()
+    # floating point precision of the transform and NMF, float32 is about twice as fast as float64 and precise
+    # enough, as W and H are stored in at most 32 bits
+    DTYPE = 'float32'
 
-                # Huffman encode the matrix
-                Hout, Hrows = self.Hhuffman.encode_int_matrix(Hscq)
+    # stereo coding of two channels, with MID_SIDE the mid (L + R) / 2 and side (L - R) / 2 channels are coded
+    # instead of left and right, with JOINT_STEREO the chunks of all the channels are factorized together,
+    # sharing the basis H while every channel keeps its own activations W
+    MID_SIDE = False
+    JOINT_STEREO = False
 
-                # for W, we scale it to 32-bit unsigned int
-                Wscs = self.scale_matrix(Wsc, 0, 1, 0, 2 ** 32).astype(numpy.uint32)
-
-                # now write everything to file
+    # mu-law companding parameters
+    MU_LAW_W = 10 ** 4
+    MU_LAW_H = 10 ** 5
 
-                # write minimum value to be subtracted later
-                f.write(struct.pack('<d', min_val))
+    # entropy coders of the quantized phases and H, 'huffman' or 'rans' (rANS, which takes a fraction of a bit per
+    # symbol closer to its information content, making the streams a few percent smaller, but decodes slower)
+    PHASE_CODER = 'huffman'
+    H_CODER = 'huffman'
 
-                # write the min and max to be re-scaled later
-                f.write(struct.pack('<dd', matrix_min, matrix_max))
+    # code the phases and H of every chunk with Huffman tables or rANS frequencies fitted to their histograms, stored
+    # in the chunk, wherever that's smaller than using the built-in ones
+    ADAPTIVE_TABLES = True
 
-                # write companded scaled W matrix
-                serialize_matrix(f, Wscs, 'I')
+    def __init__(self):
+        # the Huffman encoders/decoders and the quantizers with their tables are shared by all the instances
+        self.Phuffman = huffman_coder('stftp')
+        self.Pquantizer = uniform_quantizer(-numpy.pi, numpy.pi, 2 ** 3)
+        self.Hhuffman = huffman_coder('stft32')
+        self.Hquantizer = uniform_quantizer(0, 1, 2 ** 5)
 
-                # write the quantized matrix H and number of rows
-                f.write(struct.pack('<II', Hrows, len(Hout)))
-                f.write(Hout)
+    def compress(self, audio_data, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                 seed=None):
+        click.echo('Compressing (STFT)...', err=True)
+        random = random_state(seed)
 
-    def decompress(self, f, audio_data):
-        print('Decompressing (STFT)...')
+        channel_count = len(audio_data.channels)
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        samples = mid_side(audio_data.samples) if mid_side_coded else audio_data.samples
 
-        data = f.read(5)
-        if data != b'ANMFS':
-            raise Exception('Invalid file format. Expected .anmfs.')
-        channel_count, sample_rate = struct.unpack('<HI', f.read(6))
-        audio_data.sample_rate = sample_rate
+        # transform all the channels first, so the chunks of every channel can be factorized together
+        transforms = list()
 
         for i in range(channel_count):
-            channel = Channel()
-
-            # read magnitude matrix chunk count
-            chunk_count = struct.unpack('<I', f.read(4))[0]
-
-            # read phases matrix
-            Prows, Plen = struct.unpack('<II', f.read(8))
-            Pbytes = f.read(Plen)
-
-            # Huffman decode the matrix to gain quantized values
-            Pq = self.Phuffman.decode_int_matrix(Pbytes, Prows)
-
-            # multiply each value by step to gain original values
-            phases = self.Pdequantize_vec(Pq)
-
-            # read and multiply NMF chunks to obtain magnitude matrix
-            chunks = list()
-
-            for _ in range(chunk_count):
-                # read minimum value
-                min_val = struct.unpack('<d', f.read(8))[0]
-
-                # read min and max for re-scaling
-                matrix_min, matrix_max = struct.unpack('<dd', f.read(16))
-
-                # read companded scaled matrix W
-                Wscs = deserialize_matrix(f, 'I')
-
-                # read Huffman encoded matrix H
-                Hrows, Hlen = struct.unpack('<II', f.read(8))
-                Hbytes = f.read(Hlen)
-
-                # scale matrix W back
-                Wsc = self.scale_matrix(Wscs, 0, 2 ** 32, 0, 1)
-
-                # Huffman decode the matrix to gain quantized values
-                Hscq = self.Hhuffman.decode_int_matrix(Hbytes, Hrows)
-
-                # multiply each value by step to gain original values
-                Hsc = self.Hdequantize_vec(Hscq)
-
-                # expand the scaled matrices using mu-law
-                Ws = self.expand(Wsc, self.MU_LAW_W)
-                Hs = self.expand(Hsc, self.MU_LAW_H)
-
-                # scale matrices back to normal
-                W = self.scale_matrix(Ws, 0, 1, matrix_min, matrix_max)
-                H = self.scale_matrix(Hs, 0, 1, matrix_min, matrix_max)
+            with stats.stage('stft'):
+                stft_matrix = stft(samples[:, i], audio_data.sample_rate, self.FRAME_SIZE, self.DTYPE)
+
+                # find phase and magnitude matrices
+                phases = numpy.angle(stft_matrix)
+                magnitudes = numpy.absolute(stft_matrix)
+
+                # split both matrices into chunks
+                phase_chunks = matrix_split(phases, self.NMF_CHUNK_SIZE)
+                submatrices = matrix_split(magnitudes, self.NMF_CHUNK_SIZE)
+
+            transforms.append((phase_chunks, submatrices))
+
+        sample_count = len(audio_data.samples)
+        chunks = len(transforms[0][1]) if transforms else 0
+        container = ContainerWriter(f, b'S', channel_count, audio_data.sample_rate, sample_count, chunks,
+                                    self.extension(mid_side_coded, joint))
+
+        # stack the chunks of the channels coded together
+        groups = channel_groups(channel_count, joint)
+        phase_lists = [joint_chunks([transforms[i][0] for i in group]) for group in groups]
+        matrix_lists = [joint_chunks([transforms[i][1] for i in group]) for group in groups]
+
+        # run NMF on the magnitude submatrices of all channels, getting their weights and coefficients
+        rank = self.nmf_rank(bitrate, sample_count / audio_data.sample_rate,
+                              channel_count * stft_frame_count(sample_count, self.FRAME_SIZE),
+                              f.tell() - container.start, (self.NMF_CHUNK_SIZE, self.FRAME_SIZE // 2 + 1))
+        results = nmf_matrices(matrix_lists, self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                               self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                               self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+        results = stats.timed('nmf', results)
+
+        for group, phase_chunks in zip(groups, phase_lists):
+            for phases in phase_chunks:
+                # get the NMF of the next matrix and write it along with its phases
+                self.write_nmf_chunk(container, group, len(phases) // len(group), next(results), rank, stats, phases)
+
+        container.close()
+
+    def compress_stream(self, audio_stream, f, jobs=1, stats=NO_STATS, bitrate=None, blas_threads=None,
+                        seed=None):
+        """ Compresses an audio stream (see AudioFormat.open_stream) chunk by chunk in constant memory.
+
+        The output must be seekable, as the chunk index is written last. The result is the same as compressing
+        the whole audio at once. Reading the input is timed as part of the stft stage of the stats.
+        """
+        click.echo('Compressing (STFT, streaming)...', err=True)
+        random = random_state(seed)
+
+        channel_count = audio_stream.channel_count
+        mid_side_coded, joint = stereo_modes(channel_count, self.MID_SIDE, self.JOINT_STEREO)
+        if mid_side_coded:
+            audio_stream = MidSideStream(audio_stream)
+
+        frame_count = stft_frame_count(audio_stream.sample_count, self.FRAME_SIZE)
+        container = ContainerWriter(f, b'S', channel_count, audio_stream.sample_rate, audio_stream.sample_count,
+                                    chunk_count(frame_count, self.NMF_CHUNK_SIZE),
+                                    self.extension(mid_side_coded, joint))
+        rank = self.nmf_rank(bitrate, audio_stream.sample_count / audio_stream.sample_rate, channel_count * frame_count,
+                              f.tell() - container.start, (self.NMF_CHUNK_SIZE, self.FRAME_SIZE // 2 + 1))
+
+        for group in channel_groups(channel_count, joint):
+            # the phases wait for the NMF of their magnitudes
+            phase_chunks = deque()
+            submatrices = stats.timed('stft', self.magnitude_chunks(audio_stream, group, phase_chunks))
+
+            # run NMF on the magnitude chunks as they're read, writing each one as soon as it's done
+            results = nmf_matrices([submatrices], self.NMF_MAX_ITER, rank, self.NMF_UPDATE, self.NMF_COST,
+                                   self.NMF_TOL, self.NMF_CHECK_INTERVAL, self.NMF_INIT, self.NMF_WARM_START, jobs,
+                                   self.NMF_RANK_TOL, self.SILENCE_THRESHOLD, self.DTYPE, blas_threads, random)
+            results = stats.timed('nmf', results)
+            for result in results:
+                phases = phase_chunks.popleft()
+                self.write_nmf_chunk(container, group, len(phases) // len(group), result, rank, stats, phases)
+
+        container.close()
+
+    def magnitude_chunks(self, audio_stream, channels, phase_chunks):
+        # reads the channels of the stream and yields their STFT magnitudes in chunks of NMF_CHUNK_SIZE frames,
+        # stacked when coded together, appending the phases of every chunk to phase_chunks
+        streams = [stft_stream(audio_stream.read_channel(i), audio_stream.sample_rate, self.FRAME_SIZE,
+                               audio_stream.sample_count, self.NMF_CHUNK_SIZE, self.DTYPE) for i in channels]
+        for stft_chunks in zip(*streams):
+            stft_chunk = numpy.concatenate(stft_chunks)
+            phase_chunks.append(numpy.angle(stft_chunk))
+            yield numpy.absolute(stft_chunk)
+
+    def extension(self, mid_side_coded, joint):
+        # the stereo flags followed by the coding flags
+        return stereo_extension(mid_side_coded, joint) + struct.pack('<B', CODER_TABLES)
+
+    def chunk_bits(self, rows, cols):
+        # bitrate model of a chunk of rows x cols magnitudes (see RateController), the phases and the 48 bytes of
+        # headers don't depend on the rank, every unit of rank adds a 32-bit column of W and a Huffman coded row of H
+        fixed_bits = rows * cols * builtin_coder(self.PHASE_CODER, 'stftp').get_expected_bits() + 48 * 8
+        rank_bits = rows * 32 + cols * builtin_coder(self.H_CODER, 'stft32').get_expected_bits()
+        return fixed_bits, rank_bits
+
+    def write_chunk(self, f, phases, W, H, min_val, stats=NO_STATS):
+        if not len(H):
+            # a constant chunk (see constant_factors) is stored without phases and without H
+            with stats.stage('write'):
+                f.write(struct.pack('<II', 0, 0))
+                f.write(struct.pack('<ddd', min_val, 0, 0))
+                serialize_matrix(f, W, 'I')
+                f.write(struct.pack('<II', 0, 0))
+            return
+
+        with stats.stage('quantization'):
+            # quantize the phases, to be compressed using Huffman
+            Pq = self.Pquantizer.quantize_array(phases)
+
+        with stats.stage('companding'):
+            # compand in double precision whatever the precision of NMF, W is stored as 32-bit fixed point
+            W = W.astype(numpy.float64)
+            H = H.astype(numpy.float64)
+
+            # scale values to [0,1] using the maximum range of both matrices
+            matrix_min = min(numpy.amin(W), numpy.amin(H))
+            matrix_max = max(numpy.amax(W), numpy.amax(H))
+
+            Ws = scale_array(W, matrix_min, matrix_max, 0, 1)
+            Hs = scale_array(H, matrix_min, matrix_max, 0, 1)
+
+            # compand the scaled matrices using mu-law (in place)
+            Wsc = mu_law_compand_array(Ws, self.MU_LAW_W, out=Ws)
+            Hsc = mu_law_compand_array(Hs, self.MU_LAW_H, out=Hs)
+
+        with stats.stage('quantization'):
+            # uniformly quantize the mu-law scaled matrix H (coefficients)
+            # 32 levels of quantization between <0,1>
+            Hscq = self.Hquantizer.quantize_array(Hsc)
+
+            # debug
+            # for val in numpy.nditer(Wscq):
+            # increment_frequency(int(val))
+            # for val in numpy.nditer(Hscq):
+            #    increment_frequency(int(val))
+            # freq_done()
+
+            # for W, we scale it to 32-bit unsigned int
+            Wscs = scale_array(Wsc, 0, 1, 0, 2 ** 32, out=Wsc).astype(numpy.uint32)
+
+        with stats.stage('huffman'):
+            # entropy code the phases and the matrix, with the tables fitted to them if that's smaller
+            Pcoder, Ptable = fit_coder(Pq, 'stftp', self.PHASE_CODER, self.ADAPTIVE_TABLES)
+            Hcoder, Htable = fit_coder(Hscq, 'stft32', self.H_CODER, self.ADAPTIVE_TABLES)
+            Pout, Prows = Pcoder.encode_int_matrix(Pq)
+            Hout, Hrows = Hcoder.encode_int_matrix(Hscq)
+
+        # now write everything to file
+        with stats.stage('write'):
+            # write quantized phase matrix
+            f.write(struct.pack('<II', Prows, len(Pout)))
+            f.write(Ptable)
+            f.write(Pout)
 
-                # get original chunk back
-                mag_chunk = nmf_matrix_original(W, H, min_val)
+            # write minimum value to be subtracted later
+            f.write(struct.pack('<d', min_val))
 
-                # append it to the list
-                chunks.append(mag_chunk)
+            # write the min and max to be re-scaled later
+            f.write(struct.pack('<dd', matrix_min, matrix_max))
 
-            # concatenate magnitude matrix chunks
-            magnitudes = numpy.concatenate(chunks)
+            # write companded scaled W matrix
+            serialize_matrix(f, Wscs, 'I')
 
-            # join matrices back into the original STFT matrix
-            stft = magnitudes * numpy.cos(phases) + 1j * magnitudes * numpy.sin(phases)
+            # write the quantized matrix H and number of rows
+            f.write(struct.pack('<II', Hrows, len(Hout)))
+            f.write(Htable)
+            f.write(Hout)
 
-            # transpose back into original form
-            stft = numpy.transpose(stft)
+    def decompress(self, f, audio_data):
+        click.echo('Decompressing (STFT)...', err=True)
+
+        container = ContainerReader(f, b'S')
+        if container.version == 1:
+            return decompress_v1(f, audio_data, read_stft_channel)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        tables = read_coding_extension(container.extension)
+        audio_data.sample_rate = container.sample_rate
+
+        audio_data.allocate(container.sample_count, container.channel_count)
 
-            # run inverse STFT
-            signal = scipy.signal.istft(stft, fs=audio_data.sample_rate, window='hann',
-                                        noverlap=self.FRAME_SIZE // 2, nperseg=self.FRAME_SIZE, )[1]
+        for group in channel_groups(container.channel_count, joint):
+            # read the chunks in the order they're stored in and run inverse STFT chunk by chunk
+            chunks = (self.read_chunk(f, len(group), tables) for _ in range(container.chunk_count))
+            signals = [istft_stream(stream, self.FRAME_SIZE) for stream in split_channels(chunks, len(group))]
+
+            # write the samples into the channels, converting them back to 16-bit signed and removing the padding
+            audio_data.fill(interleave_channels(signals), group)
+
+        if mid_side_coded:
+            audio_data.samples[:] = left_right(audio_data.samples)
+
+    def decompress_stream(self, f, start=0, end=None):
+        """ Returns the decompressed audio between start and end (in seconds) as an AudioStream.
+
+        Only the chunks covering the range are read, using the chunk index, and the audio is reconstructed chunk by
+        chunk. The channels are read side by side, so the input must be seekable.
+        """
+        click.echo('Decompressing (STFT, streaming)...', err=True)
+
+        container = ContainerReader(f, b'S')
+        if container.version == 1:
+            return stream_v1(f, read_stft_channel, start, end)
+        mid_side_coded, joint = read_stereo_extension(container.extension)
+        tables = read_coding_extension(container.extension)
+        start, end = container.sample_range(start, end)
+
+        # every sample is covered by two frames, half a frame apart
+        hop = self.FRAME_SIZE // 2
+        first_frame = start // hop
+        stop_frame = (end - 1) // hop + 2 if end > start else first_frame
+
+        channels = list()
+        for group in channel_groups(container.channel_count, joint):
+            chunks = container.read_frames(group[0], first_frame, stop_frame, partial(self.read_chunk,
+                                                                                      channel_count=len(group),
+                                                                                      tables=tables))
+            for stream in split_channels(chunks, len(group)):
+                channels.append(self.channel_stream(stream, start - first_frame * hop, end - start))
+
+        blocks = interleave_channels(channels)
+        if mid_side_coded:
+            blocks = map(left_right, blocks)
+
+        return AudioStream(container.sample_rate, container.channel_count, end - start, blocks)
+
+    def channel_stream(self, chunks, offset, count):
+        # yields count samples of the channel from offset on as soon as they're reconstructed
+        signal = istft_stream(chunks, self.FRAME_SIZE)
+
+        for samples in array_stream_slice(signal, offset, count):
+            yield samples.astype(numpy.int16)
+
+    def read_chunk(self, f, channel_count=1, tables=False):
+        # returns the STFT frames of the chunk as frames x channels x bins, with tables the streams of a chunk
+        # that isn't constant are preceded by the tables of their coders
+        # read quantized phase matrix
+        Prows, Plen = struct.unpack('<II', f.read(8))
+        Pcoder = read_coder(f, 'stftp') if tables and Prows else self.Phuffman
+        Pbytes = f.read(Plen)
+
+        # read minimum value
+        min_val = struct.unpack('<d', f.read(8))[0]
+
+        # read min and max for re-scaling
+        matrix_min, matrix_max = struct.unpack('<dd', f.read(16))
+
+        # read companded scaled matrix W
+        Wscs = deserialize_matrix(f, 'I')
+
+        # read Huffman encoded matrix H
+        Hrows, Hlen = struct.unpack('<II', f.read(8))
+        Hcoder = read_coder(f, 'stft32') if tables and Hrows else self.Hhuffman
+        Hbytes = f.read(Hlen)
+
+        # a constant chunk, its magnitudes are filled with -min_val and its phases are 0
+        if not Hrows:
+            magnitudes = nmf_matrix_original(Wscs, numpy.zeros((0, self.FRAME_SIZE // 2 + 1)), min_val)
+            return channel_frames(magnitudes.astype(complex), channel_count)
+
+        # decode the phases, every level is then looked up as a unit phasor
+        Pq = Pcoder.decode_int_matrix(Pbytes, Prows)
+        phasors = phasor_table(self.Pquantizer)[Pq]
+
+        # scale matrix W back
+        Wsc = scale_array(Wscs, 0, 2 ** 32, 0, 1)
+
+        # decode the matrix to gain quantized values
+        Hscq = Hcoder.decode_int_matrix(Hbytes, Hrows)
+
+        # expand the scaled matrices using mu-law (in place), H is dequantized and expanded by a table lookup
+        Ws = mu_law_expand_array(Wsc, self.MU_LAW_W, out=Wsc)
+        Hs = mu_law_expand_table(self.Hquantizer, self.MU_LAW_H)[Hscq]
+
+        # scale matrices back to normal (in place)
+        W = scale_array(Ws, 0, 1, matrix_min, matrix_max, out=Ws)
+        H = scale_array(Hs, 0, 1, matrix_min, matrix_max, out=Hs)
 
-            # convert back to 16-bit signed
-            signal = signal.astype(numpy.int16)
+        # get original magnitudes back
+        magnitudes = nmf_matrix_original(W, H, min_val)
 
-            # add samples to channel and finalize
-            channel.add_sample_array(signal)
-            audio_data.add_channel(channel)
+        # join matrices back into the original STFT matrix chunk
+        return channel_frames(magnitudes * phasors, channel_count)
@@ -0,0 +1,92 @@
+import struct
+from itertools import tee
+
+import numpy
+
+# flags of the stereo coding, stored in the header extension of the container
+MID_SIDE = 1
+JOINT_STEREO = 2
+
+
+def stereo_modes(channel_count, mid_side, joint):
+    """ Returns which of the stereo codings apply, mid/side needs two channels and joint coding at least two. """
+    return mid_side and channel_count == 2, joint and channel_count > 1
+
+
+def stereo_extension(mid_side, joint):
+    return struct.pack('<B', (MID_SIDE if mid_side else 0) | (JOINT_STEREO if joint else 0))
+
+
+def read_stereo_extension(extension):
+    flags = extension[0] if len(extension) else 0
+    return bool(flags & MID_SIDE), bool(flags & JOINT_STEREO)
+
+
+def channel_groups(channel_count, joint):
+    """ Returns the lists of channels coded together, either all of them or every one on its own. """
+    if joint:
+        return [list(range(channel_count))]
+    return [[channel] for channel in range(channel_count)]
+
+
+def mid_side(samples):
+    """ Turns (frames x 2) left and right samples into mid (L + R) / 2 and side (L - R) / 2, rounded down. """
+    left = samples[:, 0].astype(numpy.int32)
+    right = samples[:, 1].astype(numpy.int32)
+
+    coded = numpy.empty(samples.shape, dtype=numpy.int16)
+    coded[:, 0] = (left + right) >> 1
+    coded[:, 1] = (left - right) >> 1
+
+    # zeros are left as they are, the matrices are made non-negative before NMF (see increment_by_min)
+    return coded
+
+
+def left_right(samples):
+    """ Reverses mid_side, returning (frames x 2) left and right samples. """
+    mid = samples[:, 0].astype(numpy.int32)
+    side = samples[:, 1].astype(numpy.int32)
+
+    decoded = numpy.empty(samples.shape, dtype=numpy.int16)
+    decoded[:, 0] = numpy.clip(mid + side, -2 ** 15, 2 ** 15 - 1)
+    decoded[:, 1] = numpy.clip(mid - side, -2 ** 15, 2 ** 15 - 1)
+
+    return decoded
+
+
+class MidSideStream:
+    """ Reads the mid and side channels of a two channel audio stream (see AudioFormat.open_stream). """
+
+    def __init__(self, audio_stream):
+        self.audio_stream = audio_stream
+        self.sample_rate = audio_stream.sample_rate
+        self.channel_count = audio_stream.channel_count
+        self.sample_count = audio_stream.sample_count
+
+    def read_channel(self, channel, *args):
+        left = self.audio_stream.read_channel(0, *args)
+        right = self.audio_stream.read_channel(1, *args)
+        for left_block, right_block in zip(left, right):
+            yield mid_side(numpy.column_stack((left_block, right_block)))[:, channel]
+
+
+def joint_chunks(chunk_lists):
+    """ Stacks the chunks of channels coded together, so they are factorized as one matrix. """
+    if len(chunk_lists) == 1:
+        return chunk_lists[0]
+    return [numpy.concatenate(chunks) for chunks in zip(*chunk_lists)]
+
+
+def channel_frames(chunk, channel_count):
+    """ Turns a chunk of stacked channels into frames x channels (x values per frame). """
+    return numpy.stack(numpy.split(chunk, channel_count), axis=1)
+
+
+def split_channels(chunks, channel_count):
+    """ Splits a stream of chunks of frames x channels into a stream for every channel. """
+    return [channel_chunks(stream, channel) for channel, stream in enumerate(tee(chunks, channel_count))]
+
+
+def channel_chunks(chunks, channel):
+    for chunk in chunks:
+        yield chunk[:, channel]
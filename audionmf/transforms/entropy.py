@@ -0,0 +1,69 @@
+import struct
+
+import numpy
+
+from audionmf.transforms.huffman import HuffmanCoder, frequencies, huffman_coder, huffman_code_lengths, \
+    pack_code_lengths, unpack_code_lengths
+from audionmf.transforms.rans import RANSCoder, rans_coder, normalize_frequencies
+
+# the first byte of the table of a stream (see fit_coder), the built-in coder of the backend or a fitted one, whose
+# code lengths (4 bits each, including EOF) or frequencies (16 bits each) follow
+HUFFMAN_BUILTIN = 0
+HUFFMAN_TABLE = 1
+RANS_BUILTIN = 2
+RANS_TABLE = 3
+
+entropy_coders = {
+    'huffman': huffman_coder,
+    'rans': rans_coder
+}
+
+
+def builtin_coder(backend, method):
+    """ Returns the coder of a backend ('huffman' or 'rans') using the built-in frequencies of the method. """
+    try:
+        return entropy_coders[backend](method)
+    except KeyError:
+        raise KeyError('Invalid entropy coder: {}.'.format(backend))
+
+
+def fit_coder(symbols, method, backend='huffman', adaptive=True):
+    """ Returns the coder to encode quantized symbols of a method with and its table to be stored before them.
+
+    With adaptive, that's a coder fitted to the histogram of the symbols if they take fewer bytes with it, including
+    its table, otherwise the built-in coder of the backend.
+    """
+    coder = builtin_coder(backend, method)
+    table = struct.pack('<B', HUFFMAN_BUILTIN if backend == 'huffman' else RANS_BUILTIN)
+    if not adaptive:
+        return coder, table
+
+    counts = numpy.bincount(symbols.reshape(-1), minlength=len(frequencies[method]))
+    if backend == 'huffman':
+        lengths = huffman_code_lengths(numpy.append(counts, 1))
+        fitted = HuffmanCoder(code_lengths=lengths)
+        fitted_table = struct.pack('<B', HUFFMAN_TABLE) + pack_code_lengths(lengths)
+    else:
+        freqs = normalize_frequencies(counts, RANSCoder.PRECISION)
+        fitted = RANSCoder(freqs=freqs)
+        fitted_table = struct.pack('<B', RANS_TABLE) + freqs.astype('<u2').tobytes()
+
+    if len(fitted_table) + fitted.stream_bytes(counts) >= len(table) + coder.stream_bytes(counts):
+        return coder, table
+    return fitted, fitted_table
+
+
+def read_coder(f, method):
+    """ Reads the table written before a stream of symbols of the method by fit_coder, returns their coder. """
+    kind = struct.unpack('<B', f.read(1))[0]
+    symbol_count = len(frequencies[method])
+
+    if kind == HUFFMAN_BUILTIN:
+        return huffman_coder(method)
+    if kind == HUFFMAN_TABLE:
+        return HuffmanCoder(code_lengths=unpack_code_lengths(f.read(symbol_count // 2 + 1), symbol_count + 1))
+    if kind == RANS_BUILTIN:
+        return rans_coder(method)
+    if kind == RANS_TABLE:
+        return RANSCoder(freqs=numpy.frombuffer(f.read(2 * symbol_count), dtype='<u2'))
+    raise Exception('Invalid entropy coder table {}.'.format(kind))
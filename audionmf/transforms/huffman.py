@@ -1,4 +1,8 @@
 # average frequencies extracted with get_quant_freq.py
+import heapq
+from functools import lru_cache
+from itertools import chain
+
 import numpy
 from dahuffman import HuffmanCodec
 from dahuffman.huffmancodec import _EndOfFileSymbol
@@ -51,27 +55,260 @@ frequencies = {
 }
 
 
+@lru_cache(maxsize=None)
+def huffman_coder(method):
+    """ Returns the HuffmanCoder of the method, built once and shared by all its users, as it holds no state. """
+    return HuffmanCoder(method)
+
+
+def huffman_code_lengths(counts, max_len=15):
+    """ Returns the lengths of the Huffman codes of symbols with the given counts, 0 for the symbols that don't occur.
+
+    While the longest code is over max_len bits, the counts are halved (keeping every symbol that occurs), which
+    brings the code lengths closer together.
+    """
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    while True:
+        lengths = numpy.zeros(counts.size, dtype=numpy.int64)
+        heap = [(count, [symbol]) for symbol, count in enumerate(counts.tolist()) if count]
+        heapq.heapify(heap)
+        if len(heap) == 1:
+            lengths[heap[0][1]] = 1
+
+        # merge the two least frequent subtrees, every symbol in them gets one bit longer
+        while len(heap) > 1:
+            count1, symbols1 = heapq.heappop(heap)
+            count2, symbols2 = heapq.heappop(heap)
+            lengths[symbols1 + symbols2] += 1
+            heapq.heappush(heap, (count1 + count2, symbols1 + symbols2))
+
+        if lengths.max(initial=0) <= max_len:
+            return lengths
+        counts = numpy.where(counts > 0, (counts + 1) // 2, 0)
+
+
+def canonical_code_table(lengths):
+    """ Returns the canonical Huffman codes {symbol: (bits, value)} of the code lengths, 0 for unused symbols. """
+    table = dict()
+    value = 0
+    previous_bits = 0
+    for symbol in sorted(numpy.flatnonzero(lengths).tolist(), key=lambda symbol: (lengths[symbol], symbol)):
+        bits = int(lengths[symbol])
+        value <<= bits - previous_bits
+        table[symbol] = (bits, value)
+        value += 1
+        previous_bits = bits
+    return table
+
+
+def pack_code_lengths(lengths):
+    # two 4-bit code lengths per byte
+    padded = numpy.zeros(len(lengths) + len(lengths) % 2, dtype=numpy.uint8)
+    padded[:len(lengths)] = lengths
+    return (padded[0::2] << 4 | padded[1::2]).tobytes()
+
+
+def unpack_code_lengths(data, count):
+    packed = numpy.frombuffer(data, dtype=numpy.uint8)
+    return numpy.stack((packed >> 4, packed & 15), axis=1).reshape(-1)[:count]
+
+
 class HuffmanCoder:
-    def __init__(self, method):
+    """ Huffman encoder/decoder of integer matrices.
+
+    Uses the code table dahuffman builds from the frequencies, so the bitstream stays compatible with it, but encodes
+    and decodes whole arrays at once using NumPy lookup tables. Instead of a method, the code lengths of canonical
+    codes may be given (see huffman_code_lengths), the last one is the length of the EOF code.
+    """
+
+    # the decoder follows the codes in segments of this many bits at once, one segment per lane
+    SEGMENT_BITS = 512
+
+    # how many segments are decoded at once, bounds the memory used for long streams
+    BATCH_SEGMENTS = 4096
+
+    def __init__(self, method=None, code_lengths=None):
+        if code_lengths is not None:
+            self.freqs = self.codec = None
+            self.build_tables(canonical_code_table(code_lengths), len(code_lengths) - 1)
+            return
+
         try:
             self.freqs = frequencies[method]
             self.codec = HuffmanCodec.from_frequencies(self.freqs)
         except KeyError:
             raise KeyError('Invalid Huffman dictionary.')
+        self.build_tables(self.codec.get_code_table(), _EndOfFileSymbol())
+
+    def build_tables(self, table, eof):
+        """ Builds the encoding tables (code length and value per symbol) and the multi-bit decoding tables from a code
+        table {symbol: (bits, value)}, eof is the key of the EOF code. """
+        self.eof_code = table[eof]
+        self.max_len = max(bits for bits, _ in table.values())
+
+        symbol_count = max(key for key in table.keys() if key != eof) + 1
+        self.code_lengths = numpy.zeros(symbol_count, dtype=numpy.int64)
+        self.code_values = numpy.zeros(symbol_count, dtype=numpy.int64)
+
+        # every max_len-bit window starting with a code maps to its symbol (-1 for EOF) and length
+        self.lut_symbols = numpy.zeros(1 << self.max_len, dtype=numpy.int8)
+        self.lut_lengths = numpy.zeros(1 << self.max_len, dtype=numpy.int32)
+
+        for key, (bits, value) in table.items():
+            symbol = -1 if key == eof else key
+            if symbol >= 0:
+                self.code_lengths[symbol] = bits
+                self.code_values[symbol] = value
+            first = value << (self.max_len - bits)
+            last = (value + 1) << (self.max_len - bits)
+            self.lut_symbols[first:last] = symbol
+            self.lut_lengths[first:last] = bits
+
+        # the coders are shared (see huffman_coder), so their tables are read-only
+        for table in (self.code_lengths, self.code_values, self.lut_symbols, self.lut_lengths):
+            table.setflags(write=False)
+
+    def stream_bytes(self, counts):
+        """ Returns the size in bytes of a stream of symbols with the given counts. """
+        size = min(len(counts), self.code_lengths.size)
+        return -(-int(numpy.dot(counts[:size], self.code_lengths[:size])) // 8)
 
     def print_dict(self):
         self.codec.print_code_table()
 
+    def code_bits(self, lengths, values):
+        """ Returns the bits of the given codes concatenated, most significant bit first. """
+        # left-align every code in a big-endian word, unpack the words and keep only the bits of the codes
+        word_bits = 16 if self.max_len <= 16 else 32
+        words = (values << (word_bits - lengths)).astype('>u{}'.format(word_bits // 8))
+        bits = numpy.unpackbits(words.view(numpy.uint8)).reshape(-1, word_bits)
+        return bits[numpy.arange(word_bits) < lengths[:, numpy.newaxis]]
+
     def encode_int_array(self, ary):
-        return self.codec.encode(ary)
+        return b''.join(self.encode_stream([ary]))
+
+    def encode_stream(self, arrays):
+        """ Encodes a sequence of arrays as one bitstream, yielding the bytes as soon as they're complete. """
+        leftover = numpy.zeros(0, dtype=numpy.uint8)
+
+        # pack the bits in parts to bound memory, carrying the bits that don't fill a byte
+        part_size = self.SEGMENT_BITS * self.BATCH_SEGMENTS // self.max_len
+        for ary in arrays:
+            ary = numpy.asarray(ary).reshape(-1)
+            if ary.size and (numpy.amin(ary) < 0 or numpy.amax(ary) >= self.code_lengths.size
+                             or numpy.amin(self.code_lengths[ary]) == 0):
+                raise KeyError('Value not in the Huffman dictionary.')
+
+            for i in range(0, ary.size, part_size):
+                part = ary[i:i + part_size]
+                bits = numpy.concatenate((leftover, self.code_bits(self.code_lengths[part], self.code_values[part])))
+                byte_bits = bits.size - bits.size % 8
+                yield numpy.packbits(bits[:byte_bits]).tobytes()
+                leftover = bits[byte_bits:]
+
+        # finish the last byte with the beginning of the EOF code, as dahuffman does
+        if leftover.size:
+            eof_bits = self.code_bits(numpy.array([self.eof_code[0]]), numpy.array([self.eof_code[1]]))
+            bits = numpy.concatenate((leftover, eof_bits))[:8]
+            yield numpy.packbits(bits).tobytes()
+
+    def decode_positions(self, lengths):
+        """ Returns the starting positions of the codes in a batch, knowing the code length at every position.
+
+        The batch is split into segments decoded side by side, each one starting at its first bit. Huffman codes
+        usually resynchronize quickly, so only the segments entered at a different position by the previous one
+        have to be decoded again, until all of them agree. Also returns where the code after the batch starts.
+        """
+        size = lengths.size
+        following = numpy.arange(size, dtype=numpy.int64) + lengths
+        segment_count = -(-size // self.SEGMENT_BITS)
+        segment_ends = numpy.minimum(numpy.arange(1, segment_count + 1) * self.SEGMENT_BITS, size)
+        entries = numpy.arange(segment_count, dtype=numpy.int64) * self.SEGMENT_BITS
+        exits = numpy.zeros(segment_count, dtype=numpy.int64)
+        positions = numpy.full((segment_count, 0), -1, dtype=numpy.int64)
+
+        redo = numpy.arange(segment_count)
+        while redo.size:
+            current = entries[redo]
+            ends = segment_ends[redo]
+            steps = list()
+            active = current < ends
+            while active.any():
+                steps.append(numpy.where(active, current, -1))
+                current[active] = following[current[active]]
+                active = current < ends
+            exits[redo] = current
+
+            # store the new chains of positions, one row per segment
+            if len(steps) > positions.shape[1]:
+                padding = numpy.full((segment_count, len(steps) - positions.shape[1]), -1, dtype=numpy.int64)
+                positions = numpy.hstack((positions, padding))
+            positions[redo] = -1
+            if steps:
+                positions[redo, :len(steps)] = numpy.transpose(steps)
+
+            # each segment is entered where the previous one was left
+            new_entries = numpy.concatenate((entries[:1], exits[:-1]))
+            redo = numpy.flatnonzero(new_entries != entries)
+            entries = new_entries
+
+        return positions[positions >= 0], exits[-1] if segment_count else 0
 
     def decode_int_array(self, raw_bytes):
-        return self.codec.decode(raw_bytes)
+        symbols = list(self.decode_stream([raw_bytes]))
+        if not symbols:
+            return numpy.zeros(0, dtype=numpy.int8)
+        return numpy.concatenate(symbols)
+
+    def decode_stream(self, blocks):
+        """ Decodes a bitstream given as a sequence of byte blocks, yielding the symbols as soon as they're decoded.
+
+        Only the bits of the current block and the code cut off by its end are kept in memory.
+        """
+        batch_size = self.SEGMENT_BITS * self.BATCH_SEGMENTS
+        bits = numpy.zeros(0, dtype=numpy.uint8)
+
+        for block in chain(blocks, [None]):
+            final = block is None
+            if final:
+                # the codes at the end of the stream read zeros past it
+                bit_count = bits.size
+                bits = numpy.concatenate((bits, numpy.zeros(self.max_len, dtype=numpy.uint8)))
+            else:
+                # only decode the codes with all of their max_len bits available, the rest waits for the next block
+                bits = numpy.concatenate((bits, numpy.unpackbits(numpy.frombuffer(block, dtype=numpy.uint8))))
+                bit_count = bits.size - self.max_len
+
+            start = 0
+            while start < bit_count:
+                size = min(batch_size, bit_count - start)
+
+                # read max_len bits starting at every position of the batch
+                windows = numpy.zeros(size, dtype=numpy.int32)
+                for i in range(self.max_len):
+                    windows <<= 1
+                    windows |= bits[start + i:start + i + size]
+
+                positions, following = self.decode_positions(self.lut_lengths[windows])
+                batch_windows = windows[positions]
+                batch_symbols = self.lut_symbols[batch_windows]
+
+                # stop at the EOF symbol or at a code cut off by the end of the stream
+                stop = batch_symbols < 0
+                if final:
+                    stop |= start + positions + self.lut_lengths[batch_windows] > bit_count
+                stop = numpy.flatnonzero(stop)
+                if stop.size:
+                    yield batch_symbols[:stop[0]]
+                    return
+                yield batch_symbols
+                start += following
+
+            bits = bits[start:]
 
     def encode_int_matrix(self, matrix):
         rows = matrix.shape[0]
-        ary = matrix.reshape(-1).tolist()
-        return self.encode_int_array(ary), rows
+        return self.encode_int_array(matrix), rows
 
     def decode_int_matrix(self, raw_bytes, rows):
         ary = self.decode_int_array(raw_bytes)
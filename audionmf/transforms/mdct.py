@@ -1,56 +1,63 @@
 import numpy
+from numpy.lib.stride_tricks import as_strided
 from scipy import fftpack
 
 from audionmf.transforms.window_func import mdct_window_mp3
-from audionmf.util.matrix_util import array_pad
+from audionmf.util.matrix_util import array_pad, signal_segments
 
 
 def mdct_fast(mdct_ary):
-    """ Turns 2N inputs into N outputs using MDCT via a DCT-IV. """
+    """ Turns 2N inputs into N outputs using MDCT via a DCT-IV.
+
+    Works along the last axis, so a matrix of blocks (one per row) is transformed at once.
+    """
 
     # split into fourths
-    half_block_size = mdct_ary.size // 4
+    half_block_size = mdct_ary.shape[-1] // 4
 
     # create blocks for MDCT
     # the MDCT of 2N inputs (a, b, c, d) is exactly equivalent to a DCT-IV of the N inputs: (−cR−d, a−bR)
-    a = mdct_ary[:half_block_size]
-    bR = mdct_ary[half_block_size:2 * half_block_size][::-1]
-    cR = mdct_ary[2 * half_block_size:3 * half_block_size][::-1]
-    d = mdct_ary[3 * half_block_size:4 * half_block_size]
+    a = mdct_ary[..., :half_block_size]
+    bR = mdct_ary[..., half_block_size:2 * half_block_size][..., ::-1]
+    cR = mdct_ary[..., 2 * half_block_size:3 * half_block_size][..., ::-1]
+    d = mdct_ary[..., 3 * half_block_size:4 * half_block_size]
 
     # fill input array
-    dct_input = numpy.concatenate((-cR - d, a - bR))
+    dct_input = numpy.concatenate((-cR - d, a - bR), axis=-1)
 
     # run DCT-IV on this array of size N, producing effectively MDCT of size 2N
-    dct4 = fftpack.dct(dct_input, type=4)
+    dct4 = fftpack.dct(dct_input, type=4, axis=-1)
 
     return dct4 * 0.5
 
 
 def imdct_fast(mdct_ary):
-    """ Turns N inputs into 2N outputs using MDCT via a DCT-IV. """
+    """ Turns N inputs into 2N outputs using MDCT via a DCT-IV.
+
+    Works along the last axis, so a matrix of blocks (one per row) is transformed at once.
+    """
 
     # get a size of fourths
-    half_block_size = mdct_ary.size // 2
+    half_block_size = mdct_ary.shape[-1] // 2
 
     # allocate output array
-    output_ary = numpy.ndarray((half_block_size * 4,))
+    output_ary = numpy.ndarray(mdct_ary.shape[:-1] + (half_block_size * 4,))
 
     # inverse DCT-IV, obtaining back (−cR−d, a−bR)
-    idct4 = fftpack.idct(mdct_ary, type=4)
+    idct4 = fftpack.idct(mdct_ary, type=4, axis=-1)
 
     # divide by implicit scaling factor 2N
     idct4 /= 4 * half_block_size
 
     # extend and shift to gain the (almost) original array (still need overlap-and-add with the next block)
     # IMDCT(MDCT(a, b, c, d)) = (a−bR, b−aR, c+dR, d+cR) / 2
-    abR = idct4[half_block_size:]
-    output_ary[:half_block_size] = abR
-    output_ary[half_block_size:2 * half_block_size] = -abR[::-1]
+    abR = idct4[..., half_block_size:]
+    output_ary[..., :half_block_size] = abR
+    output_ary[..., half_block_size:2 * half_block_size] = -abR[..., ::-1]
 
-    cRd = idct4[:half_block_size]
-    output_ary[2 * half_block_size:3 * half_block_size] = -cRd[::-1]
-    output_ary[3 * half_block_size:] = -cRd
+    cRd = idct4[..., :half_block_size]
+    output_ary[..., 2 * half_block_size:3 * half_block_size] = -cRd[..., ::-1]
+    output_ary[..., 3 * half_block_size:] = -cRd
 
     return output_ary
 
@@ -87,41 +94,57 @@ def imdct_slow(mdct_ary):
     return output_ary
 
 
-def mdct(full_signal, block_size, slow=False):
-    """ Runs overlapping MDCT on a full signal.
+def frame_signal(samples, block_size):
+    """ Returns a read-only view of the signal as overlapping blocks of 2 * block_size, hopping by block_size. """
+
+    block_count = (len(samples) // block_size) - 1
+    stride = samples.strides[0]
+    return as_strided(samples, shape=(block_count, 2 * block_size), strides=(block_size * stride, stride),
+                      writeable=False)
+
+
+def mdct_frames(samples, block_size, slow=False):
+    """ Runs MDCT on every block of an already padded signal, returning one row per block. """
+
+    # split the signal into overlapping blocks, one per row
+    blocks = frame_signal(samples, block_size)
+
+    # window all the blocks at once, keeping their precision
+    blocks = blocks * mdct_window_mp3(block_size).astype(blocks.dtype)
+
+    # run MDCT for every block
+    if not slow:
+        return mdct_fast(blocks)
+    return numpy.array([mdct_slow(block) for block in blocks]).reshape(-1, block_size)
+
+
+def mdct(full_signal, block_size, slow=False, dtype=numpy.float64):
+    """ Runs overlapping MDCT on a full signal, in the given floating point dtype.
 
      Block size must be an even value.
      """
 
     # pad samples properly to block size
-    samples, padding = array_pad(full_signal, block_size)
+    samples, padding = array_pad(numpy.asarray(full_signal, dtype=dtype), block_size)
 
     # add an extra block to the start and end to fix the first and last block
     samples = numpy.pad(samples, (block_size, block_size), mode='constant', constant_values=0)
 
-    # allocate MDCT output matrix
-    mdct_matrix = numpy.ndarray(((len(samples) // block_size) - 1, block_size))
-
-    # pick the transform function R^2N -> R^N
-    if not slow:
-        f = mdct_fast
-    else:
-        f = mdct_slow
+    return mdct_frames(samples, block_size, slow), padding
 
-    # get the window function
-    window = mdct_window_mp3(block_size)
 
-    # run MDCT for each block except the last one
-    for i in range((len(samples) // block_size) - 1):
-        signal = samples[i * block_size:i * block_size + block_size * 2]
+def mdct_row_count(sample_count, block_size):
+    """ Returns the amount of rows mdct produces for a signal of the given length, along with its padding. """
+    padding = (-sample_count) % block_size
+    return (sample_count + padding) // block_size + 1, padding
 
-        # window the signal
-        signal = window * signal
 
-        mdct_ary = f(signal)
-        mdct_matrix[i] = mdct_ary
+def mdct_stream(blocks, block_size, sample_count, chunk_size, dtype=numpy.float64):
+    """ Runs mdct on a signal given as a stream of sample blocks, yielding chunks of chunk_size rows. """
+    row_count, _ = mdct_row_count(sample_count, block_size)
 
-    return mdct_matrix, padding
+    for segment in signal_segments(blocks, 2 * block_size, block_size, row_count, chunk_size, block_size):
+        yield mdct_frames(segment.astype(dtype), block_size)
 
 
 def imdct(mdct_matrix, padding, slow=False):
@@ -129,27 +152,54 @@ def imdct(mdct_matrix, padding, slow=False):
 
     # find block size
     block_size = mdct_matrix.shape[1]
+    block_count = mdct_matrix.shape[0]
 
-    # allocate IMDCT output array along with an extra block filler at the end
-    imdct_ary = numpy.zeros(mdct_matrix.size + block_size)
-
-    # pick the transform function R^N -> R^2N
+    # run IMDCT for every block
     if not slow:
-        f = imdct_fast
+        blocks = imdct_fast(mdct_matrix)
     else:
-        f = imdct_slow
-
-    # get the window function
-    window = mdct_window_mp3(block_size)
-
-    # run IMDCT for each block
-    for i in range(mdct_matrix.shape[0]):
-        signal = f(mdct_matrix[i])
+        blocks = numpy.array([imdct_slow(row) for row in mdct_matrix]).reshape(-1, 2 * block_size)
 
-        # window the signal and multiply by two to gain original amplitudes
-        signal = window * signal * 2
+    # window the blocks and multiply by two to gain original amplitudes
+    blocks *= mdct_window_mp3(block_size) * 2
 
-        imdct_ary[i * block_size:i * block_size + block_size * 2] += signal
+    # overlap-and-add, the first half of each block overlaps the second half of the previous one
+    imdct_ary = numpy.zeros(mdct_matrix.size + block_size)
+    imdct_ary[:block_count * block_size] += blocks[:, :block_size].ravel()
+    imdct_ary[block_size:] += blocks[:, block_size:].ravel()
 
     # remove the padding from the array and return it
     return imdct_ary[block_size:-padding - block_size]
+
+
+def imdct_stream(chunks, padding):
+    """ Reverses mdct_stream, yielding the signal as soon as every chunk has been overlapped and added.
+
+    Computes exactly what imdct does, carrying the second half of the last block of every chunk to the next one.
+    """
+    window = None
+    previous = None
+    pending = numpy.zeros(0)
+
+    for mdct_matrix in chunks:
+        block_size = mdct_matrix.shape[1]
+        if window is None:
+            window = mdct_window_mp3(block_size) * 2
+
+        # run IMDCT for every block and window them
+        blocks = imdct_fast(mdct_matrix)
+        blocks *= window
+
+        # the first half of each block overlaps the second half of the previous one, the very first half is removed
+        if previous is None:
+            imdct_ary = blocks[1:, :block_size] + blocks[:-1, block_size:]
+        else:
+            imdct_ary = blocks[:, :block_size] + numpy.concatenate((previous, blocks[:-1, block_size:]))
+        previous = blocks[-1:, block_size:]
+
+        # hold back the last block, as the padding at the end of the signal is removed
+        imdct_ary = numpy.concatenate((pending, imdct_ary.ravel()))
+        yield imdct_ary[:-block_size]
+        pending = imdct_ary[-block_size:]
+
+    yield pending[:len(pending) - padding]
@@ -6,68 +6,239 @@ class NMFError(Exception):
 
 
 class NMF:
-    def __init__(self, matrix, max_iter=100, rank=30, initialize='random', cost_func='euclidean', update='euclidean'):
-        self.V = matrix
-        self.W = numpy.zeros((matrix.shape[0], rank))
-        self.H = numpy.zeros((rank, matrix.shape[1]))
+    # small constant used to keep the factors strictly positive and to avoid division by zero
+    EPSILON = float(numpy.finfo(numpy.float64).eps)
+
+    def __init__(self, matrix, max_iter=100, rank=30, initialize='random', cost_func='euclidean', update='euclidean',
+                 tol=0, check_interval=1, dtype=numpy.float64, seed=None, H_init=None):
+        """ Prepares a factorization of the matrix into W (basis) and H (coefficients).
+
+        The factorization stops after max_iter iterations, or sooner once the relative change of the cost
+        between two checks falls to tol or below. The cost is only evaluated every check_interval iterations.
+        All the matrices are kept in the given floating point dtype, float32 halves the memory traffic of the
+        matrix products dominating the updates. If a seed is given, the random initialization uses its own random
+        state instead of the global one. If H_init is given, it replaces the initial H (e.g. the result of
+        a previous, similar factorization), while W is initialized as usual.
+        """
+        self.dtype = numpy.dtype(dtype)
+        self.V = numpy.asarray(matrix, dtype=self.dtype)
+        self.W = numpy.zeros((matrix.shape[0], rank), dtype=self.dtype)
+        self.H = numpy.zeros((rank, matrix.shape[1]), dtype=self.dtype)
         self.initialize = self.init_func[initialize]
         self.eval_cost = self.cost_func[cost_func]
         self.update = self.update_func[update]
         self.max_iter = max_iter
+        self.tol = tol
+        self.check_interval = check_interval
+        self.n_iter = 0
+        self.cost = None
+        self.random = numpy.random if seed is None else numpy.random.RandomState(seed)
+        self.H_init = H_init
+
+        # preallocated buffers for the multiplicative updates, reused in every iteration
+        self.VHt = numpy.empty_like(self.W)
+        self.WHHt = numpy.empty_like(self.W)
+        self.HHt = numpy.empty((rank, rank), dtype=self.dtype)
+        self.WtV = numpy.empty_like(self.H)
+        self.WtWH = numpy.empty_like(self.H)
+        self.WtW = numpy.empty((rank, rank), dtype=self.dtype)
 
         self.validate()
 
+        # lower bound of the factors, keeping them and their products clear of subnormal numbers,
+        # which are very slow to compute with and come up quickly in float32
+        self.floor = numpy.finfo(self.dtype).eps ** 2 * numpy.sqrt(numpy.amax(self.V))
+
     def validate(self):
         """ Makes sure the matrix can be factorized. """
         if numpy.amin(self.V) < 0:
             raise NMFError('Original matrix contains negative values.')
+        if self.check_interval < 1:
+            raise NMFError('Cost check interval must be at least 1.')
+        if self.H_init is not None and numpy.shape(self.H_init) != self.H.shape:
+            raise NMFError('Initial H has shape {}, expected {}.'.format(numpy.shape(self.H_init), self.H.shape))
 
     def factorize(self):
-        """ Factorizes the matrix and returns W (basis) and H (coefficients) """
+        """ Factorizes the matrix and returns W (basis) and H (coefficients).
+
+        Afterwards, n_iter is the amount of iterations run and cost the cost at the last check (None if never checked).
+        """
         self.initialize(self)
+        if self.H_init is not None:
+            self.H = numpy.array(self.H_init, dtype=self.dtype)
         last_cost = None
+        self.n_iter = 0
+        self.cost = None
         for i in range(self.max_iter):
             self.update(self)
-            cost = self.eval_cost(self)
-            if cost == last_cost:
+            self.n_iter = i + 1
+            if self.n_iter % self.check_interval != 0:
+                continue
+            cost = self.cost = self.eval_cost(self)
+            if last_cost is not None and abs(last_cost - cost) <= self.tol * last_cost:
                 break
             last_cost = cost
         return self.W, self.H
 
     def init_random(self):
         """ Randomly initializes both matrices with a uniform distribution between [0, max(original)). """
-        W = numpy.random.rand(*self.W.shape)
-        H = numpy.random.rand(*self.H.shape)
+        W = self.random.rand(*self.W.shape)
+        H = self.random.rand(*self.H.shape)
         max_val = numpy.amax(self.V)
         W *= max_val
         H *= max_val
-        self.W = W
-        self.H = H
+        self.W = W.astype(self.dtype)
+        self.H = H.astype(self.dtype)
+
+    def init_nndsvd(self):
+        """ Deterministically initializes both matrices using non-negative double singular value decomposition.
+
+        Zeros are replaced by the average of the original matrix (NNDSVDa), so multiplicative updates can change them.
+        """
+        W = numpy.zeros(self.W.shape)
+        H = numpy.zeros(self.H.shape)
+        U, S, Vt = numpy.linalg.svd(self.V, full_matrices=False)
+
+        # the first singular triplet of a non-negative matrix is non-negative
+        W[:, 0] = numpy.sqrt(S[0]) * numpy.abs(U[:, 0])
+        H[0] = numpy.sqrt(S[0]) * numpy.abs(Vt[0])
+
+        # the other ones are split into positive and negative parts, keeping the dominant one
+        for j in range(1, min(W.shape[1], S.size)):
+            x = U[:, j]
+            y = Vt[j]
+            xp, xn = numpy.maximum(x, 0), numpy.maximum(-x, 0)
+            yp, yn = numpy.maximum(y, 0), numpy.maximum(-y, 0)
+            xp_norm, xn_norm = numpy.linalg.norm(xp), numpy.linalg.norm(xn)
+            yp_norm, yn_norm = numpy.linalg.norm(yp), numpy.linalg.norm(yn)
+
+            if xp_norm * yp_norm > xn_norm * yn_norm:
+                u, v, u_norm, v_norm = xp, yp, xp_norm, yp_norm
+            else:
+                u, v, u_norm, v_norm = xn, yn, xn_norm, yn_norm
+
+            # singular vectors of an exactly low-rank matrix may leave nothing to keep
+            sigma = u_norm * v_norm
+            if sigma == 0:
+                continue
+
+            factor = numpy.sqrt(S[j] * sigma)
+            W[:, j] = factor * u / u_norm
+            H[j] = factor * v / v_norm
+
+        avg = numpy.mean(self.V)
+        W[W < self.EPSILON] = avg
+        H[H < self.EPSILON] = avg
+        self.W = W.astype(self.dtype)
+        self.H = H.astype(self.dtype)
 
     def cost_euclidean(self):
         current = numpy.matmul(self.W, self.H)
         return numpy.linalg.norm(self.V - current)
 
+    def cost_divergence(self):
+        """ Generalized Kullback-Leibler divergence D(V || WH). """
+        current = numpy.matmul(self.W, self.H) + self.EPSILON
+        nonzero = self.V > 0
+        V = self.V[nonzero]
+        return numpy.sum(V * numpy.log(V / current[nonzero])) - numpy.sum(self.V) + numpy.sum(current)
+
     def update_euclidean(self):
+        """ Multiplicative updates minimizing the Euclidean distance.
+
+        Uses the Gram matrices H * H^T and W^T * W, so no product of the size of V is ever built,
+        and writes every intermediate result into the preallocated buffers. The denominators are kept
+        above zero, so rows or columns of zeros in V (such as a constant chunk) stay zero instead of NaN.
+        """
+        W = self.W
+        H = self.H
+        V = self.V
+        m = numpy.matmul
+
+        # W = W * (V * H^T) / (W * (H * H^T))
+        m(V, H.T, out=self.VHt)
+        m(H, H.T, out=self.HHt)
+        m(W, self.HHt, out=self.WHHt)
+        self.WHHt += self.EPSILON
+        W *= self.VHt
+        W /= self.WHHt
+        numpy.maximum(W, self.floor, out=W)
+
+        # H = H * (W^T * V) / ((W^T * W) * H)
+        m(W.T, V, out=self.WtV)
+        m(W.T, W, out=self.WtW)
+        m(self.WtW, H, out=self.WtWH)
+        self.WtWH += self.EPSILON
+        H *= self.WtV
+        H /= self.WtWH
+        numpy.maximum(H, self.floor, out=H)
+
+    def update_divergence(self):
+        """ Multiplicative updates minimizing the Kullback-Leibler divergence. """
+        W = self.W
+        H = self.H
+        V = self.V
+        m = numpy.matmul
+        eps = self.EPSILON
+
+        W = W * (m(V / (m(W, H) + eps), numpy.transpose(H)) / (numpy.sum(H, axis=1) + eps))
+        W = numpy.maximum(W, self.floor, out=W)
+        H = H * (m(numpy.transpose(W), V / (m(W, H) + eps)) / (numpy.sum(W, axis=0)[:, numpy.newaxis] + eps))
+        H = numpy.maximum(H, self.floor, out=H)
+
+        self.W = W
+        self.H = H
+
+    def update_hals(self):
+        """ Hierarchical alternating least squares, updating one column of W and one row of H at a time. """
+        W = self.W.copy()
+        H = self.H.copy()
+        V = self.V
+        m = numpy.matmul
+        eps = self.EPSILON
+
+        VHt = m(V, numpy.transpose(H))
+        HHt = m(H, numpy.transpose(H))
+        for k in range(W.shape[1]):
+            W[:, k] = numpy.maximum(W[:, k] + (VHt[:, k] - m(W, HHt[:, k])) / max(HHt[k, k], eps), eps)
+
+        WtV = m(numpy.transpose(W), V)
+        WtW = m(numpy.transpose(W), W)
+        for k in range(H.shape[0]):
+            H[k] = numpy.maximum(H[k] + (WtV[k] - m(WtW[k], H)) / max(WtW[k, k], eps), eps)
+
+        self.W = W
+        self.H = H
+
+    def update_als(self):
+        """ Projected alternating least squares, solving for each factor and clipping negative values. """
         W = self.W
         H = self.H
         V = self.V
         m = numpy.matmul
+        lstsq = numpy.linalg.lstsq
 
-        W = W * ((m(V, numpy.transpose(H))) / (m(m(W, H), numpy.transpose(H))))
-        H = H * ((m(numpy.transpose(W), V)) / (m(m(numpy.transpose(W), W), H)))
+        W = lstsq(m(H, numpy.transpose(H)), m(H, numpy.transpose(V)), rcond=None)[0]
+        W = numpy.maximum(numpy.transpose(W), self.EPSILON)
+        H = lstsq(m(numpy.transpose(W), W), m(numpy.transpose(W), V), rcond=None)[0]
+        H = numpy.maximum(H, self.EPSILON)
 
         self.W = W
         self.H = H
 
     init_func = {
-        'random': init_random
+        'random': init_random,
+        'nndsvd': init_nndsvd
     }
 
     cost_func = {
-        'euclidean': cost_euclidean
+        'euclidean': cost_euclidean,
+        'divergence': cost_divergence
     }
 
     update_func = {
-        'euclidean': update_euclidean
+        'euclidean': update_euclidean,
+        'divergence': update_divergence,
+        'hals': update_hals,
+        'als': update_als
     }
@@ -1,6 +1,15 @@
+from functools import lru_cache
+
 import numpy
 
 
+def float_output(x, out):
+    """ Returns out, or a new floating point array shaped like x if out is None. """
+    if out is None:
+        out = numpy.empty(numpy.shape(x), dtype=numpy.result_type(x, 1.0))
+    return out
+
+
 def scale_val(x, old_min, old_max, new_min, new_max):
     old_range = abs(old_max - old_min)
     new_range = abs(new_max - new_min)
@@ -8,23 +17,84 @@ def scale_val(x, old_min, old_max, new_min, new_max):
     return val
 
 
+def scale_array(x, old_min, old_max, new_min, new_max, out=None):
+    """ Array version of scale_val, writing the result into out if given (may be x itself). """
+    old_range = abs(old_max - old_min)
+    new_range = abs(new_max - new_min)
+    out = numpy.subtract(x, old_min, out=float_output(x, out))
+    out /= old_range
+    out *= new_range
+    out += new_min
+    return out
+
+
 def mu_law_compand(x, mu=255):
     """ Assumes values -1 <= x <= 1 """
     return numpy.sign(x) * numpy.log(1 + mu * abs(x)) / numpy.log(1 + mu)
 
 
+def mu_law_compand_array(x, mu=255, out=None):
+    """ Array version of mu_law_compand, writing the result into out if given (may be x itself). """
+    sign = numpy.sign(x)
+    out = numpy.absolute(x, out=float_output(x, out))
+    out *= mu
+    out += 1
+    numpy.log(out, out=out)
+    out *= sign
+    out /= numpy.log(1 + mu)
+    return out
+
+
 def mu_law_expand(y, mu=255):
     """ Assumes values -1 <= y <= 1 """
     return numpy.sign(y) * (1 / mu) * (((1 + mu) ** abs(y)) - 1)
 
 
+def mu_law_expand_array(y, mu=255, out=None):
+    """ Array version of mu_law_expand, writing the result into out if given (may be y itself). """
+    sign = numpy.sign(y)
+    out = numpy.absolute(y, out=float_output(y, out))
+    numpy.power(1 + mu, out, out=out)
+    out -= 1
+    out *= sign * (1 / mu)
+    return out
+
+
+@lru_cache(maxsize=None)
+def uniform_quantizer(min_val, max_val, levels):
+    """ Returns the UniformQuantizer of the range and levels, built once and shared by all its users. """
+    return UniformQuantizer(min_val, max_val, levels)
+
+
+@lru_cache(maxsize=None)
+def mu_law_expand_table(quantizer, mu):
+    """ Returns the mu-law expanded values of all the levels of a shared quantizer (read-only), so indices are
+    dequantized and expanded at once by indexing it. """
+    table = mu_law_expand_array(quantizer.values, mu)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def phasor_table(quantizer):
+    """ Returns the unit phasors e^(i * phase) of all the levels of a shared quantizer of phases (read-only). """
+    table = numpy.cos(quantizer.values) + 1j * numpy.sin(quantizer.values)
+    table.setflags(write=False)
+    return table
+
+
 class UniformQuantizer:
-    """ A uniform quantizer of N levels. """
+    """ A uniform quantizer of N levels.
+
+    The values of all the levels are computed once (read-only), indices are dequantized by looking them up.
+    """
 
     def __init__(self, min_val, max_val, levels):
         val_range = max_val - min_val
         self.step = val_range / (levels - 1)
         self.min_val = min_val
+        self.values = self.min_val + numpy.arange(levels) * self.step
+        self.values.setflags(write=False)
 
     def quantize_value(self, x):
         """ Quantizes a value to the according level. """
@@ -35,3 +105,18 @@ class UniformQuantizer:
         """ Returns the original value based on the index. """
         val = self.min_val + idx * self.step
         return val
+
+    def quantize_array(self, x, out=None):
+        """ Quantizes every value of an array, returning integer indices (written into out if given). """
+        quant_val_idx = numpy.subtract(x, self.min_val, out=float_output(x, None))
+        quant_val_idx /= self.step
+        quant_val_idx += 0.5
+        numpy.floor(quant_val_idx, out=quant_val_idx)
+        if out is None:
+            return quant_val_idx.astype(numpy.int64)
+        out[...] = quant_val_idx
+        return out
+
+    def dequantize_array(self, idx, out=None):
+        """ Returns the original values of an array of indices (written into out if given). """
+        return numpy.take(self.values, idx, out=out)
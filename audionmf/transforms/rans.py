@@ -0,0 +1,142 @@
+import struct
+from functools import lru_cache
+
+import numpy
+
+from audionmf.transforms.huffman import frequencies
+
+
+@lru_cache(maxsize=None)
+def rans_coder(method):
+    """ Returns the RANSCoder of the method, built once and shared by all its users, as it holds no state. """
+    return RANSCoder(method)
+
+
+def normalize_frequencies(counts, precision):
+    """ Scales symbol counts to frequencies summing to 2 ** precision, every symbol that occurs keeps at least 1. """
+    counts = numpy.asarray(counts, dtype=numpy.float64)
+    total = 1 << precision
+    freqs = numpy.where(counts > 0, numpy.maximum(numpy.floor(counts * total / counts.sum()), 1), 0).astype(numpy.int64)
+
+    # the rounding error goes to the most frequent symbol
+    freqs[numpy.argmax(freqs)] += total - freqs.sum()
+    return freqs
+
+
+class RANSCoder:
+    """ rANS (range asymmetric numeral systems) encoder/decoder of integer matrices.
+
+    Every symbol takes close to its information content under the frequencies, quantized to PRECISION bits, instead
+    of a whole number of bits. The symbols are dealt out to interleaved lanes, each with its own state, so all the
+    lanes are coded side by side as NumPy arrays, one symbol per lane at a time. The states are kept within
+    [LOWER, LOWER << 16) by moving 16-bit words from or to a single stream shared by the lanes, at most one word per
+    symbol, and the final states of the lanes are stored in front of it.
+    """
+
+    # the frequencies of the symbols sum to 2 ** PRECISION
+    PRECISION = 12
+
+    # lower bound of the states
+    LOWER = 1 << 16
+
+    # symbols per lane, every lane costs 4 bytes of state but fewer lanes take more steps to decode
+    LANE_SYMBOLS = 2048
+
+    def __init__(self, method=None, freqs=None):
+        # either the frequencies of a method, or normalized ones (see normalize_frequencies)
+        if freqs is None:
+            try:
+                method_freqs = frequencies[method]
+            except KeyError:
+                raise KeyError('Invalid frequency model.')
+            freqs = normalize_frequencies([method_freqs[symbol] for symbol in range(len(method_freqs))],
+                                          self.PRECISION)
+
+        self.freqs = numpy.asarray(freqs, dtype=numpy.int64)
+        self.starts = numpy.cumsum(self.freqs) - self.freqs
+
+        # every slot of [0, 2 ** PRECISION) maps to its symbol, the frequency and the offset of the symbol's range
+        slot_symbols = numpy.repeat(numpy.arange(self.freqs.size), self.freqs)
+        self.slot_symbols = slot_symbols.astype(numpy.int8)
+        self.slot_freqs = self.freqs[slot_symbols]
+        self.slot_offsets = numpy.arange(slot_symbols.size) - self.starts[slot_symbols]
+
+        # the coders are shared (see rans_coder), so their tables are read-only
+        for table in (self.freqs, self.starts, self.slot_symbols, self.slot_freqs, self.slot_offsets):
+            table.setflags(write=False)
+
+    def lane_count(self, count):
+        return max(-(-count // self.LANE_SYMBOLS), 1)
+
+    def stream_bytes(self, counts):
+        """ Returns the estimated size in bytes of a stream of symbols with the given counts. """
+        counts = numpy.asarray(counts)
+        freqs = self.freqs[:counts.size]
+        if counts.size > self.freqs.size or numpy.any((counts > 0) & (freqs == 0)):
+            return numpy.inf
+        used = counts > 0
+        bits = numpy.dot(counts[used], self.PRECISION - numpy.log2(freqs[used]))
+        return 8 + 4 * self.lane_count(int(counts.sum())) + 2 * int(numpy.ceil(bits / 16))
+
+    def get_expected_bits(self):
+        used = self.freqs > 0
+        probabilities = self.freqs[used] / (1 << self.PRECISION)
+        return float(numpy.dot(probabilities, self.PRECISION - numpy.log2(self.freqs[used])))
+
+    def encode_int_array(self, ary):
+        symbols = numpy.asarray(ary).reshape(-1)
+        if symbols.size and (numpy.amin(symbols) < 0 or numpy.amax(symbols) >= self.freqs.size
+                             or numpy.amin(self.freqs[symbols]) == 0):
+            raise KeyError('Value not in the frequency model.')
+
+        count = symbols.size
+        lanes = self.lane_count(count)
+        states = numpy.full(lanes, self.LOWER, dtype=numpy.int64)
+        limit = (self.LOWER >> self.PRECISION) << 16
+
+        # encode the symbols in reverse, so they're decoded in order, symbol i going to lane i % lanes
+        words = list()
+        for start in reversed(range(0, count, lanes)):
+            step = symbols[start:start + lanes]
+            x = states[:step.size]
+            freqs = self.freqs[step]
+
+            # the lanes whose state would overflow put out their low 16 bits first
+            overflow = x >= limit * freqs
+            words.append(x[overflow] & 0xffff)
+            x[overflow] >>= 16
+
+            x[:] = ((x // freqs) << self.PRECISION) + x % freqs + self.starts[step]
+
+        words = numpy.concatenate(words[::-1]) if words else numpy.zeros(0, dtype=numpy.int64)
+        return struct.pack('<II', count, lanes) + states.astype('<u4').tobytes() + words.astype('<u2').tobytes()
+
+    def decode_int_array(self, raw_bytes):
+        count, lanes = struct.unpack_from('<II', raw_bytes)
+        states = numpy.frombuffer(raw_bytes, dtype='<u4', count=lanes, offset=8).astype(numpy.int64)
+        words = numpy.frombuffer(raw_bytes, dtype='<u2', offset=8 + 4 * lanes).astype(numpy.int64)
+
+        symbols = numpy.empty(count, dtype=numpy.int8)
+        mask = (1 << self.PRECISION) - 1
+        position = 0
+        for start in range(0, count, lanes):
+            x = states[:min(lanes, count - start)]
+            slots = x & mask
+            symbols[start:start + x.size] = self.slot_symbols[slots]
+            x[:] = self.slot_freqs[slots] * (x >> self.PRECISION) + self.slot_offsets[slots]
+
+            # the lanes whose state fell below LOWER read the next words of the stream, in the order of the lanes
+            underflow = x < self.LOWER
+            read = numpy.count_nonzero(underflow)
+            x[underflow] = (x[underflow] << 16) | words[position:position + read]
+            position += read
+
+        return symbols
+
+    def encode_int_matrix(self, matrix):
+        rows = matrix.shape[0]
+        return self.encode_int_array(matrix), rows
+
+    def decode_int_matrix(self, raw_bytes, rows):
+        ary = self.decode_int_array(raw_bytes)
+        return numpy.reshape(ary, (rows, -1))
@@ -0,0 +1,86 @@
+import numpy
+import scipy.fft
+import scipy.signal
+
+from audionmf.util.matrix_util import signal_segments
+
+
+def stft(signal, sample_rate, frame_size, dtype=None):
+    """ Runs STFT with Hann windows overlapping by half, returning a matrix of frames x frequency bins.
+
+    The result is complex with the precision of the given floating point dtype, by default of the signal
+    (single for 16-bit samples).
+    """
+    if dtype is not None:
+        signal = numpy.asarray(signal, dtype=dtype)
+    stft_matrix = scipy.signal.stft(signal, fs=sample_rate, window='hann', noverlap=frame_size // 2,
+                                    nperseg=frame_size, padded=True)[2]
+
+    # transpose for consistency with other methods
+    return numpy.transpose(stft_matrix)
+
+
+def stft_frame_count(sample_count, frame_size):
+    """ Returns the amount of frames stft produces for a signal of the given length. """
+    hop = frame_size // 2
+
+    # the signal is extended by half a frame on both sides and padded to fit whole frames
+    length = sample_count + 2 * (frame_size // 2)
+    length += (-(length - frame_size) % hop) % frame_size
+
+    return (length - frame_size) // hop + 1
+
+
+def stft_stream(blocks, sample_rate, frame_size, sample_count, chunk_size, dtype=None):
+    """ Runs stft on a signal given as a stream of sample blocks, yielding chunks of chunk_size frames. """
+    hop = frame_size // 2
+    frame_count = stft_frame_count(sample_count, frame_size)
+
+    # every segment already contains the extension and fits whole frames, so padding adds no samples,
+    # but it converts the samples to floats exactly like it does for the full signal
+    for segment in signal_segments(blocks, frame_size, hop, frame_count, chunk_size, frame_size // 2):
+        if dtype is not None:
+            segment = segment.astype(dtype)
+        stft_matrix = scipy.signal.stft(segment, fs=sample_rate, window='hann', noverlap=hop, nperseg=frame_size,
+                                        boundary=None, padded=True)[2]
+        yield numpy.transpose(stft_matrix)
+
+
+def istft(stft_matrix, sample_rate, frame_size):
+    """ Reverses stft, returning the signal. """
+    return scipy.signal.istft(numpy.transpose(stft_matrix), fs=sample_rate, window='hann', noverlap=frame_size // 2,
+                              nperseg=frame_size)[1]
+
+
+def istft_stream(chunks, frame_size):
+    """ Reverses stft given as a stream of chunks of frames, yielding the signal as soon as it's overlapped and added.
+
+    Computes exactly what istft does, carrying the second half of the last frame of every chunk to the next one.
+    """
+    hop = frame_size // 2
+    window = None
+    norm = None
+
+    previous = None
+    for chunk in chunks:
+        frames = scipy.fft.irfft(chunk, n=frame_size, axis=-1)[:, :frame_size]
+
+        if window is None:
+            window = scipy.signal.get_window('hann', frame_size).astype(frames.dtype)
+
+            # past the removed half frames on both sides, every sample is covered by exactly two frames
+            norm = window[hop:] ** 2 + window[:hop] ** 2
+
+        frames *= window.sum()
+        frames = frames * window
+
+        # the first half of each frame overlaps the second half of the previous one
+        if previous is None:
+            tails = frames[:-1, hop:]
+            heads = frames[1:, :hop]
+        else:
+            tails = numpy.concatenate((previous, frames[:-1, hop:]))
+            heads = frames[:, :hop]
+        previous = frames[-1:, hop:]
+
+        yield ((tails + heads) / norm).ravel()
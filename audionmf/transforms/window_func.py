@@ -2,8 +2,6 @@ import numpy
 
 
 def mdct_window_mp3(N):
-    def w(n):
-        return numpy.sin((numpy.pi / (2 * N)) * (n + 0.5))
-
-    window = [w(n) for n in range(2 * N)]
+    n = numpy.arange(2 * N)
+    window = numpy.sin((numpy.pi / (2 * N)) * (n + 0.5))
     return window
@@ -0,0 +1,178 @@
+import os
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, audio_formats, compression_schemes, get_audio_format, \
+    get_compression_format
+from audionmf.util.nmf_util import WorkerPool
+from audionmf.util.stats_util import NO_STATS
+
+
+def batch_files(source, extensions):
+    """ Returns the input files of a batch, either the files with one of the extensions in a directory, or the paths
+    listed in a manifest file, one per line, relative to the manifest. """
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if file_extension(name) in extensions)
+        return [os.path.join(source, name) for name in names]
+
+    with open(source) as manifest:
+        paths = [line.strip() for line in manifest]
+    return [os.path.join(os.path.dirname(source), path) for path in paths if path and not path.startswith('#')]
+
+
+def file_extension(path):
+    return os.path.splitext(path)[1].lower()[1:]
+
+
+def output_path(input_path, output_dir, extension):
+    # the output of a file is named after it, either next to it or in the output directory
+    name = os.path.splitext(os.path.basename(input_path))[0] + '.' + extension
+    return os.path.join(output_dir or os.path.dirname(input_path), name)
+
+
+class Batch:
+    """ Transcodes many files with one pool of worker processes, keeping all the workers busy across files.
+
+    Every output is written under a temporary name and renamed once it's complete, so with resume, the files whose
+    output exists were completed by an earlier, possibly interrupted, run and are skipped.
+    """
+
+    def __init__(self, output_dir=None, jobs=0, blas_threads=None, memory=None, resume=False, report=print):
+        # report is called with a line for every file and the summary
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.blas_threads = blas_threads
+        self.memory = memory
+        self.resume = resume
+        self.report = report
+
+        self.audio_seconds = 0
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def compress(self, paths, compression, bitrate=None, seed=None):
+        """ Compresses the audio files, every file in its own thread, all of them factorizing their chunks in
+        the shared pool. The memory budget (in bytes) limits the chunks in the pool at the same time.
+
+        With a seed, every file is compressed with a seed of its own (see file_seed), so the outputs are reproducible.
+        """
+        files = self.pending_files(paths, audio_formats, compression)
+        start = perf_counter()
+
+        with WorkerPool(self.jobs, self.blas_threads, self.memory) as pool:
+            # a file per worker keeps all of them busy even when the files are read and encoded in between
+            with ThreadPoolExecutor(max_workers=pool.workers) as threads:
+                futures = [(path, threads.submit(compress_file, path, output, compression, pool, bitrate,
+                                                 file_seed(seed, path)))
+                           for path, output in files]
+                for path, future in futures:
+                    self.add_result(path, future.exception() or future.result())
+
+        return self.summary(perf_counter() - start)
+
+    def decompress(self, paths, audio_format='wav'):
+        """ Decompresses the files, every one of them in a worker of the pool, streaming it chunk by chunk. """
+        files = self.pending_files(paths, compression_schemes, audio_format)
+        start = perf_counter()
+
+        with WorkerPool(self.jobs, self.blas_threads) as pool:
+            tasks = ((path, output, audio_format) for path, output in files)
+            for (path, _), result in zip(files, pool.map(decompress_file_task, tasks)):
+                self.add_result(path, result)
+
+        return self.summary(perf_counter() - start)
+
+    def pending_files(self, paths, input_extensions, extension):
+        # pairs the files with their outputs, leaving out the ones completed before when resuming
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        files = list()
+        for path in paths:
+            if file_extension(path) not in input_extensions:
+                self.add_result(path, Exception('unsupported file type'))
+                continue
+            output = output_path(path, self.output_dir, extension)
+            if self.resume and os.path.exists(output):
+                self.skipped += 1
+                continue
+            files.append((path, output))
+        return files
+
+    def add_result(self, path, result):
+        # the result is the seconds of audio and the time it took, or the error of the file
+        if isinstance(result, Exception):
+            self.failed += 1
+            self.report('{}: failed: {}'.format(path, result))
+            return
+
+        audio_seconds, seconds = result
+        self.done += 1
+        self.audio_seconds += audio_seconds
+        self.report('{}: {:.1f} s of audio in {:.1f} s'.format(path, audio_seconds, seconds))
+
+    def summary(self, seconds):
+        throughput = self.audio_seconds / seconds if seconds else 0
+        self.report('{} files done, {} skipped, {} failed, {:.1f} s of audio in {:.1f} s, '
+                    '{:.1f} s of audio per second'.format(self.done, self.skipped, self.failed, self.audio_seconds,
+                                                           seconds, throughput))
+        return throughput
+
+
+@contextmanager
+def partial_output(output):
+    """ Opens a temporary file renamed to output once the with block completes, and removed if it fails. """
+    temporary = output + '.part'
+    try:
+        with open(temporary, 'wb') as output_fd:
+            yield output_fd
+    except BaseException:
+        os.remove(temporary)
+        raise
+    os.replace(temporary, output)
+
+
+def file_seed(seed, path):
+    # the seed of a file in a batch, derived from the seed and the name of the file, so it doesn't depend on
+    # the other files in the batch or on the order they're compressed in
+    if seed is None:
+        return None
+    return int(numpy.random.SeedSequence([seed, zlib.crc32(os.path.basename(path).encode())]).generate_state(1)[0])
+
+
+def compress_file(path, output, compression, jobs=1, bitrate=None, seed=None):
+    """ Compresses an audio file chunk by chunk, returns the seconds of audio and the time it took. """
+    start = perf_counter()
+    audio_format = get_audio_format(file_extension(path))
+    compressor = get_compression_format(compression)
+
+    with open(path, 'rb') as input_fd, partial_output(output) as output_fd:
+        audio_stream = audio_format.open_stream(input_fd)
+        compressor.compress_stream(audio_stream, output_fd, jobs, NO_STATS, bitrate, seed=seed)
+
+    return audio_stream.sample_count / audio_stream.sample_rate, perf_counter() - start
+
+
+def decompress_file(path, output, audio_format='wav'):
+    """ Decompresses a file chunk by chunk, returns the seconds of audio and the time it took. """
+    start = perf_counter()
+
+    with open(path, 'rb') as input_fd, partial_output(output) as output_fd:
+        audio_stream = AudioData.stream_compressed_file(input_fd, file_extension(path))
+        AudioData.write_audio_stream(audio_stream, output_fd, audio_format)
+
+    return audio_stream.sample_count / audio_stream.sample_rate, perf_counter() - start
+
+
+def decompress_file_task(args):
+    # unpacks the arguments of decompress_file, used as a picklable function for worker processes,
+    # returns the error of the file instead of raising it, so the other files go on
+    try:
+        return decompress_file(*args)
+    except Exception as e:
+        return e
@@ -0,0 +1,52 @@
+import mmap
+import os
+
+
+class MappedFile:
+    """ Read-only file object over a memory-mapped file.
+
+    Reads return memoryviews of the mapping instead of copies, so the matrices read from it (see deserialize_matrix)
+    are views of the page cache. They must be released before the file is closed.
+    """
+
+    def __init__(self, fd):
+        self.mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        self.position = 0
+
+    @staticmethod
+    def open(path):
+        with open(path, 'rb') as fd:
+            return MappedFile(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read(self, size=-1):
+        end = len(self.buffer) if size is None or size < 0 else min(self.position + size, len(self.buffer))
+        data = self.buffer[self.position:end]
+        self.position = end
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(memoryview(b).cast('B')))
+        memoryview(b).cast('B')[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += len(self.buffer)
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.buffer.release()
+        self.mmap.close()
@@ -2,20 +2,33 @@ import struct
 
 import numpy
 
+from audionmf.util.file_util import MappedFile
+
 
 def serialize_matrix(fd, matrix, dtype='f'):
-    dt = numpy.dtype(dtype)
-    matrix = matrix.astype(dt)
+    """ Writes the shape and the little-endian values of a 2D matrix, straight from its buffer. """
+    dt = numpy.dtype(dtype).newbyteorder('<')
+    matrix = numpy.ascontiguousarray(matrix, dtype=dt)
     fd.write(struct.pack('<II', matrix.shape[0], matrix.shape[1]))
-    fd.write(struct.pack('<' + dtype * matrix.size, *matrix.flat))
+    fd.write(matrix.reshape(-1).view(numpy.uint8))
 
 
 def deserialize_matrix(fd, dtype='f'):
-    dt = numpy.dtype(dtype)
-    dt = dt.newbyteorder('<')
+    """ Reads a matrix written by serialize_matrix directly into a newly allocated array.
+
+    From a MappedFile, returns a read-only view of the matrix in the mapping instead.
+    """
+    dt = numpy.dtype(dtype).newbyteorder('<')
     rows, cols = struct.unpack('<II', fd.read(8))
-    matrix = numpy.frombuffer(fd.read(rows * cols * dt.itemsize), dtype=dt)
-    matrix = numpy.reshape(matrix, newshape=(rows, cols))
+    if isinstance(fd, MappedFile):
+        data = fd.read(rows * cols * dt.itemsize)
+        if len(data) != rows * cols * dt.itemsize:
+            raise Exception('Unexpected end of file while reading a matrix.')
+        return numpy.frombuffer(data, dtype=dt).reshape(rows, cols)
+    matrix = numpy.empty((rows, cols), dtype=dt)
+    buffer = matrix.reshape(-1).view(numpy.uint8)
+    if fd.readinto(buffer) != buffer.size:
+        raise Exception('Unexpected end of file while reading a matrix.')
     return matrix
 
 
@@ -34,12 +47,67 @@ def array_pad_split(ary, n):
 
 
 def matrix_split(matrix, N):
-    """ Splits an X*Y matrix into X // N chunks sized N*Y without any padding at the end. """
+    """ Splits an X*Y matrix into chunks sized N*Y, the last one can be smaller. """
     # if N is None, return the original matrix as one chunk
     if N is None:
         return [matrix]
     submatrices = list()
-    for i in range((matrix.shape[0] // N) + 1):
+    for i in range(chunk_count(matrix.shape[0], N)):
         submatrix = matrix[i * N:i * N + N]
         submatrices.append(submatrix)
     return submatrices
+
+
+def chunk_count(rows, N):
+    """ Returns the amount of chunks matrix_split creates out of a matrix with the given amount of rows. """
+    if N is None:
+        return 1
+    return -(-rows // N)
+
+
+def signal_segments(blocks, frame_size, hop, frame_count, frames_per_segment, lead=0):
+    """ Turns a stream of sample blocks into overlapping segments, each covering frames_per_segment frames.
+
+    Frame k covers samples [k * hop, k * hop + frame_size) of the signal preceded by lead zeros and followed by
+    as many zeros as the last frame needs. Only the samples of the current segment are kept in memory.
+    """
+    buffer = None
+    # position of the first buffered sample in the zero-extended signal
+    offset = 0
+    frame = 0
+
+    def ready_segments(final):
+        nonlocal buffer, offset, frame
+        while frame < frame_count:
+            last_frame = min(frame + frames_per_segment, frame_count)
+            end = (last_frame - 1) * hop + frame_size - offset
+            if end > len(buffer):
+                if not final:
+                    return
+                buffer = numpy.concatenate((buffer, numpy.zeros(end - len(buffer), dtype=buffer.dtype)))
+            yield buffer[frame * hop - offset:end]
+            frame = last_frame
+            consumed = frame * hop - offset
+            buffer = buffer[consumed:]
+            offset += consumed
+
+    for block in blocks:
+        if buffer is None:
+            buffer = numpy.zeros(lead, dtype=block.dtype)
+        buffer = numpy.concatenate((buffer, block))
+        yield from ready_segments(False)
+
+    if buffer is None:
+        buffer = numpy.zeros(lead)
+    yield from ready_segments(True)
+
+
+def array_stream_slice(arrays, start, count):
+    """ Yields count elements of a stream of arrays, after skipping its first start elements. """
+    for ary in arrays:
+        if count <= 0:
+            break
+        part = ary[start:start + count]
+        start = max(start - len(ary), 0)
+        count -= len(part)
+        yield part
@@ -1,23 +1,265 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from time import perf_counter
+
 import numpy
+from threadpoolctl import threadpool_limits
 
 from audionmf.transforms.nmf import NMF
 
 
-def nmf_matrix(matrix, max_iter=100, rank=30):
+def nmf_matrix(matrix, max_iter=100, rank=30, update='euclidean', cost='euclidean', tol=0, check_interval=1,
+               rank_tol=None, silence=None, dtype='float64', seed=None, init='random', H_init=None):
+    # returns W, H, the value the matrix was incremented by and a dict of the rank, the iterations run,
+    # the last evaluated cost and the time spent
+    # with rank_tol, the rank is the lowest one up to the given rank reaching that relative error (see adaptive_rank)
+    # with silence, a matrix deviating from its mean by an RMS of at most silence is returned as a constant matrix
+    # (see constant_factors) without running NMF
+    # the factorization runs in the given floating point dtype (see NMF)
+    start = perf_counter()
+
+    if silence is not None and numpy.std(matrix) <= silence:
+        W, H, min_val = constant_factors(matrix.shape, numpy.mean(matrix))
+        return W, H, min_val, {'rank': 0, 'iterations': 0, 'cost': None, 'seconds': perf_counter() - start}
+
     # increment the matrix to make sure it's positive
     matrix_inc, min_val = increment_by_min(matrix)
 
-    # TODO save
-    # use Kullback-Leibler divergence
-    # nmf = nimfa.Nmf(matrix_inc, max_iter=max_iter, rank=rank, objective='div', update='divergence')()
-    # W = nmf.basis()
-    # H = nmf.coef()
+    if rank_tol is not None:
+        rank = adaptive_rank(matrix, matrix_inc, rank, rank_tol)
+
+    # the initial H only fits the same rank
+    if H_init is not None and len(H_init) != rank:
+        H_init = None
 
     # calculate NMF
-    nmf = NMF(matrix_inc, max_iter=max_iter, rank=rank)
+    nmf = NMF(matrix_inc, max_iter=max_iter, rank=rank, initialize=init, cost_func=cost, update=update, tol=tol,
+              check_interval=check_interval, dtype=dtype, seed=seed, H_init=H_init)
     W, H = nmf.factorize()
 
-    return W, H, min_val
+    info = {
+        'rank': rank,
+        'iterations': nmf.n_iter,
+        'cost': None if nmf.cost is None else float(nmf.cost),
+        'seconds': perf_counter() - start
+    }
+
+    return W, H, min_val, info
+
+
+def nmf_matrix_task(args):
+    # unpacks the arguments of nmf_matrix, used as a picklable function for worker processes
+    return nmf_matrix(*args)
+
+
+def random_state(seed=None):
+    # a random state of its own for the seed, otherwise the global one
+    return numpy.random if seed is None else numpy.random.RandomState(seed)
+
+
+def seeded(matrices, rank, random=numpy.random):
+    # pairs every matrix with its rank and its own seed drawn from the random state
+    for matrix in matrices:
+        yield matrix, rank(matrix) if callable(rank) else rank, random.randint(2 ** 31)
+
+
+def nmf_matrix_chain(seeded_matrices, max_iter, nmf_args, init):
+    # factorizes matrices in order, starting each one from the previous basis H if it has the same rank
+    H = None
+    for matrix, rank, seed in seeded_matrices:
+        W, H, min_val, info = nmf_matrix(matrix, max_iter, rank, *nmf_args, seed, init, H)
+        yield W, H, min_val, info
+
+
+def parallel_chains(seeded_lists, max_iter, nmf_args, init, jobs, blas_threads=None):
+    # runs nmf_matrix_chain on every list in a pool of worker processes, yielding the results in order
+    # every matrix is submitted once the previous one of its list is done, so the end of a list runs alongside the
+    # start of the next one, and at most two matrices per worker are taken ahead of the results
+    if not isinstance(jobs, WorkerPool):
+        with WorkerPool(jobs, blas_threads) as pool:
+            yield from parallel_chains(seeded_lists, max_iter, nmf_args, init, pool)
+        return
+
+    pool = jobs
+    pending = deque()
+    try:
+        for seeded_matrices in seeded_lists:
+            previous = None
+            for matrix, rank, seed in seeded_matrices:
+                # wait for the basis H of the previous matrix, consuming the results before it in the meantime
+                H = None
+                if previous is not None:
+                    while pending and not previous.done():
+                        yield pool.consume(pending)
+                    H = previous.result()[1]
+
+                item = (matrix, max_iter, rank) + nmf_args + (seed, init, H)
+                size = item_bytes(item)
+                while pending and (len(pending) >= 2 * pool.workers or not pool.fits(size)):
+                    yield pool.consume(pending)
+                pending.append(pool.submit(nmf_matrix_task, item, size))
+                previous = pending[-1][0]
+        while pending:
+            yield pool.consume(pending)
+    finally:
+        pool.cancel(pending)
+
+
+def nmf_matrices(matrix_lists, max_iter=100, rank=30, update='euclidean', cost='euclidean', tol=0, check_interval=1,
+                 init='random', warm_start=False, jobs=1, rank_tol=None, silence=None, dtype='float64',
+                 blas_threads=None, random=numpy.random):
+    """ Runs nmf_matrix on every matrix of every list, returning an iterator over the results in order.
+
+    The lists may be lazy, their matrices are taken as the results are consumed. With warm_start, every matrix starts
+    from the basis H of the previous one in its list. jobs is the amount of worker processes (0 uses all CPUs) or a
+    shared WorkerPool, every matrix gets its own seed drawn from random in order, so the results don't depend on it.
+    The rank may be a function of the matrix (see RateController), blas_threads limits the threads of BLAS.
+    """
+    nmf_args = (update, cost, tol, check_interval, rank_tol, silence, dtype)
+
+    if warm_start and jobs == 1:
+        chains = (nmf_matrix_chain(seeded(matrices, rank, random), max_iter, nmf_args, init)
+                  for matrices in matrix_lists)
+        return blas_limited(chain.from_iterable(chains), blas_threads)
+
+    if warm_start:
+        seeded_lists = (seeded(matrices, rank, random) for matrices in matrix_lists)
+        return parallel_chains(seeded_lists, max_iter, nmf_args, init, jobs, blas_threads)
+
+    tasks = ((matrix, max_iter, matrix_rank) + nmf_args + (seed, init)
+             for matrices in matrix_lists for matrix, matrix_rank, seed in seeded(matrices, rank, random))
+    if jobs == 1:
+        return blas_limited(map(nmf_matrix_task, tasks), blas_threads)
+    return parallel_map(nmf_matrix_task, tasks, jobs, blas_threads)
+
+
+def blas_limited(results, threads):
+    # yields the lazily computed results with BLAS limited to the given amount of threads, unless it's None
+    if threads is None:
+        return results
+    return limited_results(results, threads)
+
+
+def limited_results(results, threads):
+    with threadpool_limits(threads, user_api='blas'):
+        yield from results
+
+
+def limit_blas_threads(threads):
+    # initializer of worker processes, the limit lasts for the whole life of the process
+    if threads is not None:
+        threadpool_limits(threads, user_api='blas')
+
+
+def parallel_map(func, items, jobs, blas_threads=None):
+    """ Lazily yields func(item) for each item in order, computed in a pool of worker processes.
+
+    Only a few items per worker are taken ahead of the results, so the items can come from a stream.
+    The BLAS library of every worker uses at most blas_threads threads, if given. If jobs is a WorkerPool,
+    the items are computed in that pool instead of a new one.
+    """
+    if isinstance(jobs, WorkerPool):
+        yield from jobs.map(func, items)
+        return
+
+    with WorkerPool(jobs, blas_threads) as pool:
+        yield from pool.map(func, items)
+
+
+class WorkerPool:
+    """ A pool of worker processes, which can be shared by several threads mapping functions over their items.
+
+    The workers take the items in the order they were submitted from all the threads, so every worker is kept busy
+    for as long as any thread has items left. With a memory budget (in bytes), the arrays of the items submitted and
+    not yet consumed are limited to it, a thread waits before submitting more until other threads consume theirs.
+    """
+
+    def __init__(self, jobs=0, blas_threads=None, memory=None):
+        # jobs is the amount of workers, 0 uses all available CPUs
+        self.workers = jobs or os.cpu_count()
+        self.memory = memory
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=limit_blas_threads,
+                                            initargs=(blas_threads,))
+
+        # the executor only starts its workers on the first submit, which may come from one of several threads,
+        # forking while other threads run can deadlock, so they're all started now by a task each
+        for future in [self.executor.submit(int) for _ in range(self.workers)]:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def map(self, func, items):
+        """ Lazily yields func(item) for each item in order, taking a few items per worker ahead of the results. """
+        pending = deque()
+        try:
+            for item in items:
+                size = item_bytes(item)
+
+                # make room by consuming the own results first, waiting for other threads only when there are none
+                while pending and not self.fits(size):
+                    yield self.consume(pending)
+
+                pending.append(self.submit(func, item, size))
+                if len(pending) >= 2 * self.workers:
+                    yield self.consume(pending)
+            while pending:
+                yield self.consume(pending)
+        finally:
+            self.cancel(pending)
+
+    def submit(self, func, item, size):
+        # submits func(item) once the size of its arrays fits into the memory budget, returns the future and the size
+        self.reserve(size)
+        return self.executor.submit(func, item), size
+
+    def cancel(self, pending):
+        # the results nobody is going to consume, e.g. after an error
+        while pending:
+            future, size = pending.popleft()
+            future.cancel()
+            self.release(size)
+
+    def fits(self, size):
+        # anything fits when nothing is in flight, so a single item over the budget doesn't block forever
+        return self.memory is None or self.in_flight == 0 or self.in_flight + size <= self.memory
+
+    def reserve(self, size):
+        with self.condition:
+            self.condition.wait_for(lambda: self.fits(size))
+            self.in_flight += size
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+    def consume(self, pending):
+        future, size = pending.popleft()
+        try:
+            return future.result()
+        finally:
+            self.release(size)
+
+
+def item_bytes(item):
+    # the bytes of all the arrays in an item, also within tuples and lists
+    if isinstance(item, numpy.ndarray):
+        return item.nbytes
+    if isinstance(item, (tuple, list)):
+        return sum(item_bytes(part) for part in item)
+    return 0
 
 
 def nmf_matrix_original(W, H, min_val):
@@ -27,6 +269,30 @@ def nmf_matrix_original(W, H, min_val):
     return matrix
 
 
+def constant_factors(shape, value):
+    # returns W, H and min_val of a matrix filled with the value, W and H have a rank of 0,
+    # so the matrix is stored in a few bytes and nmf_matrix_original fills it with -min_val
+    return numpy.zeros((shape[0], 0)), numpy.zeros((0, shape[1])), -float(value)
+
+
+def adaptive_rank(matrix, matrix_inc, max_rank, rank_tol):
+    """ Returns the lowest rank up to max_rank at which the incremented matrix can be approximated with an error of
+    at most rank_tol relative to the original matrix.
+
+    The error of the best approximation of every rank follows from the singular values, it's a lower bound for NMF,
+    so silent or simple chunks get a low rank without trying to factorize them.
+    """
+    singular_values = numpy.linalg.svd(matrix_inc, compute_uv=False)
+
+    # errors[r] is the error of the best approximation of rank r
+    errors = numpy.sqrt(numpy.cumsum((singular_values ** 2)[::-1])[::-1])
+    limit = rank_tol * numpy.linalg.norm(matrix)
+    enough = numpy.flatnonzero(errors <= limit)
+
+    rank = enough[0] if len(enough) else len(singular_values)
+    return int(min(max(rank, 1), max_rank))
+
+
 def increment_by_min(matrix):
     # increments matrix by its lowest value and returns the structure and the absolute value
     min_val = abs(numpy.amin(matrix))
@@ -0,0 +1,26 @@
+from collections.abc import Mapping
+from importlib import import_module
+
+
+class LazyRegistry(Mapping):
+    """ A mapping of names to classes, which are only imported once they're looked up.
+
+    Every class is given by its import path, 'package.module:ClassName', so listing or checking the names doesn't
+    import anything, and looking up one name only imports the module of that class.
+    """
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self.classes = dict()
+
+    def __getitem__(self, name):
+        if name not in self.classes:
+            module_name, class_name = self.paths[name].split(':')
+            self.classes[name] = getattr(import_module(module_name), class_name)
+        return self.classes[name]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
@@ -0,0 +1,104 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+
+class Stats:
+    """ Metrics of a compression, the wall time spent in every stage and the details of every chunk.
+
+    The time of a stage doesn't include the stages nested in it, e.g. the lazy transform of the chunks while waiting
+    for their NMF results, so the stages add up to at most the wall time of the whole run. The callback, if given,
+    is called with the metrics of every chunk as soon as it's written.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = dict()
+        self.chunks = list()
+        # the time of the stages nested in every stage that's running, innermost last
+        self.nested = list()
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """ Adds the time spent in the with block to the stage. """
+        start = self.start_stage()
+        try:
+            yield
+        finally:
+            self.end_stage(name, start)
+
+    def timed(self, stage, iterable):
+        """ Yields the items of a lazy iterable, adding the time spent producing them to the stage. """
+        iterator = iter(iterable)
+        while True:
+            start = self.start_stage()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.end_stage(stage, start)
+            yield item
+
+    def start_stage(self):
+        self.nested.append(0)
+        return perf_counter()
+
+    def end_stage(self, stage, start):
+        # adds the time since start to the stage, except the time of the stages nested in it, to which it adds all of it
+        seconds = perf_counter() - start
+        self.add_time(stage, seconds - self.nested.pop())
+        if self.nested:
+            self.nested[-1] += seconds
+
+    def add_chunk(self, channels, frame_count, size, nmf_info):
+        """ Records a written chunk of the channels, its size in bytes and the NMF info (see nmf_matrix).
+
+        The NMF seconds of the chunk are the time its factorization took in whichever process ran it, the stages only
+        count the time spent waiting for the results (see timed).
+        """
+        metrics = {
+            'channels': list(channels),
+            'frames': frame_count,
+            'bytes': size,
+            'nmf_rank': nmf_info['rank'],
+            'nmf_iterations': nmf_info['iterations'],
+            'nmf_cost': nmf_info['cost'],
+            'nmf_seconds': nmf_info['seconds']
+        }
+        self.chunks.append(metrics)
+
+        if self.callback is not None:
+            self.callback(metrics)
+
+    def as_dict(self):
+        return {
+            'stages': dict(self.stages),
+            'chunk_count': len(self.chunks),
+            'bytes': sum(chunk['bytes'] for chunk in self.chunks),
+            'nmf_iterations': sum(chunk['nmf_iterations'] for chunk in self.chunks),
+            'chunks': self.chunks
+        }
+
+
+class NoStats:
+    """ Used in place of Stats when no metrics are collected, does nothing. """
+
+    null_context = nullcontext()
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def stage(self, name):
+        return self.null_context
+
+    def timed(self, stage, iterable):
+        return iterable
+
+    def add_chunk(self, channels, frame_count, size, nmf_info):
+        pass
+
+
+NO_STATS = NoStats()
@@ -15,7 +15,8 @@ setuptools.setup(
         "click",
         "scipy>=1.2.0",
         "numpy",
-        "dahuffman"
+        "dahuffman",
+        "threadpoolctl"
     ],
 
     setup_requires=["pytest-runner"],
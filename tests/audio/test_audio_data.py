@@ -0,0 +1,93 @@
+import io
+import struct
+
+import numpy
+from scipy.io import wavfile
+
+from audionmf.audio.audio_data import AudioData
+from audionmf.audio.audio_stream import AudioStream
+from audionmf.fileformats.audio_format_wav import AudioFormatWAV
+
+
+def test_audio_data_channels():
+    audio = AudioData()
+    audio.allocate(10, 2)
+
+    # channels are views of the interleaved samples
+    audio.fill([numpy.arange(4).reshape(-1, 1), numpy.arange(4, 20).reshape(-1, 1)], [1])
+    assert numpy.array_equal(audio.channels[1].samples, numpy.arange(10))
+    assert not audio.samples[:, 0].any()
+
+
+def test_audio_data_wav():
+    numpy.random.seed(0)
+    samples = numpy.random.randint(1, 2 ** 15, (100, 2)).astype(numpy.int16)
+    wav = io.BytesIO()
+    wavfile.write(wav, 44100, samples)
+
+    wav.seek(0)
+    audio = AudioData.from_audio_file(wav, 'wav')
+    assert numpy.array_equal(audio.samples, samples)
+    assert numpy.array_equal(audio.channels[1].samples, samples[:, 1])
+
+    output = io.BytesIO()
+    audio.write_audio_file(output, 'wav')
+    assert output.getvalue() == wav.getvalue()
+
+
+def test_audio_data_wav_mono():
+    wav = io.BytesIO()
+    wavfile.write(wav, 8000, numpy.array([0, 1, -1, 5], dtype=numpy.int16))
+
+    wav.seek(0)
+    audio = AudioData.from_audio_file(wav, 'wav')
+
+    # zeros are replaced by ones
+    assert len(audio.channels) == 1
+    assert list(audio.channels[0].samples) == [1, 1, -1, 5]
+
+
+class PipeOutput(io.BytesIO):
+    # an output that can't be seeked, like stdout redirected to a pipe
+    def seekable(self):
+        return False
+
+    def seek(self, *args):
+        raise OSError('Illegal seek')
+
+    def tell(self):
+        raise OSError('Illegal seek')
+
+
+def test_audio_data_wav_stream_pipe():
+    samples = numpy.random.RandomState(0).randint(-2 ** 15, 2 ** 15, (100, 2)).astype(numpy.int16)
+    wav = io.BytesIO()
+    wavfile.write(wav, 44100, samples)
+
+    # written in several blocks, the output is the same file scipy writes
+    output = PipeOutput()
+    stream = AudioStream(44100, 2, 100, iter([samples[:30], samples[30:70], samples[70:]]))
+    AudioData.write_audio_stream(stream, output, 'wav')
+    assert output.getvalue() == wav.getvalue()
+
+
+def test_audio_data_wav_stream_extensible():
+    samples = numpy.random.RandomState(0).randint(-2 ** 15, 2 ** 15, (1000, 2)).astype(numpy.int16)
+
+    # a WAVE_FORMAT_EXTENSIBLE file with PCM samples and a chunk of odd length before the data
+    fmt = struct.pack('<HHIIHHHHI', 0xFFFE, 2, 8000, 8000 * 4, 4, 16, 22, 16, 3)
+    fmt += b'\x01\x00\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+    data = samples.astype('<i2').tobytes()
+    chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'LIST\x03\x00\x00\x00abc\x00' + \
+        b'data' + struct.pack('<I', len(data)) + data
+    wav = io.BytesIO(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks)
+
+    audio = AudioData.from_audio_file(wav, 'wav')
+    stream = AudioFormatWAV().open_stream(wav)
+    assert (stream.sample_rate, stream.channel_count, stream.sample_count) == (8000, 2, 1000)
+
+    # both channels read side by side, in blocks, like the in-memory path reads them
+    left, right = stream.read_channel(0, 300), stream.read_channel(1, 300)
+    blocks = [numpy.column_stack(pair) for pair in zip(left, right)]
+    assert [len(block) for block in blocks] == [300, 300, 300, 100]
+    assert numpy.array_equal(numpy.concatenate(blocks), audio.samples)
@@ -0,0 +1,60 @@
+import io
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+from audionmf.nmfcompression.bitrate import RateController
+
+
+def test_rate_controller():
+    # 1000 bits per row, 100 bits per chunk and 10 bits per row and column for every unit of rank
+    controller = RateController(1, 10, 10, lambda rows, cols: (100, 10 * (rows + cols)))
+    matrix = numpy.zeros((10, 15))
+
+    # 10000 - 100 bits left for the rank, the rest is carried over
+    assert controller(matrix) == 10
+    assert controller.reservoir == 10000 - 100 - 10 * 250
+    assert controller(matrix) == 10
+
+    # the rank is limited by the dimensions of the matrix and at least 1
+    assert controller(numpy.zeros((2, 15))) == 2
+    controller.reservoir = -10 ** 6
+    assert controller(matrix) == 1
+
+    # the actual sizes replace the estimates in order
+    controller.reservoir = 0
+    controller.written(3000)
+    assert controller.reservoir == 2600 - 3000
+
+
+def test_bitrate_compress():
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 44100
+    audio.allocate(44100 * 3, 2)
+    audio.samples[:] = numpy.random.randint(1, 1000, audio.samples.shape)
+
+    for scheme, bitrate in [('anmfs', 330), ('anmfm', 200), ('anmfr', 200)]:
+        compressor = compression_schemes[scheme]()
+        compressor.NMF_MAX_ITER = 5
+        f = io.BytesIO()
+        compressor.compress(audio, f, bitrate=bitrate)
+
+        # the size is within a few percent of the target
+        # the target is met up to the estimate of the last chunk, the rank is a coarse step for a single chunk
+        assert 0.9 * bitrate < len(f.getvalue()) * 8 / 3 / 1000 < 1.01 * bitrate
+
+
+def test_bitrate_below_lowest(capsys):
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 44100
+    audio.allocate(44100, 1)
+    audio.samples[:] = numpy.random.randint(1, 1000, audio.samples.shape)
+
+    # the phases alone take more than 100 kbit/s, the chunks get a rank of 1 and the target is overshot with a warning
+    for bitrate, warned in [(100, True), (300, False)]:
+        compressor = compression_schemes['anmfs']()
+        compressor.NMF_MAX_ITER = 5
+        compressor.compress(audio, io.BytesIO(), bitrate=bitrate)
+        assert ('below the lowest one' in capsys.readouterr().err) == warned
@@ -0,0 +1,60 @@
+import io
+
+import numpy
+import pytest
+
+from audionmf.nmfcompression.container import ContainerWriter, ContainerReader
+
+
+def write_container(frame_counts):
+    f = io.BytesIO()
+    f.write(b'prefix')
+    container = ContainerWriter(f, b'M', 2, 44100, 1000, len(frame_counts), b'ext')
+    for channel in range(2):
+        for i, frame_count in enumerate(frame_counts):
+            container.add_chunk(channel, frame_count)
+            # every chunk is its frames written as 8-bit values
+            f.write(bytes([frame_count]) + bytes(range(100 * channel + i, 100 * channel + i + frame_count)))
+    container.close()
+    f.seek(len(b'prefix'))
+    return f
+
+
+def read_chunk(f):
+    frame_count = f.read(1)[0]
+    return numpy.frombuffer(f.read(frame_count), dtype=numpy.uint8)
+
+
+def test_container_index():
+    container = ContainerReader(write_container([3, 4, 2]), b'M')
+
+    assert (container.channel_count, container.sample_rate, container.sample_count) == (2, 44100, 1000)
+    assert container.extension == b'ext'
+    assert list(container.index[1]['first_frame']) == [0, 3, 7]
+    assert list(container.index[1]['frame_count']) == [3, 4, 2]
+
+    # the chunks are stored one after another, channel by channel
+    assert list(numpy.diff(container.index.reshape(-1)['offset'])) == [4, 5, 3, 4, 5]
+
+
+def test_container_read_frames():
+    container = ContainerReader(write_container([3, 4, 2]), b'M')
+
+    # frames 2 to 5 lie in the first two chunks, the second one starts at frame 3
+    frames = list(container.read_frames(1, 2, 6, read_chunk))
+    assert [list(part) for part in frames] == [[102], [101, 102, 103]]
+
+    assert list(container.read_frames(0, 9, 9, read_chunk)) == []
+
+
+def test_container_invalid():
+    with pytest.raises(Exception):
+        ContainerReader(write_container([1]), b'S')
+
+    with pytest.raises(Exception):
+        ContainerReader(io.BytesIO(b'ANMFCM\x09\x00' + bytes(20)), b'M')
+
+    # version 1 files are left to the legacy decoders right after their magic
+    f = io.BytesIO(b'ANMFM' + bytes(20))
+    assert ContainerReader(f, b'M').version == 1
+    assert f.tell() == 5
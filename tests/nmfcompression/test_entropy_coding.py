@@ -0,0 +1,40 @@
+import io
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+
+
+def test_entropy_coding_compress():
+    audio = AudioData()
+    audio.sample_rate = 8000
+    audio.allocate(8000, 2)
+    audio.samples[:] = numpy.random.RandomState(0).randint(1, 1000, (8000, 2))
+
+    files = list()
+    decoded = list()
+    for coder, adaptive in [('huffman', False), ('huffman', True), ('rans', False), ('rans', True)]:
+        compressor = compression_schemes['anmfs']()
+        compressor.NMF_MAX_ITER = 5
+        compressor.NMF_CHUNK_SIZE = 5
+        compressor.PHASE_CODER = compressor.H_CODER = coder
+        compressor.ADAPTIVE_TABLES = adaptive
+
+        numpy.random.seed(0)
+        f = io.BytesIO()
+        compressor.compress(audio, f)
+        files.append(f.getvalue())
+
+        # files coded with any of the settings are read by a compressor with the default ones
+        f.seek(0)
+        decoded.append(AudioData())
+        compression_schemes['anmfs']().decompress(f, decoded[-1])
+
+        f.seek(0)
+        stream = compressor.decompress_stream(f, 0.2, 0.4)
+        assert numpy.array_equal(numpy.concatenate(list(stream.blocks)), decoded[-1].samples[1600:3200])
+
+    # the coders and tables only change the coding of the same quantized values
+    assert len(files[1]) < len(files[0]) and len(files[3]) < len(files[1])
+    for samples in decoded[1:]:
+        assert numpy.array_equal(samples.samples, decoded[0].samples)
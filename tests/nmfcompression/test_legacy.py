@@ -0,0 +1,95 @@
+import io
+import struct
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+from audionmf.transforms.huffman import huffman_coder
+from audionmf.transforms.mdct import mdct
+from audionmf.transforms.quantization import uniform_quantizer, mu_law_compand_array
+from audionmf.transforms.stft import stft, istft
+from audionmf.util.matrix_util import serialize_matrix
+
+
+def write_nmf_chunk(f, matrix):
+    # the matrix as the factors matrix x identity, shifted to be non-negative like version 1 did
+    min_val = -min(numpy.amin(matrix), 0)
+    f.write(struct.pack('<d', min_val))
+    serialize_matrix(f, matrix + min_val)
+    serialize_matrix(f, numpy.identity(matrix.shape[1]))
+
+
+def decompress(scheme, data, start=0, end=None):
+    # decompresses the file both in memory and streamed
+    compressor = compression_schemes[scheme]()
+    audio = AudioData()
+    compressor.decompress(io.BytesIO(data), audio)
+    stream = compressor.decompress_stream(io.BytesIO(data), start, end)
+    return audio, stream.sample_count, numpy.concatenate(list(stream.blocks))
+
+
+def test_legacy_raw():
+    signals = numpy.arange(2 * 30).reshape(2, 30) * 10 - 100
+
+    f = io.BytesIO()
+    f.write(b'ANMFR' + struct.pack('<HI', 2, 8000))
+    for signal in signals:
+        # two 4x5 matrices, the second one padded by 10 samples
+        f.write(struct.pack('<II', 10, 2))
+        padded = numpy.pad(signal, (0, 10)).astype(numpy.float32)
+        write_nmf_chunk(f, padded[:20].reshape(4, 5))
+        write_nmf_chunk(f, padded[20:].reshape(4, 5))
+
+    audio, sample_count, samples = decompress('anmfr', f.getvalue(), 1 / 800)
+    assert audio.sample_rate == 8000
+    assert numpy.array_equal(audio.samples, signals.T)
+    assert sample_count == 20
+    assert numpy.array_equal(samples, signals.T[10:])
+
+
+def test_legacy_mdct():
+    signals = numpy.random.RandomState(0).randint(-1000, 1000, (2, 1000))
+
+    f = io.BytesIO()
+    f.write(b'ANMFM' + struct.pack('<HI', 2, 8000))
+    for signal in signals:
+        mdct_matrix, padding = mdct(signal, 576)
+        f.write(struct.pack('<II', padding, 2))
+        write_nmf_chunk(f, mdct_matrix[:2].astype(numpy.float32))
+        write_nmf_chunk(f, mdct_matrix[2:].astype(numpy.float32))
+
+    audio, _, samples = decompress('anmfm', f.getvalue())
+    assert audio.samples.shape == (1000, 2)
+    assert numpy.abs(audio.samples - signals.T).max() <= 1
+    assert numpy.array_equal(samples, audio.samples)
+
+
+def test_legacy_stft():
+    signal = (numpy.sin(numpy.arange(5000) / 10) * 5000).astype(numpy.int16)
+    stft_matrix = stft(signal, 8000, 1152, numpy.float64)
+    magnitudes = numpy.absolute(stft_matrix)
+
+    # W holds the magnitudes and H is the identity, both scaled by matrix_max, so only the phases lose precision
+    matrix_max = numpy.sqrt(numpy.amax(magnitudes))
+    Wscs = mu_law_compand_array(magnitudes / matrix_max ** 2, 10 ** 4) * 2 ** 32
+    Hscq = numpy.identity(magnitudes.shape[1], dtype=int) * 31
+    Pq = uniform_quantizer(-numpy.pi, numpy.pi, 2 ** 3).quantize_array(numpy.angle(stft_matrix))
+    Pout, Prows = huffman_coder('stftp').encode_int_matrix(Pq)
+    Hout, Hrows = huffman_coder('stft32').encode_int_matrix(Hscq)
+
+    f = io.BytesIO()
+    f.write(b'ANMFS' + struct.pack('<HI', 1, 8000))
+    f.write(struct.pack('<I', 1))
+    f.write(struct.pack('<II', Prows, len(Pout)) + Pout)
+    f.write(struct.pack('<ddd', 0, 0, matrix_max))
+    serialize_matrix(f, numpy.minimum(Wscs, 2 ** 32 - 1).astype(numpy.uint32), 'I')
+    f.write(struct.pack('<II', Hrows, len(Hout)) + Hout)
+
+    # the signal is reconstructed with its phases quantized and its padding kept
+    phases = uniform_quantizer(-numpy.pi, numpy.pi, 2 ** 3).dequantize_array(Pq)
+    expected = istft(magnitudes * numpy.exp(1j * phases), 8000, 1152).astype(numpy.int16)
+
+    audio, _, samples = decompress('anmfs', f.getvalue())
+    assert audio.samples.shape == (len(expected), 1)
+    assert numpy.abs(audio.samples[:, 0].astype(int) - expected).max() <= 1
+    assert numpy.array_equal(samples, audio.samples)
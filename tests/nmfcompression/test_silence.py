@@ -0,0 +1,41 @@
+import io
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+from audionmf.util.stats_util import Stats
+
+
+def test_silence_compress():
+    # a second of silence (zeros replaced by ones) and a second of DC offset on the left, then noise
+    audio = AudioData()
+    audio.sample_rate = 44100
+    audio.allocate(44100 * 3, 2)
+    audio.samples[:] = 1
+    audio.samples[44100:88200, 0] = 300
+    audio.samples[88200:] = numpy.random.RandomState(0).randint(1, 1000, (44100, 2))
+
+    for scheme in ['anmfs', 'anmfm', 'anmfr']:
+        compressor = compression_schemes[scheme]()
+        compressor.NMF_MAX_ITER = 5
+        if scheme == 'anmfr':
+            compressor.CHUNK_SHAPE = (147, 300)
+        else:
+            compressor.NMF_CHUNK_SIZE = 20
+        stats = Stats()
+        f = io.BytesIO()
+        compressor.compress(audio, f, stats=stats)
+
+        # the silent chunks skip NMF
+        ranks = [chunk['nmf_rank'] for chunk in stats.chunks]
+        assert ranks[0] == 0 and ranks[-1] > 0
+
+        f.seek(0)
+        decompressed = AudioData()
+        compressor.decompress(f, decompressed)
+        assert numpy.abs(decompressed.samples[:22050].astype(int) - 1).max() <= 2
+
+        if scheme == 'anmfr':
+            # samples are constant within every matrix, so the DC offset is kept exactly
+            assert ranks.count(0) == 4
+            assert numpy.array_equal(decompressed.samples[:88200], audio.samples[:88200])
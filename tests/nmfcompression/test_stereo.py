@@ -0,0 +1,89 @@
+import io
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+from audionmf.nmfcompression.stereo import stereo_modes, stereo_extension, read_stereo_extension, mid_side, \
+    left_right, channel_frames, split_channels
+
+
+def test_stereo_extension():
+    assert stereo_modes(1, True, True) == (False, False)
+    assert stereo_modes(3, True, True) == (False, True)
+
+    for modes in [(False, False), (True, False), (False, True), (True, True)]:
+        assert read_stereo_extension(stereo_extension(*modes)) == modes
+    assert read_stereo_extension(b'') == (False, False)
+
+
+def test_mid_side():
+    samples = numpy.array([[2 ** 15 - 1, 2 ** 15 - 1], [-2 ** 15, 2 ** 15 - 1], [100, -50], [7, 7]],
+                          dtype=numpy.int16)
+
+    coded = mid_side(samples)
+    assert coded.dtype == numpy.int16
+    assert coded.tolist() == [[2 ** 15 - 1, 0], [-1, -2 ** 15], [25, 75], [7, 0]]
+
+    # rounding loses at most the lowest bit, equal samples stay equal
+    decoded = left_right(coded)
+    assert numpy.abs(decoded.astype(int) - samples).max() <= 1
+    assert decoded[0].tolist() == [2 ** 15 - 1, 2 ** 15 - 1]
+    assert decoded[3].tolist() == [7, 7]
+
+
+def test_split_channels():
+    chunks = [numpy.arange(12).reshape(4, 3), numpy.arange(12, 24).reshape(4, 3)]
+
+    frames = [channel_frames(chunk, 2) for chunk in chunks]
+    assert frames[0].shape == (2, 2, 3)
+
+    left, right = split_channels(iter(frames), 2)
+    assert [chunk.tolist() for chunk in left] == [[[0, 1, 2], [3, 4, 5]], [[12, 13, 14], [15, 16, 17]]]
+    assert [chunk.tolist() for chunk in right] == [[[6, 7, 8], [9, 10, 11]], [[18, 19, 20], [21, 22, 23]]]
+
+
+def test_joint_stereo_roundtrip():
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 8000
+    audio.allocate(5000, 2)
+    audio.samples[:, 0] = numpy.random.randint(1, 1000, 5000)
+    audio.samples[:, 1] = audio.samples[:, 0] // 2 + 1
+
+    for scheme in ['anmfs', 'anmfm', 'anmfr']:
+        compressor = compression_schemes[scheme]()
+        compressor.NMF_MAX_ITER = 5
+        compressor.MID_SIDE = compressor.JOINT_STEREO = True
+
+        f = io.BytesIO()
+        compressor.compress(audio, f)
+        f.seek(0)
+        decoded = AudioData()
+        compressor.decompress(f, decoded)
+
+        # decoding a range gives the same samples as decoding everything
+        f.seek(0)
+        stream = compressor.decompress_stream(f, 0.2, 0.4)
+        assert numpy.array_equal(numpy.concatenate(list(stream.blocks)), decoded.samples[1600:3200])
+        assert decoded.samples.shape == audio.samples.shape
+
+
+def test_mid_side_dual_mono():
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 8000
+    audio.allocate(5000, 2)
+    audio.samples[:, 0] = audio.samples[:, 1] = numpy.random.randint(1, 1000, 5000)
+
+    # the side channel is all 0s, so both channels decode the same
+    for scheme in ['anmfs', 'anmfm', 'anmfr']:
+        compressor = compression_schemes[scheme]()
+        compressor.NMF_MAX_ITER = 5
+        compressor.MID_SIDE = True
+
+        f = io.BytesIO()
+        compressor.compress(audio, f)
+        f.seek(0)
+        decoded = AudioData()
+        compressor.decompress(f, decoded)
+        assert numpy.array_equal(decoded.samples[:, 0], decoded.samples[:, 1])
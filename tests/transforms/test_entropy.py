@@ -0,0 +1,33 @@
+import io
+
+import numpy
+import pytest
+
+from audionmf.transforms.entropy import fit_coder, read_coder
+from audionmf.transforms.huffman import HuffmanCoder, huffman_coder
+from audionmf.transforms.rans import RANSCoder, rans_coder
+
+
+@pytest.mark.parametrize('backend', ['huffman', 'rans'])
+def test_fit_coder(backend):
+    ary = numpy.minimum(numpy.random.RandomState(0).geometric(0.7, (50, 40)) - 1, 31)
+
+    builtin, builtin_table = fit_coder(ary, 'stft32', backend, adaptive=False)
+    coder, table = fit_coder(ary, 'stft32', backend)
+    assert type(coder) is type(builtin) and coder is not builtin
+
+    data, rows = coder.encode_int_matrix(ary)
+    assert len(table) + len(data) < len(builtin_table) + len(builtin.encode_int_array(ary))
+    assert numpy.array_equal(read_coder(io.BytesIO(table), 'stft32').decode_int_matrix(data, rows), ary)
+
+
+def test_fit_coder_builtin():
+    # the built-in coders are kept where they're as good
+    ary = numpy.arange(8).repeat(100)
+    assert fit_coder(ary, 'stftp') == (huffman_coder('stftp'), b'\x00')
+    assert fit_coder(ary, 'stftp', 'rans') == (rans_coder('stftp'), b'\x02')
+
+    assert read_coder(io.BytesIO(b'\x00'), 'stftp') is huffman_coder('stftp')
+    assert read_coder(io.BytesIO(b'\x02'), 'stftp') is rans_coder('stftp')
+    assert isinstance(read_coder(io.BytesIO(b'\x01\x43\x33\x33\x33\x40'), 'stftp'), HuffmanCoder)
+    assert isinstance(read_coder(io.BytesIO(b'\x03' + numpy.full(8, 512, '<u2').tobytes()), 'stftp'), RANSCoder)
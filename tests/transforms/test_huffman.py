@@ -0,0 +1,68 @@
+import numpy
+import pytest
+
+from audionmf.transforms.huffman import HuffmanCoder, frequencies, huffman_coder, huffman_code_lengths
+
+
+@pytest.mark.parametrize('method', ['stftp', 'stft32'])
+def test_huffman_compatible(method):
+    coder = HuffmanCoder(method)
+    numpy.random.seed(0)
+
+    for size in [0, 1, 5, 8, 1000]:
+        ary = numpy.random.randint(0, len(frequencies[method]), size)
+
+        encoded = coder.encode_int_array(ary)
+
+        assert encoded == coder.codec.encode(ary.tolist())
+        assert coder.decode_int_array(encoded).tolist() == coder.codec.decode(encoded)
+
+
+def test_huffman_matrix():
+    coder = HuffmanCoder('stft32')
+    coder.SEGMENT_BITS = 16
+    coder.BATCH_SEGMENTS = 2
+    numpy.random.seed(0)
+    matrix = numpy.random.randint(0, 32, (20, 15))
+
+    encoded, rows = coder.encode_int_matrix(matrix)
+    decoded = coder.decode_int_matrix(encoded, rows)
+
+    assert decoded.dtype == numpy.int8
+    assert numpy.array_equal(decoded, matrix)
+
+
+def test_huffman_invalid_value():
+    coder = HuffmanCoder('stftp')
+
+    with pytest.raises(KeyError):
+        coder.encode_int_array([0, 8])
+
+
+def test_huffman_decode_stream():
+    numpy.random.seed(0)
+    huffman = HuffmanCoder('stft32')
+    huffman.SEGMENT_BITS = 16
+    huffman.BATCH_SEGMENTS = 3
+    ary = numpy.random.randint(0, 32, 1000)
+    data = huffman.encode_int_array(ary)
+
+    # split the bitstream at arbitrary bytes
+    blocks = [data[:1], data[1:2], data[2:100], data[100:101], data[101:]]
+
+    assert numpy.array_equal(numpy.concatenate(list(huffman.decode_stream(iter(blocks)))), ary)
+
+
+def test_huffman_coder_shared():
+    assert huffman_coder('stftp') is huffman_coder('stftp')
+    assert huffman_coder('stftp') is not huffman_coder('stft32')
+
+
+def test_huffman_code_lengths():
+    counts = 2 ** numpy.arange(20)
+    for max_len in [19, 8]:
+        lengths = huffman_code_lengths(counts, max_len)
+        assert lengths.max() <= max_len
+        assert numpy.sum(2.0 ** -lengths) == 1
+
+    assert huffman_code_lengths([0, 5, 0]).tolist() == [0, 1, 0]
@@ -1,6 +1,7 @@
 import numpy
 
-from audionmf.transforms.mdct import mdct, imdct
+from audionmf.transforms.mdct import mdct, imdct, mdct_fast, imdct_fast, mdct_row_count, mdct_stream, \
+    imdct_stream
 
 
 def test_mdct_slow():
@@ -36,3 +37,50 @@ def test_mdct_both():
     imdct_slow = imdct(mdct_slow, padding, True)
 
     assert numpy.allclose(imdct_fast, imdct_slow)
+
+
+def test_mdct_float32():
+    signal = numpy.cos(numpy.linspace(0, 8 * numpy.pi, 1000)) * 1000
+
+    mdct_double, padding = mdct(signal, 4)
+    mdct_single, _ = mdct(signal, 4, dtype=numpy.float32)
+
+    assert mdct_single.dtype == numpy.float32
+    assert numpy.allclose(mdct_single, mdct_double, rtol=1e-4, atol=1e-2)
+
+
+def test_mdct_fast_batched():
+    blocks = numpy.random.rand(10, 8)
+
+    mdct_batch = mdct_fast(blocks)
+    mdct_rows = numpy.array([mdct_fast(block) for block in blocks])
+
+    assert numpy.allclose(mdct_batch, mdct_rows)
+
+    imdct_batch = imdct_fast(mdct_batch)
+    imdct_rows = numpy.array([imdct_fast(row) for row in mdct_rows])
+
+    assert numpy.allclose(imdct_batch, imdct_rows)
+
+
+def test_mdct_stream():
+    numpy.random.seed(0)
+    signal = numpy.random.randint(-2 ** 15, 2 ** 15, 5000).astype(numpy.int16)
+    blocks = numpy.array_split(signal, 7)
+
+    mdct_matrix, _ = mdct(signal, 64)
+    chunks = list(mdct_stream(iter(blocks), 64, len(signal), 10))
+
+    assert mdct_row_count(len(signal), 64)[0] == len(mdct_matrix)
+    assert all(len(chunk) == 10 for chunk in chunks[:-1])
+    assert numpy.array_equal(numpy.concatenate(chunks), mdct_matrix)
+
+
+def test_imdct_stream():
+    numpy.random.seed(0)
+    signal = numpy.random.randint(-2 ** 15, 2 ** 15, 5000).astype(numpy.int16)
+
+    mdct_matrix, padding = mdct(signal, 64)
+    chunks = [mdct_matrix[i:i + 10] for i in range(0, len(mdct_matrix), 10)]
+
+    assert numpy.array_equal(numpy.concatenate(list(imdct_stream(iter(chunks), padding))), imdct(mdct_matrix, padding))
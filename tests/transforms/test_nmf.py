@@ -0,0 +1,119 @@
+import numpy
+import pytest
+
+from audionmf.transforms.nmf import NMF, NMFError
+
+
+def random_matrix():
+    numpy.random.seed(0)
+    return numpy.random.rand(40, 30)
+
+
+@pytest.mark.parametrize('update, cost', [
+    ('euclidean', 'euclidean'),
+    ('divergence', 'divergence'),
+    ('hals', 'euclidean'),
+    ('als', 'euclidean')
+])
+def test_nmf_update_reduces_cost(update, cost):
+    V = random_matrix()
+
+    nmf = NMF(V, max_iter=50, rank=10, cost_func=cost, update=update)
+    nmf.initialize(nmf)
+    initial_cost = nmf.eval_cost(nmf)
+
+    W, H = nmf.factorize()
+
+    assert numpy.amin(W) >= 0
+    assert numpy.amin(H) >= 0
+    assert nmf.eval_cost(nmf) < initial_cost
+
+
+def test_nmf_early_stopping():
+    V = random_matrix()
+
+    nmf = NMF(V, max_iter=5000, rank=10, tol=1e-3, check_interval=10)
+    nmf.factorize()
+
+    assert nmf.n_iter < 5000
+    assert nmf.n_iter % 10 == 0
+
+
+def test_nmf_negative_matrix():
+    with pytest.raises(NMFError):
+        NMF(-random_matrix())
+
+
+def test_nmf_update_euclidean_matches_definition():
+    V = random_matrix()
+
+    nmf = NMF(V, rank=10)
+    nmf.initialize(nmf)
+    W = nmf.W.copy()
+    H = nmf.H.copy()
+
+    W = W * (V @ H.T) / (W @ H @ H.T)
+    H = H * (W.T @ V) / (W.T @ W @ H)
+    nmf.update(nmf)
+
+    assert numpy.allclose(nmf.W, W)
+    assert numpy.allclose(nmf.H, H)
+
+
+def test_nmf_float32():
+    V = random_matrix()
+
+    nmf = NMF(V, max_iter=20, rank=10, dtype=numpy.float32)
+    W, H = nmf.factorize()
+
+    assert W.dtype == numpy.float32
+    assert H.dtype == numpy.float32
+
+
+def test_nmf_float32_no_subnormals():
+    # the factors of the empty blocks decay towards zero, but stop short of the slow subnormal numbers
+    V = numpy.kron(numpy.eye(4), numpy.ones((10, 10)))
+
+    nmf = NMF(V, max_iter=500, rank=4, dtype=numpy.float32, seed=0)
+    W, H = nmf.factorize()
+
+    assert numpy.amin(W) >= numpy.finfo(numpy.float32).tiny
+    assert numpy.amin(H) >= numpy.finfo(numpy.float32).tiny
+
+
+def test_nmf_init_nndsvd():
+    V = random_matrix()
+
+    nmf1 = NMF(V, rank=10, initialize='nndsvd')
+    nmf1.initialize(nmf1)
+    nmf2 = NMF(V, rank=10, initialize='nndsvd')
+    nmf2.initialize(nmf2)
+
+    assert numpy.amin(nmf1.W) > 0
+    assert numpy.amin(nmf1.H) > 0
+    assert numpy.array_equal(nmf1.W, nmf2.W)
+    assert numpy.array_equal(nmf1.H, nmf2.H)
+
+
+def test_nmf_warm_start():
+    V = random_matrix()
+    H_init = numpy.random.rand(10, 30)
+
+    nmf = NMF(V, max_iter=0, rank=10, H_init=H_init)
+    W, H = nmf.factorize()
+
+    assert numpy.array_equal(H, H_init)
+    assert H is not H_init
+
+    with pytest.raises(NMFError):
+        NMF(V, rank=5, H_init=H_init)
+
+
+def test_nmf_zero_matrix():
+    # a constant chunk is all zeros once incremented by its minimum
+    nmf = NMF(numpy.zeros((20, 30)), max_iter=20, rank=5)
+    W, H = nmf.factorize()
+
+    assert not numpy.isnan(W).any()
+    assert not numpy.isnan(H).any()
+    assert not numpy.matmul(W, H).any()
@@ -1,6 +1,7 @@
 import numpy
 
-from audionmf.transforms.quantization import scale_val, mu_law_compand, mu_law_expand, UniformQuantizer
+from audionmf.transforms.quantization import scale_val, mu_law_compand, mu_law_expand, UniformQuantizer, \
+    scale_array, mu_law_compand_array, mu_law_expand_array, uniform_quantizer, mu_law_expand_table, phasor_table
 
 
 def test_scale_val_positive():
@@ -59,3 +60,52 @@ def test_unif_quant_matrix():
     mult_matrix = dequantize_vec(quant_matrix)
 
     assert numpy.allclose(matrix, mult_matrix, atol=0.2)
+
+
+def test_array_functions_match_scalar():
+    values = numpy.linspace(-1, 1, 101)
+
+    assert numpy.allclose(scale_array(values, -1, 1, 0, 1), [scale_val(x, -1, 1, 0, 1) for x in values])
+    assert numpy.allclose(mu_law_compand_array(values, 255), [mu_law_compand(x, 255) for x in values])
+    assert numpy.allclose(mu_law_expand_array(values, 255), [mu_law_expand(x, 255) for x in values])
+
+    quantizer = UniformQuantizer(-1, 1, 32)
+    quant_array = quantizer.quantize_array(values)
+
+    assert numpy.array_equal(quant_array, [quantizer.quantize_value(x) for x in values])
+    assert numpy.allclose(quantizer.dequantize_array(quant_array), [quantizer.dequantize_index(x) for x in quant_array])
+
+
+def test_array_functions_out():
+    values = numpy.linspace(0, 1, 11)
+    expected = mu_law_expand_array(mu_law_compand_array(values))
+
+    buffer = values.copy()
+    mu_law_compand_array(buffer, out=buffer)
+    result = mu_law_expand_array(buffer, out=buffer)
+
+    assert result is buffer
+    assert numpy.allclose(buffer, expected)
+    assert numpy.allclose(buffer, values)
+
+    quantizer = UniformQuantizer(0, 1, 32)
+    indices = numpy.empty(values.shape, dtype=numpy.int8)
+    quantizer.quantize_array(values, out=indices)
+
+    assert indices[0] == 0
+    assert indices[-1] == 31
+
+
+def test_dequantization_tables():
+    quantizer = uniform_quantizer(-numpy.pi, numpy.pi, 8)
+    assert quantizer is uniform_quantizer(-numpy.pi, numpy.pi, 8)
+
+    indices = numpy.array([[0, 7, 3], [4, 1, 1]])
+    phases = indices * quantizer.step + quantizer.min_val
+    assert numpy.array_equal(quantizer.dequantize_array(indices), phases)
+    assert numpy.allclose(phasor_table(quantizer)[indices], numpy.exp(1j * phases))
+
+    quantizer = uniform_quantizer(0, 1, 32)
+    expanded = mu_law_expand_table(quantizer, 255)
+    assert numpy.array_equal(expanded[indices], mu_law_expand_array(quantizer.dequantize_array(indices), 255))
+    assert not expanded.flags.writeable
@@ -0,0 +1,36 @@
+import numpy
+import pytest
+
+from audionmf.transforms.huffman import huffman_coder
+from audionmf.transforms.rans import RANSCoder, rans_coder, normalize_frequencies
+
+
+def test_normalize_frequencies():
+    freqs = normalize_frequencies([1000000, 1, 0, 3], 12)
+    assert freqs.sum() == 4096
+    assert freqs[1] == 1 and freqs[2] == 0
+
+
+@pytest.mark.parametrize('method', ['stftp', 'stft32'])
+def test_rans_roundtrip(method):
+    coder = rans_coder(method)
+    freqs = coder.freqs / coder.freqs.sum()
+    matrix = numpy.random.RandomState(0).choice(len(freqs), (100, 577), p=freqs)
+
+    data, rows = coder.encode_int_matrix(matrix)
+    assert numpy.array_equal(coder.decode_int_matrix(data, rows), matrix)
+
+    # fractional bits per symbol make the stream smaller than the Huffman coded one
+    assert len(data) < len(huffman_coder(method).encode_int_array(matrix))
+    assert abs(len(data) - coder.stream_bytes(numpy.bincount(matrix.reshape(-1)))) < 0.01 * len(data)
+
+
+def test_rans_lanes():
+    coder = RANSCoder(freqs=[0, 4000, 96])
+    coder.LANE_SYMBOLS = 7
+    for size in [0, 1, 6, 7, 8, 100]:
+        ary = numpy.random.RandomState(size).choice([1, 2], size)
+        assert numpy.array_equal(coder.decode_int_array(coder.encode_int_array(ary)), ary)
+
+    with pytest.raises(KeyError):
+        coder.encode_int_array([0])
@@ -0,0 +1,28 @@
+import numpy
+import pytest
+
+from audionmf.transforms.stft import stft, stft_frame_count, stft_stream, istft, istft_stream
+
+
+@pytest.mark.parametrize('length', [1152, 5000, 5184])
+def test_stft_stream(length):
+    numpy.random.seed(0)
+    signal = numpy.random.randint(-2 ** 15, 2 ** 15, length).astype(numpy.int16)
+    blocks = numpy.array_split(signal, 3)
+
+    stft_matrix = stft(signal, 44100, 128)
+    chunks = list(stft_stream(iter(blocks), 44100, 128, length, 16))
+
+    assert stft_frame_count(length, 128) == len(stft_matrix)
+    assert all(len(chunk) == 16 for chunk in chunks[:-1])
+    assert numpy.array_equal(numpy.concatenate(chunks), stft_matrix)
+
+
+def test_istft_stream():
+    numpy.random.seed(0)
+    signal = numpy.random.randint(-2 ** 15, 2 ** 15, 5000).astype(numpy.int16)
+
+    stft_matrix = stft(signal, 44100, 128).astype(numpy.complex128)
+    chunks = [stft_matrix[i:i + 16] for i in range(0, len(stft_matrix), 16)]
+
+    assert numpy.array_equal(numpy.concatenate(list(istft_stream(iter(chunks), 128))), istft(stft_matrix, 44100, 128))
@@ -0,0 +1,27 @@
+import numpy
+
+from audionmf.util.file_util import MappedFile
+from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix
+
+
+def test_mapped_file(tmp_path):
+    path = str(tmp_path / 'matrices')
+    matrices = [numpy.arange(12, dtype=numpy.float32).reshape(3, 4), numpy.ones((2, 5), dtype=numpy.float32)]
+    with open(path, 'wb') as fd:
+        fd.write(b'header')
+        for matrix in matrices:
+            serialize_matrix(fd, matrix)
+
+    with MappedFile.open(path) as fd:
+        assert bytes(fd.read(6)) == b'header'
+
+        for matrix in matrices:
+            view = deserialize_matrix(fd)
+            assert numpy.array_equal(view, matrix)
+
+            # the matrix is a read-only view of the mapping, not a copy
+            assert not view.flags.writeable
+            assert not view.flags.owndata
+            del view
+
+        assert len(fd.read()) == 0
@@ -0,0 +1,59 @@
+import io
+import struct
+
+import numpy
+import pytest
+
+from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix, matrix_split, chunk_count, signal_segments, \
+    array_stream_slice
+
+
+@pytest.mark.parametrize('dtype', ['f', 'I', 'd'])
+def test_serialize_matrix(dtype):
+    numpy.random.seed(0)
+    matrix = (numpy.random.rand(7, 5) * 1000).astype(dtype)
+
+    fd = io.BytesIO()
+    serialize_matrix(fd, numpy.asfortranarray(matrix), dtype)
+    data = fd.getvalue()
+
+    assert data == struct.pack('<II', 7, 5) + struct.pack('<' + dtype * matrix.size, *matrix.flat)
+
+    fd.seek(0)
+    assert numpy.array_equal(deserialize_matrix(fd, dtype), matrix)
+
+
+def test_deserialize_matrix_truncated():
+    fd = io.BytesIO()
+    serialize_matrix(fd, numpy.ones((3, 3)))
+
+    with pytest.raises(Exception):
+        deserialize_matrix(io.BytesIO(fd.getvalue()[:-1]))
+
+
+def test_matrix_split():
+    matrix = numpy.arange(20).reshape(10, 2)
+
+    assert [len(chunk) for chunk in matrix_split(matrix, 4)] == [4, 4, 2]
+    assert [len(chunk) for chunk in matrix_split(matrix, 5)] == [5, 5]
+    assert chunk_count(10, 4) == 3 and chunk_count(10, 5) == 2
+
+
+def test_signal_segments():
+    signal = numpy.arange(1, 24)
+    blocks = [signal[:5], signal[5:6], signal[6:]]
+
+    # frames of 4 samples with a hop of 2, after 2 leading zeros
+    segments = list(signal_segments(iter(blocks), 4, 2, 12, 5, 2))
+    extended = numpy.concatenate(([0, 0], signal, [0, 0]))
+
+    assert numpy.array_equal(segments[0], extended[:12])
+    assert numpy.array_equal(segments[1], extended[10:22])
+    assert numpy.array_equal(segments[2], extended[20:26])
+
+
+def test_array_stream_slice():
+    arrays = [numpy.arange(i, i + 5) for i in range(0, 25, 5)]
+
+    assert numpy.array_equal(numpy.concatenate(list(array_stream_slice(iter(arrays), 3, 9))), numpy.arange(3, 12))
+    assert numpy.array_equal(numpy.concatenate(list(array_stream_slice(iter(arrays), 12, 100))), numpy.arange(12, 25))
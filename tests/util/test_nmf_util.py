@@ -0,0 +1,141 @@
+import multiprocessing
+
+import numpy
+from threadpoolctl import threadpool_info
+
+from audionmf.util.nmf_util import nmf_matrices, nmf_matrix_original, adaptive_rank, increment_by_min, WorkerPool
+
+
+def test_nmf_matrices_parallel():
+    numpy.random.seed(0)
+    matrices = [numpy.random.rand(20, 15) - 0.5 for _ in range(4)]
+
+    numpy.random.seed(1)
+    serial = list(nmf_matrices([matrices], 20, 5))
+
+    numpy.random.seed(1)
+    parallel = list(nmf_matrices([matrices], 20, 5, jobs=2))
+
+    assert len(serial) == len(parallel) == len(matrices)
+    for (W1, H1, min1, _), (W2, H2, min2, _) in zip(serial, parallel):
+        assert numpy.array_equal(W1, W2)
+        assert numpy.array_equal(H1, H2)
+        assert min1 == min2
+
+
+def test_nmf_matrices_warm_start():
+    numpy.random.seed(0)
+    matrix_lists = [[numpy.random.rand(20, 15) for _ in range(3)] for _ in range(2)]
+
+    numpy.random.seed(1)
+    serial = list(nmf_matrices(matrix_lists, 20, 5, warm_start=True))
+
+    numpy.random.seed(1)
+    parallel = list(nmf_matrices(matrix_lists, 20, 5, warm_start=True, jobs=2))
+
+    assert len(serial) == len(parallel) == 6
+    for (W1, H1, min1, _), (W2, H2, min2, _) in zip(serial, parallel):
+        assert numpy.array_equal(W1, W2)
+        assert numpy.array_equal(H1, H2)
+
+
+def test_nmf_matrices_warm_start_lazy():
+    numpy.random.seed(0)
+    matrices = [numpy.random.rand(20, 15) for _ in range(10)]
+    taken = list()
+
+    def matrix_stream():
+        for matrix in matrices:
+            taken.append(matrix)
+            yield matrix
+
+    # only a few matrices per worker are taken ahead of the results, even when warm starting in parallel
+    results = nmf_matrices([matrix_stream()], 20, 5, warm_start=True, jobs=2)
+    next(results)
+    assert len(taken) <= 5
+    assert len(list(results)) == 9
+
+
+def test_nmf_matrices_rank():
+    numpy.random.seed(0)
+    matrices = [numpy.random.rand(20, 15) for _ in range(3)]
+
+    # the rank of every matrix can be picked by a function, warm starting only from the same rank
+    for warm_start in [False, True]:
+        ranks = iter([2, 4, 4])
+        results = list(nmf_matrices([matrices], 5, lambda matrix: next(ranks), warm_start=warm_start))
+        assert [H.shape[0] for _, H, _, _ in results] == [2, 4, 4]
+
+
+def test_adaptive_rank():
+    numpy.random.seed(0)
+    low_rank = numpy.random.rand(40, 3) @ numpy.random.rand(3, 30)
+    noise = numpy.random.rand(40, 30)
+    silence = numpy.ones((40, 30))
+
+    def rank(matrix, max_rank, rank_tol):
+        return adaptive_rank(matrix, increment_by_min(matrix)[0], max_rank, rank_tol)
+
+    assert rank(silence, 20, 0.01) == 1
+    # incrementing the matrix to make it positive may add a rank
+    assert rank(low_rank, 20, 1e-6) <= 4
+    assert rank(noise, 20, 0.01) == 20
+    assert rank(noise, 20, 0.5) < 20
+
+    # the chosen rank is the one the matrices are factorized with
+    results = list(nmf_matrices([[silence, noise]], 5, 20, rank_tol=0.01))
+    assert [H.shape[0] for _, H, _, _ in results] == [1, 20]
+    assert [info['rank'] for _, _, _, info in results] == [1, 20]
+
+
+def test_nmf_matrices_silence():
+    numpy.random.seed(0)
+    matrices = [numpy.full((20, 15), 3.0), numpy.random.rand(20, 15), 3 + 0.01 * numpy.random.rand(20, 15)]
+
+    # matrices close to a constant skip NMF and are stored as the constant
+    results = list(nmf_matrices([matrices], 20, 5, silence=0.1))
+    assert [info['rank'] for _, _, _, info in results] == [0, 5, 0]
+    assert [info['iterations'] for _, _, _, info in results] == [0, 20, 0]
+
+    W, H, min_val, _ = results[2]
+    assert W.shape == (20, 0) and H.shape == (0, 15)
+    assert numpy.allclose(nmf_matrix_original(W, H, min_val), matrices[2], atol=0.01)
+
+
+def test_nmf_matrices_blas_threads():
+    numpy.random.seed(0)
+    matrices = [numpy.random.rand(20, 15) for _ in range(3)]
+    threads = [pool['num_threads'] for pool in threadpool_info()]
+
+    numpy.random.seed(1)
+    default = list(nmf_matrices([matrices], 20, 5, dtype='float32'))
+
+    for jobs in [1, 2]:
+        numpy.random.seed(1)
+        limited = list(nmf_matrices([matrices], 20, 5, jobs=jobs, dtype='float32', blas_threads=1))
+        for (W1, H1, _, _), (W2, H2, _, _) in zip(default, limited):
+            assert W2.dtype == numpy.float32
+            assert numpy.allclose(W1, W2) and numpy.allclose(H1, H2)
+
+    # the limit only lasts while the results are computed
+    assert [pool['num_threads'] for pool in threadpool_info()] == threads
+
+
+def test_worker_pool_memory():
+    numpy.random.seed(0)
+    matrices = [numpy.random.rand(20, 15) for _ in range(6)]
+
+    # a budget of two matrices at a time, shared by both calls
+    with WorkerPool(2, memory=2 * matrices[0].nbytes) as pool:
+        first = pool.map(numpy.sum, matrices)
+        second = pool.map(numpy.sum, matrices[::-1])
+        assert list(zip(first, second)) == [(a.sum(), b.sum()) for a, b in zip(matrices, matrices[::-1])]
+        assert pool.in_flight == 0
+
+
+def test_worker_pool_started():
+    # all the workers are started before any thread uses the pool
+    children = len(multiprocessing.active_children())
+    with WorkerPool(2) as pool:
+        assert len(multiprocessing.active_children()) == children + 2
+        assert list(pool.map(numpy.sum, [numpy.ones(3)] * 4)) == [3] * 4
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+from audionmf.util.registry_util import LazyRegistry
+
+
+def test_lazy_registry():
+    registry = LazyRegistry({'ordered': 'collections:OrderedDict', 'missing': 'audionmf.missing:Missing'})
+    assert sorted(registry) == ['missing', 'ordered']
+    assert 'ordered' in registry and 'other' not in registry
+
+    from collections import OrderedDict
+    assert registry['ordered'] is OrderedDict
+
+
+def test_cli_imports_no_codec():
+    # the CLI only imports the codecs (and SciPy) once they're used
+    code = 'import sys, audionmf.cli; print(any(name.startswith(("scipy", "audionmf.nmfcompression.nmfcompressor")) ' \
+           'for name in sys.modules))'
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+    assert subprocess.check_output([sys.executable, '-c', code], cwd=root).decode().strip() == 'False'
@@ -0,0 +1,68 @@
+import io
+import time
+
+import numpy
+
+from audionmf.audio.audio_data import AudioData
+from audionmf.util.stats_util import Stats, NO_STATS
+
+
+def test_stats_stages():
+    stats = Stats()
+    with stats.stage('a'):
+        pass
+    assert list(stats.timed('b', range(3))) == [0, 1, 2]
+    stats.add_time('a', 1)
+
+    assert set(stats.stages) == {'a', 'b'}
+    assert stats.stages['a'] >= 1
+
+    # a stage doesn't include the stages nested in it
+    with stats.stage('c'):
+        assert list(stats.timed('d', (time.sleep(0.1) for _ in range(2)))) == [None, None]
+    assert stats.stages['d'] >= 0.2
+    assert stats.stages['c'] < 0.1
+
+    # disabled stats pass everything through
+    with NO_STATS.stage('a'):
+        pass
+    items = iter(range(3))
+    assert NO_STATS.timed('b', items) is items
+
+
+def test_stats_compress():
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 8000
+    audio.allocate(5000, 2)
+    audio.samples[:] = numpy.random.randint(1, 1000, (5000, 2))
+
+    chunks = list()
+    stats = Stats(chunks.append)
+    f = io.BytesIO()
+    audio.write_compressed_file(f, 'anmfs', stats=stats)
+
+    summary = stats.as_dict()
+    assert chunks == summary['chunks']
+    assert [chunk['channels'] for chunk in chunks] == [[0], [1]]
+    assert sum(chunk['frames'] for chunk in chunks) == 2 * 10
+    assert 0 < summary['bytes'] < len(f.getvalue())
+    assert all(0 < chunk['nmf_iterations'] <= 1000 and chunk['nmf_cost'] is not None for chunk in chunks)
+    assert {'stft', 'nmf', 'quantization', 'companding', 'huffman', 'write'} <= set(summary['stages'])
+
+
+def test_stats_compress_jobs():
+    numpy.random.seed(0)
+    audio = AudioData()
+    audio.sample_rate = 8000
+    audio.allocate(20000, 2)
+    audio.samples[:] = numpy.random.randint(1, 1000, (20000, 2))
+
+    stats = Stats()
+    start = time.perf_counter()
+    audio.write_compressed_file(io.BytesIO(), 'anmfm', jobs=2, stats=stats)
+    seconds = time.perf_counter() - start
+
+    # the stages are wall time, even with the chunks factorized in parallel
+    assert 'nmf' in stats.stages
+    assert sum(stats.stages.values()) <= seconds
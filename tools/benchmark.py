@@ -0,0 +1,281 @@
+""" Benchmarks of the transforms, NMF, Huffman and rANS coding, matrix serialization and the whole codecs.
+
+Every benchmark runs for all the combinations of its parameters on synthetic signals and matrices, the results
+are printed and can be saved as JSON, then compared against an earlier run to catch regressions:
+
+    python tools/benchmark.py --output before.json
+    python tools/benchmark.py --compare before.json
+
+The package has to be importable, e.g. installed with pip install -e .
+"""
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import click
+import numpy
+import scipy
+
+from audionmf.audio.audio_data import AudioData, compression_schemes
+from audionmf.transforms.huffman import HuffmanCoder, frequencies
+from audionmf.transforms.mdct import mdct, imdct
+from audionmf.transforms.nmf import NMF
+from audionmf.transforms.rans import rans_coder
+from audionmf.util.matrix_util import serialize_matrix, deserialize_matrix
+
+SAMPLE_RATE = 44100
+
+# list of (function, parameters), see benchmark
+benchmarks = list()
+
+
+def benchmark(**params):
+    """ Registers a benchmark for every combination of the parameters (lists of values).
+
+    The function does the setup and returns the function to be timed, so the setup isn't measured.
+    """
+
+    def register(func):
+        benchmarks.append((func, params))
+        return func
+
+    return register
+
+
+def synthetic_signal(seconds, channels=1):
+    """ A few harmonic tones with a slow envelope and some noise, as 16-bit samples. """
+    random = numpy.random.RandomState(0)
+    t = numpy.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = numpy.zeros((len(t), channels))
+    for channel in range(channels):
+        for f in random.uniform(100, 2000, 5):
+            signal[:, channel] += numpy.sin(2 * numpy.pi * f * t) * (1 + numpy.sin(2 * numpy.pi * 0.5 * t)) / 2
+        signal[:, channel] += random.normal(0, 0.05, len(t))
+    samples = (signal / numpy.abs(signal).max() * 2 ** 14).astype(numpy.int16)
+    samples[samples == 0] = 1
+    return samples
+
+
+def synthetic_audio(seconds, channels=2):
+    audio = AudioData()
+    audio.sample_rate = SAMPLE_RATE
+    samples = synthetic_signal(seconds, channels)
+    audio.allocate(*samples.shape)
+    audio.samples[:] = samples
+    return audio
+
+
+def huffman_symbols(method, count):
+    """ Symbols drawn with the frequencies of the Huffman table. """
+    symbols, counts = zip(*frequencies[method].items())
+    random = numpy.random.RandomState(0)
+    return random.choice(symbols, count, p=numpy.array(counts) / sum(counts)).reshape(-1, 100)
+
+
+def codec(scheme, chunk_size, max_iter):
+    """ A compressor with a fixed amount of iterations and the given chunk size (columns of the matrix for RAW). """
+    compressor = compression_schemes[scheme]()
+    compressor.NMF_MAX_ITER = max_iter
+    compressor.NMF_TOL = 0
+    if scheme == 'anmfr':
+        compressor.CHUNK_SHAPE = (compressor.CHUNK_SHAPE[0], chunk_size)
+    else:
+        compressor.NMF_CHUNK_SIZE = chunk_size
+    return compressor
+
+
+@benchmark(seconds=[1, 10, 60])
+def mdct_forward(seconds):
+    signal = synthetic_signal(seconds)[:, 0]
+    return lambda: mdct(signal, 576)
+
+
+@benchmark(seconds=[1, 10, 60])
+def mdct_inverse(seconds):
+    matrix, padding = mdct(synthetic_signal(seconds)[:, 0], 576)
+    return lambda: imdct(matrix, padding)
+
+
+@benchmark(update=sorted(NMF.update_func), rank=[10, 40, 80], rows=[100, 250, 500], dtype=['float64', 'float32'])
+def nmf_factorize(update, rank, rows, dtype):
+    V = numpy.abs(numpy.random.RandomState(0).normal(size=(rows, 577)))
+    return lambda: NMF(V, max_iter=50, rank=rank, update=update, dtype=dtype, seed=0).factorize()
+
+
+@benchmark(method=['stftp', 'stft32'], symbols=[10 ** 4, 10 ** 5, 10 ** 6])
+def huffman_encode(method, symbols):
+    coder = HuffmanCoder(method)
+    matrix = huffman_symbols(method, symbols)
+    return lambda: coder.encode_int_matrix(matrix)
+
+
+@benchmark(method=['stftp', 'stft32'], symbols=[10 ** 4, 10 ** 5, 10 ** 6])
+def huffman_decode(method, symbols):
+    coder = HuffmanCoder(method)
+    data, rows = coder.encode_int_matrix(huffman_symbols(method, symbols))
+    return lambda: coder.decode_int_matrix(data, rows)
+
+
+@benchmark(method=['stftp', 'stft32'], symbols=[10 ** 4, 10 ** 5, 10 ** 6])
+def rans_encode(method, symbols):
+    coder = rans_coder(method)
+    matrix = huffman_symbols(method, symbols)
+    return lambda: coder.encode_int_matrix(matrix)
+
+
+@benchmark(method=['stftp', 'stft32'], symbols=[10 ** 4, 10 ** 5, 10 ** 6])
+def rans_decode(method, symbols):
+    coder = rans_coder(method)
+    data, rows = coder.encode_int_matrix(huffman_symbols(method, symbols))
+    return lambda: coder.decode_int_matrix(data, rows)
+
+
+@benchmark(rows=[100, 1000, 10000])
+def matrix_serialize(rows):
+    matrix = numpy.random.RandomState(0).rand(rows, 577)
+    return lambda: serialize_matrix(io.BytesIO(), matrix)
+
+
+@benchmark(rows=[100, 1000, 10000])
+def matrix_deserialize(rows):
+    f = io.BytesIO()
+    serialize_matrix(f, numpy.random.RandomState(0).rand(rows, 577))
+
+    def run():
+        f.seek(0)
+        deserialize_matrix(f)
+
+    return run
+
+
+@benchmark(scheme=['anmfs', 'anmfm', 'anmfr'], seconds=[1, 5, 15], chunk_size=[100, 250, 500])
+def compress(scheme, seconds, chunk_size):
+    compressor = codec(scheme, chunk_size, 50)
+    audio = synthetic_audio(seconds)
+
+    def run():
+        numpy.random.seed(0)
+        compressor.compress(audio, io.BytesIO())
+
+    return run
+
+
+@benchmark(scheme=['anmfs', 'anmfm', 'anmfr'], seconds=[1, 5, 15], chunk_size=[100, 250, 500])
+def decompress(scheme, seconds, chunk_size):
+    compressor = codec(scheme, chunk_size, 50)
+    f = io.BytesIO()
+    numpy.random.seed(0)
+    compressor.compress(synthetic_audio(seconds), f)
+
+    def run():
+        f.seek(0)
+        compressor.decompress(f, AudioData())
+
+    return run
+
+
+def measure(func, min_time, min_repeat, max_repeat):
+    """ Runs the function until it ran at least min_repeat times and for min_time seconds, returns the timings. """
+    times = list()
+    total = 0
+    while len(times) < max_repeat and (len(times) < min_repeat or total < min_time):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        total += times[-1]
+    return times
+
+
+def machine_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def result_key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+@click.command()
+@click.option('-k', '--filter', 'name_filter', default='', help='Only run benchmarks with this in their name.')
+@click.option('--quick', is_flag=True, help='Only run the smallest value of every parameter.')
+@click.option('--min-time', type=float, default=0.5, show_default=True,
+              help='Minimum time spent on every benchmark in seconds.')
+@click.option('--min-repeat', type=int, default=3, show_default=True)
+@click.option('--max-repeat', type=int, default=100, show_default=True)
+@click.option('-o', '--output', type=click.File('w'), help='Save the results as JSON.')
+@click.option('--compare', type=click.File('r'), help='Compare against results saved earlier.')
+@click.option('--threshold', type=float, default=1.2, show_default=True,
+              help='Slowdown ratio (of the median times) reported as a regression.')
+def main(name_filter, quick, min_time, min_repeat, max_repeat, output, compare, threshold):
+    """ Runs the benchmarks, exits with 1 if any of them is slower than in the compared results. """
+    baseline = dict()
+    if compare:
+        baseline = {result_key(result): result for result in json.load(compare)['results']}
+
+    results = list()
+    regressions = 0
+
+    for func, params in benchmarks:
+        if name_filter not in func.__name__:
+            continue
+
+        names = sorted(params)
+        values = [params[name][:1] if quick else params[name] for name in names]
+        for combination in itertools.product(*values):
+            args = dict(zip(names, combination))
+
+            # silence the progress messages the codecs print to stderr, and any output on stdout
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                times = measure(func(**args), min_time, min_repeat, max_repeat)
+
+            result = {
+                'name': func.__name__,
+                'params': args,
+                'repeat': len(times),
+                'min': min(times),
+                'median': float(numpy.median(times)),
+                'mean': float(numpy.mean(times)),
+                'stddev': float(numpy.std(times))
+            }
+            results.append(result)
+
+            line = '{:<20} {:<50} {:>10.3f} ms'.format(result['name'], ' '.join(
+                '{}={}'.format(name, value) for name, value in args.items()), result['median'] * 1000)
+            previous = baseline.get(result_key(result))
+            if previous:
+                ratio = result['median'] / previous['median']
+                line += ' {:>6.2f}x'.format(ratio)
+                if ratio > threshold:
+                    line += ' REGRESSION'
+                    regressions += 1
+            print(line)
+
+    if output:
+        json.dump({'machine': machine_info(), 'results': results}, output, indent=2)
+
+    if regressions:
+        print('{} benchmark(s) slower than {}x the compared results.'.format(regressions, threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()